@@ -0,0 +1,786 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Headless Batch Mode)
+# ======================================================
+
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import hashlib
+import math
+import sqlite3
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from interactive_recreation import (
+    DEFAULT_PROMPT,
+    RecreationError,
+    recreate_image,
+    recreate_image_async,
+    request_key,
+)
+from file_uploads import DEFAULT_INDEX_PATH, ReferenceUploader
+from gemini_async import LIMITER_POLL_INTERVAL, AsyncGeminiClient
+from gemini_client import (
+    DEFAULT_BASE_URL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_MODEL,
+    DEFAULT_READ_TIMEOUT,
+    GeminiClient,
+)
+from gemini_response import image_output_path
+from image_discovery import PathFilter, discover_images, find_image, probe_image, with_image_extension
+from image_preprocess import (
+    DEFAULT_MAX_EDGE,
+    DEFAULT_QUALITY,
+    PIL_AVAILABLE,
+    PreprocessOptions,
+    Preprocessor,
+)
+from image_transcode import DEFAULT_QUALITY as DEFAULT_OUTPUT_QUALITY, TranscodeOptions, Transcoder
+from job_journal import JOURNAL_NAME, JobJournal
+from near_duplicates import (
+    DEDUPE_AVAILABLE,
+    DEFAULT_ALGORITHM,
+    DEFAULT_INDEX_PATH as DEFAULT_DEDUPE_INDEX,
+    DEFAULT_MAX_DISTANCE,
+    HASH_ALGORITHMS,
+    NearDuplicateIndex,
+)
+from memory_budget import DEFAULT_BUDGET_BYTES, MemoryBudget
+from rate_limiter import DEFAULT_RPM, AdaptiveLimiter
+from reference_memo import DEFAULT_MEMO_BYTES, ReferenceMemo
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, ResultCache, context_key
+from stage_metrics import DEFAULT_JSONL_PATH, MetricsRecorder, StageTimer
+
+DEFAULT_CONCURRENCY = 4
+
+class BatchJob:
+    """A single recreation job: one input, its references, a prompt and an output path.
+
+    ``shared_input`` marks jobs whose input is sent with many prompts, so it
+    is encoded once through the reference memo instead of once per job.
+    """
+
+    def __init__(self, input_path, ref_paths, prompt, output_path, shared_input=False):
+        self.input_path = input_path
+        self.ref_paths = list(ref_paths)
+        self.prompt = prompt
+        self.output_path = output_path
+        self.shared_input = shared_input
+
+        # Filled in once the job has run
+        self.ok = False
+        self.error = None
+        self.elapsed = 0.0
+        self.cached = False
+        self.outputs = []  # Every image saved for this job; the first is output_path, possibly with another extension
+        self.skipped = False  # Not run because the journal already has its outcome
+        self.duplicate_of = None  # Input whose result was reused for this near-duplicate
+        self.distance = 0
+        self.attempts = 0
+        self.original_bytes = 0
+        self.upload_bytes = 0
+        self.stages = {}  # stage -> [seconds, bytes]
+
+def _split_refs(value):
+    """Normalizes a manifest 'refs' field (list or ';'-separated string) to a list of paths."""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value if v]
+    return [v.strip() for v in str(value).split(';') if v.strip()]
+
+def _default_output(input_path, ref_paths, prompt, output_dir):
+    """Builds a deterministic output name, so re-running the same job writes the same file.
+
+    The suffix hashes the input and reference paths and the prompt in place
+    of the interactive tool's timestamp. The ``.jpg`` extension is changed
+    when the result is saved in another format.
+    """
+    digest = hashlib.sha256()
+    for part in [input_path] + list(ref_paths):
+        digest.update(os.path.abspath(part).encode("utf-8") + b"\0")
+    digest.update(prompt.encode("utf-8"))
+    input_name = Path(input_path).stem
+    target_dir = output_dir or os.path.dirname(input_path)
+    return os.path.join(target_dir, f"{input_name}_recreated_{digest.hexdigest()[:10]}.jpg")
+
+def _resolve(path, base_dir):
+    """Resolves manifest paths relative to the manifest's directory."""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(base_dir, path)
+
+def load_jobs(source, prompt=DEFAULT_PROMPT, ref_paths=(), output_dir=None, recursive=False,
+              path_filter=None, on_skip=None):
+    """Builds the job list from a directory of images or a CSV/JSONL manifest.
+
+    Manifest rows provide ``input`` and optionally ``refs``, ``prompt`` and
+    ``output``; missing fields fall back to the command-line defaults.
+    Directories are scanned with discover_images(), optionally recursively
+    and through a PathFilter; files that are not usable images go to
+    ``on_skip(path, reason)`` instead of becoming jobs.
+    """
+    if os.path.isdir(source):
+        return [BatchJob(image.path, ref_paths, prompt, _default_output(image.path, ref_paths, prompt, output_dir))
+                for image in discover_images([source], recursive, path_filter, on_skip)]
+
+    ext = os.path.splitext(source)[1].lower()
+    if ext == '.csv':
+        with open(source, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(source, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError(f"Unsupported batch source: {source} (expected a directory, .csv or .jsonl)")
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    for line_no, row in enumerate(rows, 1):
+        input_path = _resolve((row.get('input') or '').strip(), base_dir)
+        if not input_path:
+            raise ValueError(f"{source}: row {line_no} has no 'input' field")
+        refs = [_resolve(r, base_dir) for r in _split_refs(row.get('refs'))] or list(ref_paths)
+        output = _resolve((row.get('output') or '').strip(), base_dir)
+        job_prompt = (row.get('prompt') or '').strip() or prompt
+        jobs.append(BatchJob(
+            input_path,
+            refs,
+            job_prompt,
+            output or _default_output(input_path, refs, job_prompt, output_dir),
+        ))
+    return jobs
+
+def _check_inputs(job):
+    """Rejects missing, empty, truncated and non-image inputs before anything is sent."""
+    for path in [job.input_path] + job.ref_paths:
+        if not os.path.isfile(path):
+            raise RecreationError(f"The image file {path} does not exist!")
+        _, problem = probe_image(path)
+        if problem is not None:
+            raise RecreationError(f"{path} is not a usable image: {problem}")
+
+def _journal_key(key, transcoder=None):
+    """Journal key of a job: its request key plus the output conversion, which the result cache ignores."""
+    return key if transcoder is None else f"{key}:{transcoder.options.signature()}"
+
+def _journal_skip(journal, job, key, max_attempts):
+    """Returns True if the journal says the job need not run, else marks it as started."""
+    row = journal.lookup(job.output_path)
+    if row is not None and row["inputs_hash"] == key:
+        if journal.is_done(job.output_path, key):
+            job.ok = job.skipped = True
+            job.cached = bool(row["cached"])
+            job.outputs = _saved_images(find_image(job.output_path) or job.output_path)
+            return True
+        if row["status"] == "failed" and max_attempts and row["attempts"] >= max_attempts:
+            job.skipped = True
+            job.attempts = row["attempts"]
+            job.error = f"Gave up after {row['attempts']} attempt(s): {row['error']}"
+            return True
+    job.attempts = journal.start(job.output_path, job.input_path, key)
+    return False
+
+def _finish_job(job, timer, start, recorder, journal):
+    """Records a job's wall time and stage timings and exports its outcome."""
+    job.elapsed = time.monotonic() - start
+    job.stages = timer.stages
+    if journal is not None and job.attempts and not job.skipped:
+        journal.finish(job.output_path, job.ok, job.error, job.elapsed, job.cached)
+    if recorder is not None:
+        output = job.outputs[0] if job.outputs else job.output_path
+        recorder.record(timer, ok=job.ok, output=output, elapsed=round(job.elapsed, 6),
+                        cached=job.cached, error=job.error)
+    return job
+
+def _dedupe_group(dedupe, client, job, preprocessor=None):
+    """Near-duplicate index group of a job: everything the request sends besides the input."""
+    extra = dedupe.algorithm + (preprocessor.options.signature() if preprocessor else "") + client.request_signature
+    return context_key(client.model_url, job.prompt, job.ref_paths, extra)
+
+def _claim_duplicate(dedupe, client, job, preprocessor=None):
+    """Returns (match, ticket) from the near-duplicate index, or (None, None) if the input cannot be hashed."""
+    phash = dedupe.hash_file(job.input_path)
+    if phash is None:
+        return None, None
+    return dedupe.claim(_dedupe_group(dedupe, client, job, preprocessor), phash)
+
+def _saved_images(first_path):
+    """The images of an earlier result: first_path and its _2, _3... companions, whatever their format."""
+    paths = [first_path]
+    while True:
+        path = find_image(image_output_path(first_path, len(paths)))
+        if path is None:
+            return paths
+        paths.append(path)
+
+def _use_duplicate(dedupe, job, match, transcoder=None):
+    """Fills a job in from the result of an earlier near-duplicate input, including any further images."""
+    job.outputs = []
+    for source in _saved_images(match.output_path):
+        target = with_image_extension(image_output_path(job.output_path, len(job.outputs)),
+                                      os.path.splitext(source)[1])
+        dedupe.reuse(match._replace(output_path=source), target)
+        job.outputs.append(target)
+    if transcoder is not None:
+        job.outputs = transcoder.convert(job.outputs)
+    job.ok = job.cached = True
+    job.duplicate_of = match.input_path
+    job.distance = match.distance
+
+def _run_job(client, job, cache=None, preprocessor=None, ref_memo=None, ref_uploader=None,
+             recorder=None, journal=None, max_attempts=0, dedupe=None, transcoder=None):
+    """Runs one job, recording success, error, wall time and stage timings on the job itself.
+
+    With a JobJournal, jobs that already finished with the same inputs are
+    skipped, as are jobs that failed ``max_attempts`` times (0 = no limit).
+    With a NearDuplicateIndex, an input close enough to one recreated
+    earlier with the same prompt and references reuses that result. With a
+    Transcoder, results are converted to its format.
+    """
+    start = time.monotonic()
+    timer = StageTimer(job.input_path)
+    key = None
+    ticket = None
+    try:
+        _check_inputs(job)
+        if journal is not None:
+            with timer.stage("cache"):
+                key = request_key(client, job.prompt, job.input_path, job.ref_paths, preprocessor)
+            if _journal_skip(journal, job, _journal_key(key, transcoder), max_attempts):
+                return job
+        out_dir = os.path.dirname(job.output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if dedupe is not None:
+            with timer.stage("dedupe"):
+                match, ticket = _claim_duplicate(dedupe, client, job, preprocessor)
+                if match is not None:
+                    _use_duplicate(dedupe, job, match, transcoder)
+        if not job.ok:
+            result = recreate_image(client, job.input_path, job.ref_paths, job.prompt, job.output_path,
+                                    log=lambda message: None, cache=cache, preprocessor=preprocessor,
+                                    ref_memo=ref_memo, ref_uploader=ref_uploader, timer=timer, key=key,
+                                    shared_input=job.shared_input, transcoder=transcoder)
+            job.ok = True
+            job.cached = result["cached"]
+            job.outputs = result["outputs"]
+            job.original_bytes = result["original_bytes"]
+            job.upload_bytes = result["upload_bytes"]
+            if ticket is not None:
+                dedupe.complete(ticket, job.input_path, job.outputs[0])
+                ticket = None
+    except RecreationError as e:
+        job.error = str(e)
+    except Exception as e:  # Never let one job take down the whole batch
+        job.error = f"{type(e).__name__}: {e}"
+    finally:
+        if ticket is not None:
+            dedupe.release(ticket)
+    return _finish_job(job, timer, start, recorder, journal)
+
+async def _claim_duplicate_async(dedupe, client, job):
+    """_claim_duplicate() that waits for near-duplicates in progress without holding a thread."""
+    phash = await asyncio.to_thread(dedupe.hash_file, job.input_path)
+    if phash is None:
+        return None, None
+    group = await asyncio.to_thread(_dedupe_group, dedupe, client, job)
+    while True:
+        match, ticket, pending = dedupe.try_claim(group, phash)
+        if pending is None:
+            return match, ticket
+        while not pending.is_set():
+            await asyncio.sleep(LIMITER_POLL_INTERVAL)
+
+async def _run_job_async(client, job, cache=None, ref_memo=None, recorder=None, journal=None, max_attempts=0,
+                         dedupe=None, transcoder=None):
+    """_run_job() for an AsyncGeminiClient; blocking bookkeeping runs in worker threads."""
+    start = time.monotonic()
+    timer = StageTimer(job.input_path)
+    key = None
+    ticket = None
+    try:
+        await asyncio.to_thread(_check_inputs, job)
+        if journal is not None:
+            t0 = time.perf_counter()
+            key = await asyncio.to_thread(request_key, client, job.prompt, job.input_path, job.ref_paths)
+            timer.add("cache", time.perf_counter() - t0)
+            if await asyncio.to_thread(_journal_skip, journal, job, _journal_key(key, transcoder), max_attempts):
+                return job
+        out_dir = os.path.dirname(job.output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if dedupe is not None:
+            t0 = time.perf_counter()
+            match, ticket = await _claim_duplicate_async(dedupe, client, job)
+            if match is not None:
+                await asyncio.to_thread(_use_duplicate, dedupe, job, match, transcoder)
+            timer.add("dedupe", time.perf_counter() - t0)
+        if not job.ok:
+            result = await recreate_image_async(client, job.input_path, job.ref_paths, job.prompt,
+                                                job.output_path, log=lambda message: None, cache=cache,
+                                                ref_memo=ref_memo, timer=timer, key=key, transcoder=transcoder)
+            job.ok = True
+            job.cached = result["cached"]
+            job.outputs = result["outputs"]
+            job.original_bytes = result["original_bytes"]
+            job.upload_bytes = result["upload_bytes"]
+            if ticket is not None:
+                await asyncio.to_thread(dedupe.complete, ticket, job.input_path, job.outputs[0])
+                ticket = None
+    except RecreationError as e:
+        job.error = str(e)
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+    finally:
+        if ticket is not None:
+            dedupe.release(ticket)
+    return await asyncio.to_thread(_finish_job, job, timer, start, recorder, journal)
+
+def _report(job, count, total, limiter=None, preprocessor=None):
+    """Prints the progress line of a finished job."""
+    prefix = f"[{count}/{total}]"
+    if limiter is not None:
+        m = limiter.metrics()
+        prefix += f" [limit {m['limit']:.1f}, queued {m['queue_depth']}]"
+    if job.skipped and job.ok:
+        print(f"⏭️ {prefix} {job.input_path} -> {job.outputs[0]} (already done)")
+    elif job.skipped:
+        print(f"⏭️ {prefix} {job.input_path}: {job.error}")
+    elif job.ok:
+        target = job.outputs[0]
+        if len(job.outputs) > 1:
+            target += f" (+{len(job.outputs) - 1} more)"
+        if job.duplicate_of:
+            print(f"🔗 {prefix} {job.input_path} -> {target} "
+                  f"(near-duplicate of {job.duplicate_of}, distance {job.distance})")
+        elif job.cached:
+            print(f"♻️ {prefix} {job.input_path} -> {target} (cached)")
+        else:
+            saved = job.original_bytes - job.upload_bytes
+            note = f", {saved / 1024:.0f} KB saved" if preprocessor is not None else ""
+            print(f"✅ {prefix} {job.input_path} -> {target} ({job.elapsed:.2f}s{note})")
+    else:
+        print(f"❌ {prefix} {job.input_path}: {job.error}")
+
+def run_batch(jobs, client, concurrency=DEFAULT_CONCURRENCY, cache=None, preprocessor=None,
+              ref_memo=None, ref_uploader=None, recorder=None, journal=None, max_attempts=0, dedupe=None,
+              transcoder=None):
+    """Runs jobs through a bounded thread pool sharing one client and returns them in completion order.
+
+    With a MetricsRecorder, every finished job's stage timings are exported.
+    With a JobJournal, every job's outcome is journaled and completed jobs
+    from an earlier run are skipped.
+    """
+    done = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(_run_job, client, job, cache, preprocessor, ref_memo, ref_uploader, recorder,
+                               journal, max_attempts, dedupe, transcoder)
+                   for job in jobs]
+        for future in as_completed(futures):
+            job = future.result()
+            done.append(job)
+            _report(job, len(done), len(jobs), client.limiter, preprocessor)
+    return done
+
+async def run_batch_async(jobs, client, concurrency=DEFAULT_CONCURRENCY, cache=None, ref_memo=None,
+                          recorder=None, journal=None, max_attempts=0, dedupe=None, transcoder=None):
+    """run_batch() on one event loop with an AsyncGeminiClient instead of a thread per call.
+
+    At most ``concurrency`` jobs are active at once; a few hundred is fine
+    since a waiting job costs a coroutine, not a thread.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(job):
+        async with slots:
+            return await _run_job_async(client, job, cache, ref_memo, recorder, journal, max_attempts, dedupe,
+                                        transcoder)
+
+    done = []
+    for finished in asyncio.as_completed([run(job) for job in jobs]):
+        job = await finished
+        done.append(job)
+        _report(job, len(done), len(jobs), client.limiter)
+    return done
+
+class Pipeline:
+    """The client, limiter, caches, pre-processor and metrics shared by every job of a headless run."""
+
+    def __init__(self, client, cache=None, preprocessor=None, ref_memo=None, ref_uploader=None, recorder=None,
+                 dedupe=None, transcoder=None):
+        self.client = client
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.ref_memo = ref_memo
+        self.ref_uploader = ref_uploader
+        self.recorder = recorder
+        self.dedupe = dedupe
+        self.transcoder = transcoder
+
+    @property
+    def limiter(self):
+        return self.client.limiter
+
+    @property
+    def budget(self):
+        return self.client.budget
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds a pipeline from add_pipeline_arguments() options; raises ValueError if it cannot be set up."""
+        if args.output_format != "auto" and not PIL_AVAILABLE:
+            raise ValueError("--output-format needs Pillow: pip install Pillow")
+        cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_size_mb * 1048576)
+        # Always created: even unlimited, it measures the peak memory of every stage
+        budget = MemoryBudget(max(0, args.memory_budget_mb) * 1048576)
+        preprocessor = None
+        if args.preprocess:
+            if not PIL_AVAILABLE:
+                raise ValueError("--preprocess needs Pillow: pip install Pillow")
+            max_bytes = args.max_upload_kb * 1024 if args.max_upload_kb else None
+            options = PreprocessOptions(args.max_edge, max_bytes, args.upload_format, args.quality)
+            preprocessor = Preprocessor(options, args.preprocess_workers, budget)
+
+        if args.dedupe and not DEDUPE_AVAILABLE:
+            if preprocessor is not None:
+                preprocessor.close()
+            raise ValueError("--dedupe needs NumPy and Pillow: pip install numpy Pillow")
+
+        recorder = None
+        if args.metrics_jsonl or args.metrics_textfile:
+            try:
+                recorder = MetricsRecorder(args.metrics_jsonl, args.metrics_textfile)
+            except OSError as e:
+                if preprocessor is not None:
+                    preprocessor.close()
+                raise ValueError(f"Could not open metrics file: {e}")
+
+        dedupe = None
+        if args.dedupe:
+            try:
+                dedupe = NearDuplicateIndex(args.dedupe_index, args.dedupe_distance, args.dedupe_hash,
+                                            args.dedupe_link)
+            except (OSError, sqlite3.Error) as e:
+                if preprocessor is not None:
+                    preprocessor.close()
+                if recorder is not None:
+                    recorder.close()
+                raise ValueError(f"Could not open near-duplicate index {args.dedupe_index}: {e}")
+
+        concurrency = max(1, args.concurrency)
+        if args.fixed_concurrency:
+            limiter = AdaptiveLimiter(args.rpm, concurrency, min_limit=concurrency)
+        else:
+            limiter = AdaptiveLimiter(args.rpm, concurrency)
+        client = GeminiClient(args.api_key, model=args.model, base_url=args.base_url,
+                              connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                              max_retries=args.max_retries, pool_size=concurrency, limiter=limiter,
+                              budget=budget, candidate_count=args.candidates,
+                              save_all_images=not args.first_image_only)
+
+        ref_memo = ReferenceMemo(args.ref_memo_mb * 1048576) if args.ref_memo_mb > 0 else None
+        ref_uploader = ReferenceUploader(client, args.upload_index) if args.upload_refs else None
+        transcoder = None
+        if args.output_format != "auto":
+            transcoder = Transcoder(TranscodeOptions(args.output_format, args.output_quality),
+                                    args.preprocess_workers, budget)
+        return cls(client, cache, preprocessor, ref_memo, ref_uploader, recorder, dedupe, transcoder)
+
+    def run_job(self, job, journal=None, max_attempts=0):
+        """Runs one BatchJob on the calling thread; see _run_job()."""
+        return _run_job(self.client, job, self.cache, self.preprocessor, self.ref_memo, self.ref_uploader,
+                        self.recorder, journal, max_attempts, self.dedupe, self.transcoder)
+
+    def close(self):
+        self.client.close()
+        if self.preprocessor is not None:
+            self.preprocessor.close()
+        if self.transcoder is not None:
+            self.transcoder.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.dedupe is not None:
+            self.dedupe.close()
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+def print_summary(jobs, wall_time, cache=None, limiter=None, ref_memo=None, ref_uploader=None, dedupe=None,
+                  budget=None, transcoder=None):
+    """Prints throughput and latency statistics for a finished batch."""
+    resumed = [j for j in jobs if j.ok and j.skipped]
+    succeeded = [j for j in jobs if j.ok and not j.skipped]
+    failed = [j for j in jobs if not j.ok]
+    latencies = sorted(j.elapsed for j in succeeded)
+
+    print("\n📊 BATCH SUMMARY:")
+    note = f", {len(resumed)} already done" if resumed else ""
+    print(f"   Jobs:       {len(jobs)} ({len(succeeded)} succeeded, {len(failed)} failed{note})")
+    print(f"   Wall time:  {wall_time:.2f}s")
+    if wall_time > 0:
+        print(f"   Throughput: {len(succeeded) / wall_time * 60:.1f} images/min")
+    if latencies:
+        print(f"   Latency:    mean {sum(latencies) / len(latencies):.2f}s, "
+              f"p50 {_percentile(latencies, 50):.2f}s, "
+              f"p95 {_percentile(latencies, 95):.2f}s, "
+              f"max {latencies[-1]:.2f}s")
+    stage_totals = {}
+    for job in jobs:
+        for name, (seconds, _) in job.stages.items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+    busy = sum(stage_totals.values())
+    if busy > 0:
+        top = sorted(stage_totals.items(), key=lambda item: -item[1])[:5]
+        print("   Stages:     " + ", ".join(f"{name} {seconds / busy * 100:.0f}%" for name, seconds in top)
+              + " of job time")
+    uploaded = [j for j in succeeded if not j.cached]
+    if uploaded:
+        original = sum(j.original_bytes for j in uploaded)
+        sent = sum(j.upload_bytes for j in uploaded)
+        if sent != original:
+            print(f"   Uploads:    {sent / 1048576:.1f} MB of images inlined "
+                  f"({original / 1048576:.1f} MB of source images, "
+                  f"{(1 - sent / original) * 100:.0f}% saved)")
+        else:
+            print(f"   Uploads:    {sent / 1048576:.1f} MB of images")
+    formats = {}
+    for job in succeeded:
+        for path in job.outputs:
+            name = os.path.splitext(path)[1].lstrip(".").upper().replace("JPG", "JPEG") or "unknown"
+            formats[name] = formats.get(name, 0) + 1
+    if formats:
+        line = f"   Outputs:    {sum(formats.values())} image(s), " + ", ".join(
+            f"{n} {name}" for name, n in sorted(formats.items(), key=lambda item: -item[1]))
+        if transcoder is not None:
+            line += f"; {transcoder.converted} converted to {transcoder.options.image_format}"
+        print(line)
+    if limiter is not None:
+        m = limiter.metrics()
+        print(f"   Limiter:    final limit {m['limit']:.1f} in flight, "
+              f"{m['throttled']} throttled responses, latency EWMA {m['latency_ewma']:.2f}s")
+    if budget is not None and budget.peak:
+        stats = budget.stats()
+        stages = ", ".join(f"{name} {peak / 1048576:.1f}" for name, peak in
+                           sorted(stats["stage_peaks"].items(), key=lambda item: -item[1]))
+        line = f"   Memory:     peak {stats['peak'] / 1048576:.1f} MB in flight ({stages} MB)"
+        if stats["max_bytes"]:
+            line += (f", budget {stats['max_bytes'] / 1048576:.0f} MB, "
+                     f"{stats['waits']} wait(s) totalling {stats['wait_seconds']:.1f}s")
+        print(line)
+    if ref_memo is not None and (ref_memo.hits or ref_memo.misses):
+        stats = ref_memo.stats()
+        print(f"   References: {stats['misses']} encoded, {stats['hits']} reused from memory")
+    if ref_uploader is not None:
+        print(f"   Files API:  {ref_uploader.uploads} reference(s) uploaded, "
+              f"{ref_uploader.reused} sent by URI from the upload index")
+    if dedupe is not None:
+        stats = dedupe.stats()
+        print(f"   Dedupe:     {stats['duplicates']} near-duplicate(s) reused, "
+              f"{stats['entries']} hashes indexed ({dedupe.algorithm}, distance <= {dedupe.max_distance})")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"   Cache:      {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} entries ({stats['bytes'] / 1048576:.1f} MB)")
+    for job in failed:
+        print(f"   ❌ {job.input_path}: {job.error}")
+
+def add_pipeline_arguments(parser):
+    """Adds the prompt, reference, pre-processing, cache, metrics and API options shared by the headless modes."""
+    parser.add_argument("-p", "--prompt", default=DEFAULT_PROMPT,
+                        help="Prompt for jobs that do not specify one")
+    parser.add_argument("-r", "--ref", action="append", default=[], dest="refs",
+                        help="Reference image for jobs that do not specify any (repeatable)")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Maximum number of API calls in flight at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM,
+                        help="Requests per minute allowed by your quota (default: $GEMINI_RPM, 0 = unlimited)")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Keep --concurrency calls in flight instead of adapting to latency and 429s")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Downscale and re-encode images before upload (needs Pillow)")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE,
+                        help=f"Longest image edge after pre-processing (default: {DEFAULT_MAX_EDGE})")
+    parser.add_argument("--max-upload-kb", type=int,
+                        help="Per-image byte budget after pre-processing, in KB")
+    parser.add_argument("--upload-format", choices=["jpeg", "webp", "png"], default="jpeg",
+                        help="Format images are re-encoded to (default: jpeg)")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY,
+                        help=f"JPEG/WebP quality for re-encoded images (default: {DEFAULT_QUALITY})")
+    parser.add_argument("--preprocess-workers", type=int,
+                        help="Processes used for pre-processing (default: one per CPU core)")
+    parser.add_argument("--ref-memo-mb", type=int, default=DEFAULT_MEMO_BYTES // 1048576,
+                        help="Memory for encoded reference images reused across jobs, in MB (0 disables)")
+    parser.add_argument("--upload-refs", action="store_true",
+                        help="Upload each reference once via the Files API and send it by URI")
+    parser.add_argument("--upload-index", default=DEFAULT_INDEX_PATH,
+                        help="JSON index of uploaded references and their expiry")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory of the content-addressed result cache")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_MAX_BYTES // 1048576,
+                        help="Result cache size cap in MB; least recently used results are evicted")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always call the API, even for previously processed requests")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Reuse the result of an earlier, visually near-identical input with the same prompt "
+                             "and references instead of calling the API (needs NumPy and Pillow)")
+    parser.add_argument("--dedupe-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help=f"Largest perceptual hash distance, in bits out of 64, that counts as a near-duplicate "
+                             f"(default: {DEFAULT_MAX_DISTANCE})")
+    parser.add_argument("--dedupe-hash", choices=HASH_ALGORITHMS, default=DEFAULT_ALGORITHM,
+                        help=f"Perceptual hash used for --dedupe (default: {DEFAULT_ALGORITHM})")
+    parser.add_argument("--dedupe-index", default=DEFAULT_DEDUPE_INDEX,
+                        help="SQLite index of the hashes of inputs already recreated")
+    parser.add_argument("--dedupe-link", action="store_true",
+                        help="Hard-link reused results instead of copying them, where the filesystem allows")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="Alternative answers to request per call; each image is saved with a _2, _3... "
+                             "suffix (default: 1)")
+    parser.add_argument("--first-image-only", action="store_true",
+                        help="Save only the first image of each response instead of every image part")
+    parser.add_argument("--output-format", choices=["auto", "jpeg", "png", "webp"], default="auto",
+                        help="Format results are saved in; auto keeps what the API returns and fixes the "
+                             "file extension to match, the others convert on a process pool (default: auto)")
+    parser.add_argument("--output-quality", type=int, default=DEFAULT_OUTPUT_QUALITY,
+                        help=f"JPEG/WebP quality for converted results (default: {DEFAULT_OUTPUT_QUALITY})")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_BUDGET_BYTES // 1048576,
+                        help="Cap on the memory that jobs in flight hold for decoding, encoding and transfer "
+                             "buffers, in MB; jobs wait for room instead (default: $GEMINI_MEMORY_BUDGET_MB, "
+                             "0 = unlimited)")
+    parser.add_argument("--metrics-jsonl", default=DEFAULT_JSONL_PATH,
+                        help="Append per-job stage timings and byte counts to this JSON lines file "
+                             "(default: $GEMINI_METRICS_JSONL)")
+    parser.add_argument("--metrics-textfile",
+                        help="Keep a Prometheus textfile (node_exporter format) with stage totals up to date")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help=f"Gemini model name (default: {DEFAULT_MODEL})")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL,
+                        help="API base URL (default: $GEMINI_BASE_URL or the public endpoint)")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help=f"Seconds to wait for a connection (default: {DEFAULT_CONNECT_TIMEOUT:g})")
+    parser.add_argument("--read-timeout", type=float, default=DEFAULT_READ_TIMEOUT,
+                        help=f"Seconds to wait for response data (default: {DEFAULT_READ_TIMEOUT:g})")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"Retries on 429/5xx and connection errors (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument("--api-key", default=os.getenv("GEMINI_API_KEY"),
+                        help="Gemini API key (default: $GEMINI_API_KEY)")
+    return parser
+
+def add_discovery_arguments(parser):
+    """Adds the options that control which files in a directory are picked up."""
+    parser.add_argument("-R", "--recursive", action="store_true",
+                        help="Also look for images in subdirectories")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="Only use images whose relative path or name matches (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip files and directories whose relative path or name matches (repeatable)")
+    return parser
+
+def build_arg_parser():
+    """Builds the command-line parser for batch mode."""
+    parser = argparse.ArgumentParser(
+        description="Recreate many images with Gemini without interactive prompts.")
+    parser.add_argument("source",
+                        help="Directory of images, or a CSV/JSONL manifest with input, refs, prompt, output")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for auto-named outputs (default: next to each input)")
+    add_discovery_arguments(parser)
+    add_pipeline_arguments(parser)
+    parser.add_argument("--journal",
+                        help=f"SQLite job journal used to resume interrupted runs "
+                             f"(default: {JOURNAL_NAME} in the output directory or next to the source)")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Do not journal jobs; every job runs again on every invocation")
+    parser.add_argument("--max-attempts", type=int, default=0,
+                        help="Stop retrying a job on resume after this many failed attempts (default: 0 = always retry)")
+    parser.add_argument("--async", action="store_true", dest="use_async",
+                        help="Run every job on one asyncio event loop through the streaming endpoint, "
+                             "so -j can be in the hundreds (no --preprocess or --upload-refs)")
+    return parser
+
+async def _run_streaming(args, pipeline, jobs, journal):
+    """Runs the batch through an AsyncGeminiClient that shares the pipeline's limiter and memory budget."""
+    async with AsyncGeminiClient(args.api_key, model=args.model, base_url=args.base_url,
+                                 connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                                 max_retries=args.max_retries, max_connections=max(1, args.concurrency),
+                                 limiter=pipeline.limiter, budget=pipeline.budget,
+                                 candidate_count=args.candidates, save_all_images=not args.first_image_only) as client:
+        return await run_batch_async(jobs, client, args.concurrency, pipeline.cache, pipeline.ref_memo,
+                                     pipeline.recorder, journal, args.max_attempts, pipeline.dedupe,
+                                     pipeline.transcoder)
+
+def batch_main(argv=None):
+    """Entry point for headless batch runs. Returns the process exit code."""
+    args = build_arg_parser().parse_args(argv)
+    if not args.api_key:
+        print("❌ No API key: pass --api-key or set GEMINI_API_KEY")
+        return 2
+    if args.use_async and (args.preprocess or args.upload_refs):
+        print("❌ --async cannot be combined with --preprocess or --upload-refs")
+        return 2
+
+    try:
+        jobs = load_jobs(args.source, args.prompt, args.refs, args.output_dir, args.recursive,
+                         PathFilter(args.include, args.exclude),
+                         lambda path, reason: print(f"⚠️ Skipping {path}: {reason}"))
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not load batch source: {e}")
+        return 2
+    if not jobs:
+        print("No image files found")
+        return 0
+
+    try:
+        pipeline = Pipeline.from_args(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    journal = None
+    if not args.no_journal:
+        journal_dir = args.output_dir or (args.source if os.path.isdir(args.source)
+                                          else os.path.dirname(os.path.abspath(args.source)))
+        journal_path = args.journal or os.path.join(journal_dir, JOURNAL_NAME)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+            journal = JobJournal(journal_path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Could not open job journal {journal_path}: {e}")
+            pipeline.close()
+            return 2
+        counts = journal.counts()
+        if counts:
+            print(f"📒 Resuming from {journal_path}: "
+                  + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+
+    print(f"🔄 Processing {len(jobs)} job(s) with concurrency {args.concurrency}...")
+    start = time.monotonic()
+    try:
+        if args.use_async:
+            done = asyncio.run(_run_streaming(args, pipeline, jobs, journal))
+        else:
+            done = run_batch(jobs, pipeline.client, args.concurrency, pipeline.cache, pipeline.preprocessor,
+                             pipeline.ref_memo, pipeline.ref_uploader, pipeline.recorder, journal,
+                             args.max_attempts, pipeline.dedupe, pipeline.transcoder)
+    finally:
+        pipeline.close()
+        if journal is not None:
+            journal.close()
+    print_summary(done, time.monotonic() - start, pipeline.cache, pipeline.limiter, pipeline.ref_memo,
+                  pipeline.ref_uploader, pipeline.dedupe, pipeline.budget, pipeline.transcoder)
+    return 0 if all(j.ok for j in done) else 1
+
+if __name__ == "__main__":
+    sys.exit(batch_main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Offline Benchmarks)
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from io import StringIO
+
+import requests
+
+from batch_recreation import BatchJob, _percentile, run_batch
+from gemini_client import GeminiClient
+from rate_limiter import AdaptiveLimiter
+from reference_memo import ReferenceMemo
+
+DEFAULT_SIZES_KB = [256, 2048, 8192]
+DEFAULT_CONCURRENCY = [1, 4, 16]
+DEFAULT_JOBS = 32
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_gemini_server.py")
+
+def _current_rss():
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _max_rss():
+    """Lifetime peak RSS in bytes from getrusage (KB on Linux, bytes on macOS)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class RSSSampler:
+    """Samples RSS on a background thread so each scenario gets its own peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.baseline = _current_rss()
+        self.peak = self.baseline or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        if self.baseline is None:
+            # No /proc: fall back to the process-wide high-water mark
+            self.baseline = 0
+            self.peak = _max_rss()
+
+class MockServerProcess:
+    """Runs mock_gemini_server.py in a child process so its memory is not counted."""
+
+    def __init__(self, latency, jitter, error_rate, image_kb):
+        command = [sys.executable, MOCK_SERVER, "--port", "0", "--latency", str(latency),
+                   "--jitter", str(jitter), "--error-rate", str(error_rate), "--image-kb", str(image_kb)]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("The mock Gemini server did not start")
+        self.base_url = line.strip().rsplit(" ", 1)[-1]
+        self.session = requests.Session()
+
+    def control(self, path, values=None):
+        if values is None:
+            response = self.session.get(self.base_url + path, timeout=10)
+        else:
+            response = self.session.post(self.base_url + path, json=values, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+        self.process.terminate()
+        self.process.wait()
+
+def make_inputs(work_dir, size_kb, count):
+    """Writes count pseudo-random JPEG-framed files of size_kb each and returns their paths.
+
+    They start and end with the JPEG markers, so input checks accept them.
+    """
+    input_dir = os.path.join(work_dir, f"inputs_{size_kb}kb")
+    os.makedirs(input_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(input_dir, f"input_{i:04d}.jpg")
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0" + os.urandom(max(0, size_kb * 1024 - 6)) + b"\xff\xd9")
+        paths.append(path)
+    return paths
+
+def run_scenario(server, work_dir, size_kb, concurrency, args):
+    """Runs one batch through the real batch path and returns its measurements."""
+    inputs = make_inputs(work_dir, size_kb, args.jobs)
+    refs = make_inputs(os.path.join(work_dir, "refs"), size_kb, args.refs)
+    output_dir = os.path.join(work_dir, "outputs")
+    jobs = [BatchJob(path, refs, "Benchmark prompt",
+                     os.path.join(output_dir, f"{os.path.basename(path)[:-4]}_{concurrency}.jpg"))
+            for path in inputs]
+
+    if args.adaptive:
+        limiter = AdaptiveLimiter(0, concurrency)
+    else:
+        limiter = AdaptiveLimiter(0, concurrency, min_limit=concurrency)
+    client = GeminiClient("benchmark-key", base_url=server.base_url, pool_size=concurrency,
+                          max_retries=args.max_retries, limiter=limiter)
+    ref_memo = ReferenceMemo() if refs else None
+
+    server.control("/__reset", {})
+    # The per-job lines of run_batch would swamp the report
+    with RSSSampler() as rss, redirect_stdout(StringIO()):
+        start = time.monotonic()
+        try:
+            done = run_batch(jobs, client, concurrency, ref_memo=ref_memo)
+        finally:
+            client.close()
+        wall_time = time.monotonic() - start
+    wire = server.control("/__stats")
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    shutil.rmtree(os.path.dirname(inputs[0]), ignore_errors=True)
+
+    succeeded = [j for j in done if j.ok]
+    latencies = sorted(j.elapsed for j in succeeded)
+    metrics = limiter.metrics()
+    return {
+        "image_kb": size_kb,
+        "refs": args.refs,
+        "concurrency": concurrency,
+        "jobs": len(done),
+        "succeeded": len(succeeded),
+        "failed": len(done) - len(succeeded),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_per_min": round(len(succeeded) / wall_time * 60, 2) if wall_time > 0 else 0.0,
+        "latency_s": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 50), 4),
+            "p95": round(_percentile(latencies, 95), 4),
+            "p99": round(_percentile(latencies, 99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0,
+        },
+        "peak_rss_mb": round(rss.peak / 1048576, 1),
+        "rss_growth_mb": round((rss.peak - rss.baseline) / 1048576, 1),
+        "requests": wire["requests"],
+        "throttled": metrics["throttled"],
+        "bytes_sent": wire["bytes_received"],
+        "bytes_received": wire["bytes_sent"],
+        "errors": sorted({j.error for j in done if not j.ok})[:5],
+    }
+
+def print_result(result):
+    lat = result["latency_s"]
+    print(f"   {result['image_kb']:>6} KB  x{result['concurrency']:<3} "
+          f"{result['throughput_per_min']:>8.1f}/min  "
+          f"p50 {lat['p50']:.3f}s  p95 {lat['p95']:.3f}s  p99 {lat['p99']:.3f}s  "
+          f"RSS {result['peak_rss_mb']:.0f} MB (+{result['rss_growth_mb']:.0f})  "
+          f"wire {result['bytes_sent'] / 1048576:.1f} MB up / {result['bytes_received'] / 1048576:.1f} MB down"
+          + (f"  ❌ {result['failed']} failed" if result["failed"] else ""))
+
+def compare(results, baseline_path):
+    """Prints throughput and p95 changes against a previous results file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["image_kb"], r["refs"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\n📈 COMPARED WITH {baseline_path}:")
+    for result in results:
+        old = previous.get((result["image_kb"], result["refs"], result["concurrency"]))
+        if old is None or not old["throughput_per_min"] or not old["latency_s"]["p95"]:
+            continue
+        throughput = result["throughput_per_min"] / old["throughput_per_min"] - 1
+        p95 = result["latency_s"]["p95"] / old["latency_s"]["p95"] - 1
+        rss = result["peak_rss_mb"] - old["peak_rss_mb"]
+        print(f"   {result['image_kb']:>6} KB  x{result['concurrency']:<3} "
+              f"throughput {throughput:+.1%}  p95 {p95:+.1%}  peak RSS {rss:+.0f} MB")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recreation pipeline against a local mock of the Gemini API.")
+    parser.add_argument("--sizes-kb", type=int, nargs="+", default=DEFAULT_SIZES_KB,
+                        help=f"Input image sizes to test, in KB (default: {DEFAULT_SIZES_KB})")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY,
+                        help=f"Concurrency levels to test (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"Jobs per scenario (default: {DEFAULT_JOBS})")
+    parser.add_argument("--refs", type=int, default=0,
+                        help="Reference images per job, same size as the input (default: 0)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Simulated API latency in seconds (default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.05,
+                        help="Random +/- seconds added to the latency (default: 0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of calls answered with 429/503 (default: 0)")
+    parser.add_argument("--response-kb", type=int, default=1024,
+                        help="Size of the image returned by the mock, in KB (default: 1024)")
+    parser.add_argument("--max-retries", type=int, default=4,
+                        help="Client retries on 429/5xx (default: 4)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Let the adaptive limiter pick the concurrency instead of fixing it")
+    parser.add_argument("-o", "--output",
+                        help="Write the results as JSON to this file")
+    parser.add_argument("--compare",
+                        help="Previous JSON results to compare against")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="gemini-bench-")
+    server = MockServerProcess(args.latency, args.jitter, args.error_rate, args.response_kb)
+    print(f"🏁 Benchmarking against {server.base_url} "
+          f"({args.jobs} jobs per scenario, {args.latency:g}s latency, "
+          f"{args.error_rate:.0%} errors, {args.response_kb} KB responses)")
+
+    results = []
+    try:
+        for size_kb in args.sizes_kb:
+            for concurrency in args.concurrency:
+                result = run_scenario(server, work_dir, size_kb, max(1, concurrency), args)
+                print_result(result)
+                results.append(result)
+    finally:
+        server.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0 if all(not r["failed"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
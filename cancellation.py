@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Cancellation Tokens)
+# ======================================================
+
+import threading
+
+class Cancelled(Exception):
+    """Raised inside a worker once its CancelToken has been cancelled."""
+
+class CancelToken:
+    """Cancellation flag shared between the thread running a job and the one cancelling it.
+
+    Workers call ``check()`` between stages and while streaming data. Code
+    blocked in I/O can register a callback with ``on_cancel()`` (e.g. to
+    close an HTTP response) so that cancelling also interrupts the wait.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancels the job; safe to call from any thread and more than once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # Tearing down a half-closed connection may fail; the worker still sees the flag
+
+    def check(self):
+        """Raises Cancelled if the job has been cancelled."""
+        if self._event.is_set():
+            raise Cancelled("Generation cancelled")
+
+    def wait(self, seconds):
+        """Sleeps up to seconds; returns True early if the job is cancelled meanwhile."""
+        return self._event.wait(seconds)
+
+    def on_cancel(self, callback):
+        """Runs callback on cancellation (right away if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Uploaded Reference Index)
+# ======================================================
+
+import os
+import json
+import time
+import hashlib
+import calendar
+import tempfile
+import threading
+
+from gemini_payload import FileData
+from image_preprocess import guess_mime_type
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gemini-recreation", "uploads.json")
+# Files API uploads live for 48 hours; assume a little less if no expiry is reported
+DEFAULT_LIFETIME = 47 * 3600
+# URIs this close to expiry are re-uploaded rather than risked in a request
+EXPIRY_MARGIN = 15 * 60
+_CHUNK_SIZE = 1024 * 1024
+
+def parse_expiration(value):
+    """Converts an RFC 3339 UTC timestamp such as 2025-01-01T12:00:00.123456789Z to epoch seconds."""
+    if not value:
+        return None
+    value = value.rstrip("Z")
+    whole, _, fraction = value.partition(".")
+    try:
+        return calendar.timegm(time.strptime(whole, "%Y-%m-%dT%H:%M:%S")) + float("0." + (fraction or "0"))
+    except ValueError:
+        return None
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ReferenceUploader:
+    """Uploads each distinct reference image once and hands out its file URI.
+
+    Uploaded files are recorded in a small JSON index keyed by the image
+    content, the pre-processing options and the API endpoint/key, together
+    with their expiry, so later jobs and later runs can send a ``fileData``
+    part instead of the inline image. Entries that are expired (or about to
+    be) are uploaded again.
+    """
+
+    def __init__(self, client, index_path=DEFAULT_INDEX_PATH):
+        self.client = client
+        self.index_path = index_path
+        self.uploads = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._digests = {}  # (path, size, mtime) -> sha256, so files are hashed once per run
+        self._owner = hashlib.sha256(f"{client.base_url}|{client.api_key}".encode("utf-8")).hexdigest()[:16]
+        self._index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        """Merges with the on-disk index and replaces it atomically. Caller holds the lock."""
+        now = time.time()
+        merged = self._read_index()
+        merged.update(self._index)
+        merged = {k: v for k, v in merged.items() if v.get("expires_at", 0) > now}
+        self._index = merged
+        index_dir = os.path.dirname(self.index_path)
+        os.makedirs(index_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _key(self, path, preprocessor):
+        st = os.stat(path)
+        stat_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stat_key)
+        if digest is None:
+            digest = _file_digest(path)
+            with self._lock:
+                self._digests[stat_key] = digest
+        variant = preprocessor.options.signature() if preprocessor else "raw"
+        return f"{self._owner}:{variant}:{digest}"
+
+    def get(self, path, preprocessor=None, log=None):
+        """Returns ``(FileData, mime_type)`` for path, uploading it if needed."""
+        key = self._key(path, preprocessor)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._index.get(key)
+            if entry and entry["expires_at"] - EXPIRY_MARGIN > time.time():
+                with self._lock:
+                    self.reused += 1
+                return FileData(entry["uri"]), entry["mime_type"]
+
+            if log:
+                log(f"☁️ Uploading reference {os.path.basename(path)}...")
+            if preprocessor is not None:
+                prepared = preprocessor.prepare([path])
+                try:
+                    mime_type = prepared[0].mime_type
+                    resource = self.client.upload_file(prepared[0].path, mime_type,
+                                                       os.path.basename(path), log)
+                finally:
+                    preprocessor.release(prepared)
+            else:
+                mime_type = guess_mime_type(path)
+                resource = self.client.upload_file(path, mime_type, log=log)
+
+            expires_at = parse_expiration(resource.get("expirationTime")) or time.time() + DEFAULT_LIFETIME
+            with self._lock:
+                self.uploads += 1
+                self._index[key] = {
+                    "uri": resource["uri"],
+                    "name": resource.get("name"),
+                    "mime_type": mime_type,
+                    "expires_at": expires_at,
+                }
+                self._write_index()
+            return FileData(resource["uri"]), mime_type
+
+    def forget(self, path, preprocessor=None):
+        """Drops the recorded URI for path, e.g. after the server rejected it."""
+        key = self._key(path, preprocessor)
+        with self._lock:
+            if key in self._index:
+                # An expired marker also overrides the entry in the on-disk index when merging
+                self._index[key] = {"expires_at": 0}
+                self._write_index()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Async Streaming Client)
+# ======================================================
+
+import ssl
+import time
+import random
+import asyncio
+from urllib.parse import urlsplit
+
+from gemini_client import (
+    DEFAULT_BASE_URL,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_MODEL,
+    DEFAULT_READ_TIMEOUT,
+    RETRY_STATUSES,
+    GeminiAPIError,
+    parse_retry_after,
+)
+from gemini_payload import RAW_CHUNK_SIZE, StreamingPayload, payload_memory
+from gemini_response import (
+    DOWNLOAD_BUFFER_BYTES, RESPONSE_CHUNK_SIZE, ImageFiles, InlineDataStreamParser, ResponseFormatError,
+    format_for_log,
+)
+from memory_budget import reserved_async
+
+DEFAULT_MAX_CONNECTIONS = 100
+# Body bytes handed to the transport per write; 4/3 of a raw chunk is one encoded chunk
+SEND_CHUNK_SIZE = RAW_CHUNK_SIZE * 4 // 3
+# Longest status line plus headers accepted from the server
+MAX_HEADER_BYTES = 64 * 1024
+# How often a call waiting for a full limiter polls it again, at most
+LIMITER_POLL_INTERVAL = 0.05
+
+# Errors that mean the connection broke, not that the request was wrong
+_TRANSPORT_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError)
+# The subset a socket read can raise; a bare OSError while saving is a local disk problem
+_READ_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError, ssl.SSLError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError)
+
+def _find_eol(data, start):
+    """Index of the first CR or LF at or after start, or -1."""
+    cr = data.find(b"\r", start)
+    lf = data.find(b"\n", start)
+    if cr == -1 or lf == -1:
+        return max(cr, lf)
+    return min(cr, lf)
+
+class SSEImageStream:
+    """Incremental decoder for a ``streamGenerateContent?alt=sse`` response body.
+
+    The body is a series of server-sent events whose ``data:`` lines each
+    carry one GenerateContentResponse. Data lines are fed straight into an
+    InlineDataStreamParser, so an image inside an event is base64-decoded
+    to disk while the event is still arriving. ``sink_factory(index)``
+    numbers images across all events. ``feed()`` and ``close()`` return
+    ``(summary, images)`` for every event they completed, where summary is
+    the event's response without image data.
+    """
+
+    def __init__(self, sink_factory, timer=None):
+        self._sink_factory = sink_factory
+        self._timer = timer
+        self._field = bytearray()
+        self._mode = None  # None while reading a field name, then "data" or "skip" for the rest of the line
+        self._skip_space = False
+        self._after_cr = False
+        self._parser = None
+        self._data_lines = 0
+        self.images = []  # _Base64Sink per image, in stream order
+        self.events = []  # Summary of every completed event
+
+    def _start_data(self):
+        if self._parser is None:
+            offset = len(self.images)
+            self._parser = InlineDataStreamParser(lambda index: self._sink_factory(offset + index), self._timer)
+        elif self._data_lines:
+            self._parser.feed(b"\n")  # Multi-line data is joined with newlines, which JSON ignores
+        self._data_lines += 1
+        self._skip_space = True
+
+    def _feed_data(self, text):
+        if self._skip_space and text:
+            self._skip_space = False
+            if text[:1] == b" ":
+                text = text[1:]
+        if text:
+            self._parser.feed(text)
+
+    def _end_line(self, completed):
+        if self._mode is None:
+            if not self._field:
+                self._dispatch(completed)
+            elif bytes(self._field) == b"data":
+                self._start_data()  # "data" without a colon is an empty data line
+            self._field.clear()
+        self._mode = None
+
+    def _dispatch(self, completed):
+        if self._parser is None:
+            return
+        parser, self._parser, self._data_lines = self._parser, None, 0
+        summary = parser.close()
+        self.images.extend(parser.images)
+        self.events.append(summary)
+        completed.append((summary, parser.images))
+
+    def feed(self, data):
+        """Consumes the next piece of the body; returns the events it completed."""
+        completed = []
+        i, n = 0, len(data)
+        while i < n:
+            if self._after_cr:
+                self._after_cr = False
+                if data[i:i + 1] == b"\n":
+                    i += 1
+                    continue
+            if self._mode is not None:
+                end = _find_eol(data, i)
+                stop = n if end == -1 else end
+                if self._mode == "data":
+                    self._feed_data(data[i:stop])
+                if end == -1:
+                    return completed
+                self._after_cr = data[end:end + 1] == b"\r"
+                self._end_line(completed)
+                i = end + 1
+                continue
+            c = data[i:i + 1]
+            i += 1
+            if c in (b"\r", b"\n"):
+                self._after_cr = c == b"\r"
+                self._end_line(completed)
+            elif c == b":":
+                self._mode = "data" if bytes(self._field) == b"data" else "skip"
+                self._field.clear()
+                if self._mode == "data":
+                    self._start_data()
+            else:
+                self._field += c
+        return completed
+
+    def close(self):
+        """Finishes the stream, completing an event the server did not terminate."""
+        completed = []
+        if self._mode is not None or self._field:
+            self._end_line(completed)
+        self._dispatch(completed)
+        return completed
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reusable = False  # Set once a response has been read to its end
+
+    def close(self):
+        self.writer.close()
+
+class _ConnectionPool:
+    """Keep-alive HTTP/1.1 connections per host, at most max_connections open at once."""
+
+    def __init__(self, max_connections, connect_timeout):
+        self.connect_timeout = connect_timeout
+        self._slots = asyncio.Semaphore(max(1, max_connections))
+        self._idle = {}
+        self._ssl = None
+
+    async def acquire(self, scheme, host, port):
+        await self._slots.acquire()
+        key = (scheme, host, port)
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+        try:
+            if scheme == "https":
+                if self._ssl is None:
+                    self._ssl = ssl.create_default_context()
+                opening = asyncio.open_connection(host, port, ssl=self._ssl, server_hostname=host)
+            else:
+                opening = asyncio.open_connection(host, port)
+            reader, writer = await asyncio.wait_for(opening, self.connect_timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        return _Connection(key, reader, writer)
+
+    def release(self, conn, reuse=False):
+        if reuse and conn.reusable:
+            self._idle.setdefault(conn.key, []).append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+def _parse_head(raw):
+    """Splits a raw response head into (status, headers) with lower-cased header names."""
+    lines = raw.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise ConnectionError(f"Malformed HTTP status line: {lines[0][:100]!r}")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return int(parts[1]), headers
+
+async def _iter_body(conn, headers, read_timeout):
+    """Yields the response body as it arrives (chunked, Content-Length or until EOF)."""
+    reader = conn.reader
+
+    async def read(coro):
+        return await asyncio.wait_for(coro, read_timeout)
+
+    async def read_exactly(size):
+        while size:
+            chunk = await read(reader.read(min(size, RESPONSE_CHUNK_SIZE)))
+            if not chunk:
+                raise ConnectionError("Connection closed in the middle of the response")
+            size -= len(chunk)
+            yield chunk
+
+    keep_alive = headers.get("connection", "").lower() != "close"
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await read(reader.readline())
+            try:
+                size = int(line.split(b";")[0].strip(), 16)
+            except ValueError:
+                raise ConnectionError(f"Malformed chunk header: {line[:40]!r}")
+            if size == 0:
+                while (await read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                    pass  # Trailers
+                break
+            async for chunk in read_exactly(size):
+                yield chunk
+            await read(reader.readline())
+        conn.reusable = keep_alive
+    elif "content-length" in headers:
+        async for chunk in read_exactly(int(headers["content-length"])):
+            yield chunk
+        conn.reusable = keep_alive
+    else:
+        while True:
+            chunk = await read(reader.read(RESPONSE_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield chunk
+
+def _event_texts(summary):
+    """Text parts of one streamed response."""
+    for candidate in summary.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if isinstance(part.get("text"), str):
+                yield part["text"]
+
+def _event_mime_types(summary):
+    """mimeType of every inlineData part of one streamed response, in order."""
+    for candidate in summary.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if "inlineData" in part:
+                yield part["inlineData"].get("mimeType")
+
+class AsyncGeminiClient:
+    """asyncio counterpart of GeminiClient that talks to ``:streamGenerateContent``.
+
+    Every request is a coroutine on the caller's event loop, so a single
+    thread can keep hundreds of calls in flight; only the blocking file
+    reads and base64 encoding of the request body run in the default
+    executor. The server answers with server-sent events: text parts and
+    download progress are reported as they arrive and image data is
+    decoded to the output file incrementally, instead of after the whole
+    response. HTTP/1.1 is spoken directly over asyncio streams with a
+    keep-alive pool of up to ``max_connections`` connections, so no extra
+    dependency is needed.
+
+    Retries, backoff and Retry-After handling match GeminiClient. An
+    AdaptiveLimiter shared with threaded callers is honoured by polling it
+    without blocking the loop, and so is a shared MemoryBudget.
+    ``candidate_count`` and ``save_all_images`` work as in GeminiClient.
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=DEFAULT_BASE_URL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=1.0, backoff_max=60.0,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, limiter=None, budget=None, candidate_count=1,
+                 save_all_images=True):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter
+        self.budget = budget
+        self.candidate_count = max(1, candidate_count)
+        self.save_all_images = save_all_images
+        self._pool = _ConnectionPool(max_connections, connect_timeout)
+
+    @property
+    def model_url(self):
+        # Same as GeminiClient's, so both clients share result cache keys
+        return f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+
+    @property
+    def request_signature(self):
+        return f"candidates:{self.candidate_count}" if self.candidate_count > 1 else ""
+
+    @property
+    def stream_url(self):
+        return f"{self.base_url}/v1beta/models/{self.model}:streamGenerateContent?alt=sse"
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (0-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _acquire(self):
+        if self.limiter is None:
+            return None
+        while True:
+            started, wait = self.limiter.try_acquire()
+            if started is not None:
+                return started
+            await asyncio.sleep(LIMITER_POLL_INTERVAL if wait is None else min(wait, 1.0))
+
+    def _release(self, started, status=None, retry_after=None):
+        if self.limiter is not None:
+            self.limiter.release(started, status, retry_after)
+
+    async def _send(self, url, payload, timer):
+        """Sends one attempt and returns ``(conn, status, headers)`` once the response head arrives."""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        conn = await self._pool.acquire(parts.scheme, parts.hostname, port)
+        try:
+            head = (f"POST {target} HTTP/1.1\r\n"
+                    f"Host: {parts.netloc}\r\n"
+                    f"x-goog-api-key: {self.api_key}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Accept: text/event-stream\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n")
+            conn.writer.write(head.encode("latin-1"))
+            payload.seek(0)
+            if timer is not None:
+                timer.upload_finished = None
+            sent = time.monotonic()
+            loop = asyncio.get_running_loop()
+            while True:
+                chunk = await loop.run_in_executor(None, payload.read, SEND_CHUNK_SIZE)
+                if not chunk:
+                    break
+                conn.writer.write(chunk)
+                await asyncio.wait_for(conn.writer.drain(), self.read_timeout)
+            raw = await asyncio.wait_for(conn.reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+            if len(raw) > MAX_HEADER_BYTES:
+                raise ConnectionError("Response headers too large")
+            status, headers = _parse_head(raw)
+        except BaseException:
+            self._pool.release(conn)
+            raise
+        if timer is not None:
+            timer.add("server_wait", time.monotonic() - (timer.upload_finished or sent))
+        return conn, status, headers
+
+    async def _error_detail(self, conn, headers):
+        body = b""
+        try:
+            async for chunk in _iter_body(conn, headers, self.read_timeout):
+                body += chunk
+                if len(body) >= 2048:
+                    break
+        except _TRANSPORT_ERRORS:
+            pass
+        return body[:2048].decode("utf-8", "replace").strip()
+
+    async def _open_stream(self, payload, log, timer):
+        """POSTs the payload with retries; returns ``(conn, headers)`` of a successful response."""
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            started = await self._acquire()
+            if timer is not None:
+                timer.add("queue", time.perf_counter() - queued)
+            try:
+                conn, status, headers = await self._send(self.stream_url, payload, timer)
+            except _TRANSPORT_ERRORS as e:
+                self._release(started)
+                if attempt >= self.max_retries:
+                    raise GeminiAPIError(f"Error during API call: {type(e).__name__}: {e}")
+                delay = self.backoff_delay(attempt)
+                log(f"⏳ {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            except BaseException:
+                self._release(started)
+                raise
+            else:
+                retry_after = parse_retry_after(headers.get("retry-after"))
+                self._release(started, status, retry_after)
+                if status < 400:
+                    return conn, headers
+                try:
+                    detail = await self._error_detail(conn, headers)
+                finally:
+                    self._pool.release(conn)
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise GeminiAPIError(f"HTTP {status} from Gemini API: {detail[:500]}", status)
+                delay = self.backoff_delay(attempt, retry_after)
+                log(f"⏳ HTTP {status}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            attempt += 1
+            await asyncio.sleep(delay)
+            if timer is not None:
+                timer.add("queue", delay)
+
+    async def stream_to_file(self, prompt, images, output_file, log=None, timer=None):
+        """Sends the prompt with (path, mime_type) images and yields events as the answer streams in.
+
+        Events are dicts with a ``type``:
+
+        - ``progress``: ``bytes`` of the response received so far
+        - ``text``: a ``text`` part of the answer
+        - ``image``: image ``index`` finished, with its ``bytes``, ``mime_type``
+          and the ``path`` it will be saved to (None if it is skipped)
+        - ``done``: the last event, with the ``output_file`` the first image
+          was saved to, its ``bytes``, ``outputs`` as ``(path, size)`` per
+          saved image and ``summary``, the list of streamed responses
+          without image data
+
+        The first image is written to output_file, with the extension of
+        the format actually returned; later ones, across all events and
+        candidates, are skipped unless the client saves all images (see
+        image_output_path() for their names). Images only appear under
+        their final names once the stream has completed. Raises GeminiAPIError for transport/HTTP failures and
+        ResponseFormatError when the stream carries no usable image. If the
+        stream fails or the consuming task is cancelled, the connection is
+        dropped and no partial output file is left behind.
+        """
+        log = log or (lambda message: None)
+        async with reserved_async(self.budget, "upload", payload_memory(prompt, images), timer):
+            payload = StreamingPayload(prompt, images, timer, candidate_count=self.candidate_count)
+            try:
+                conn, headers = await self._open_stream(payload, log, timer)
+            finally:
+                payload.close()
+
+        files = ImageFiles(output_file, self.save_all_images)
+        stream = SSEImageStream(files, timer)
+        body = _iter_body(conn, headers, self.read_timeout)
+        received = 0
+        finished = False
+        download = reserved_async(self.budget, "download", DOWNLOAD_BUFFER_BYTES, timer)
+        try:
+            await download.__aenter__()
+        except BaseException:
+            self._pool.release(conn)
+            raise
+        if timer is not None:
+            timer.enter("download")
+        try:
+            ended = False
+            while not ended:
+                waited = time.perf_counter()
+                try:
+                    chunk = await body.__anext__()
+                except StopAsyncIteration:
+                    ended = True
+                    completed = stream.close()
+                except _READ_ERRORS as e:
+                    raise GeminiAPIError(f"Error while downloading the API response: {e}")
+                else:
+                    if timer is not None:
+                        timer.add("download", time.perf_counter() - waited, len(chunk))
+                    received += len(chunk)
+                    yield {"type": "progress", "bytes": received}
+                    completed = stream.feed(chunk)
+                for summary, images in completed:
+                    error = summary.get("error")
+                    if isinstance(error, dict):
+                        raise GeminiAPIError(f"Error in API stream: {error.get('message', error)}",
+                                             error.get("code"))
+                    for text in _event_texts(summary):
+                        yield {"type": "text", "text": text}
+                    first = len(stream.images) - len(images)
+                    for offset, (sink, mime_type) in enumerate(zip(images, _event_mime_types(summary))):
+                        path = sink.file.target if sink.file is not None else None
+                        yield {"type": "image", "index": first + offset, "bytes": sink.decoded_bytes,
+                               "mime_type": mime_type, "path": path}
+            files.close()
+            if not stream.images:
+                raise ResponseFormatError("No image data found in response\nFull API response:\n"
+                                          + format_for_log(stream.events))
+            paths = files.commit()
+            finished = True
+            saved = [sink for sink in stream.images if sink.file is not None]
+            yield {"type": "done", "output_file": paths[0], "bytes": stream.images[0].decoded_bytes,
+                   "outputs": [(path, sink.decoded_bytes) for path, sink in zip(paths, saved)],
+                   "summary": stream.events}
+        finally:
+            await body.aclose()
+            files.close()
+            self._pool.release(conn, reuse=finished)
+            await download.__aexit__(None, None, None)
+            if not finished:
+                files.discard()
+
+    async def generate_to_file(self, prompt, images, output_file, log=None, timer=None, on_event=None):
+        """Awaitable generate_to_file(): streams into output_file and returns ``(summary, outputs)``.
+
+        ``on_event`` is called with every event of stream_to_file() as it arrives.
+        """
+        events = self.stream_to_file(prompt, images, output_file, log, timer)
+        try:
+            async for event in events:
+                if on_event is not None:
+                    on_event(event)
+                if event["type"] == "done":
+                    return event["summary"], event["outputs"]
+        finally:
+            await events.aclose()
+
+    async def close(self):
+        self._pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Shared API Client)
+# ======================================================
+
+import os
+import json
+import time
+import random
+import datetime
+import email.utils
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cancellation import Cancelled
+from gemini_payload import StreamingPayload, payload_memory
+from gemini_response import DOWNLOAD_BUFFER_BYTES, RESPONSE_CHUNK_SIZE, write_image_from_chunks
+from memory_budget import reserved
+
+DEFAULT_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+DEFAULT_MODEL = "gemini-2.5-flash-image-preview"
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_POOL_SIZE = 16
+# Statuses worth retrying: throttling and transient server-side failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class GeminiAPIError(Exception):
+    """Raised when the API call fails for good (after any retries)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def parse_retry_after(value):
+    """Converts a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+def _error_detail(response):
+    """Returns the start of an error response body for messages."""
+    try:
+        body = next(response.iter_content(2048), b"")
+    except requests.exceptions.RequestException:
+        return ""
+    return body.decode("utf-8", "replace").strip()
+
+class GeminiClient:
+    """Reusable generateContent client shared by the CLI, batch mode and the GUI.
+
+    One keep-alive Session with a sized connection pool is kept for the
+    client's lifetime so TLS connections are reused across requests. Calls
+    have separate connect/read timeouts, and 429/5xx responses as well as
+    connection errors are retried with full-jitter exponential backoff,
+    waiting at least as long as any Retry-After header asks.
+
+    With an AdaptiveLimiter, every attempt first waits for a token and an
+    in-flight slot, and reports its latency and status back to it. With a
+    MemoryBudget, the request body and the response buffers are reserved
+    against it before they are built, one after the other.
+
+    ``candidate_count`` asks the model for that many alternative answers
+    per call. Every image of the response, across all candidates and
+    parts, is saved (see image_output_path()); ``save_all_images=False``
+    keeps only the first.
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=DEFAULT_BASE_URL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=1.0, backoff_max=60.0,
+                 pool_size=DEFAULT_POOL_SIZE, limiter=None, budget=None, candidate_count=1,
+                 save_all_images=True):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = limiter
+        self.budget = budget
+        self.candidate_count = max(1, candidate_count)
+        self.save_all_images = save_all_images
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"x-goog-api-key": api_key})
+
+    @property
+    def model_url(self):
+        return f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+
+    @property
+    def request_signature(self):
+        """Request settings beyond model and inputs, for cache keys; empty for the defaults."""
+        return f"candidates:{self.candidate_count}" if self.candidate_count > 1 else ""
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (0-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def post(self, url, body, log=None, headers=None, limited=True, timer=None, cancel=None):
+        """POSTs a rewindable body with retries and returns the streaming response.
+
+        The caller owns the returned response and must close it. Calls made
+        with ``limited=False`` (file uploads) bypass the rate limiter. With a
+        StageTimer, limiter and backoff waits are recorded as "queue" and the
+        time until response headers arrive as "server_wait". With a
+        CancelToken, queueing, backoff and the request itself end with
+        Cancelled as soon as it is cancelled, and the connection is dropped.
+        """
+        log = log or (lambda message: None)
+        request_headers = {"Content-Type": "application/json"}
+        request_headers.update(headers or {})
+        attempt = 0
+        while True:
+            if hasattr(body, "seek"):
+                body.seek(0)
+            limiter = self.limiter if limited else None
+            queued = time.perf_counter()
+            started = limiter.acquire(cancel) if limiter else None
+            if timer is not None:
+                timer.add("queue", time.perf_counter() - queued)
+                timer.upload_finished = None
+                sent = time.monotonic()
+            try:
+                if cancel is not None:
+                    cancel.check()
+                response = self.session.post(url, data=body, headers=request_headers,
+                                             timeout=self.timeout, stream=True)
+            except Cancelled:
+                self._release(limiter, started)
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._release(limiter, started)
+                if attempt >= self.max_retries:
+                    raise GeminiAPIError(f"Error during API call: {e}")
+                delay = self.backoff_delay(attempt)
+                log(f"⏳ {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            except requests.exceptions.RequestException as e:
+                self._release(limiter, started)
+                raise GeminiAPIError(f"Error during API call: {e}")
+            else:
+                if timer is not None:
+                    timer.add("server_wait", time.monotonic() - (timer.upload_finished or sent))
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self._release(limiter, started, status, retry_after)
+                if cancel is not None and cancel.cancelled:
+                    # The answer arrived after all; drop the connection instead of reading it
+                    response.close()
+                    cancel.check()
+                if status < 400:
+                    return response
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    detail = _error_detail(response)
+                    response.close()
+                    raise GeminiAPIError(f"HTTP {status} from Gemini API: {detail[:500]}", status)
+                response.close()
+                delay = self.backoff_delay(attempt, retry_after)
+                log(f"⏳ HTTP {status}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            attempt += 1
+            if cancel is not None:
+                if cancel.wait(delay):
+                    cancel.check()
+            else:
+                time.sleep(delay)
+            if timer is not None:
+                timer.add("queue", delay)
+
+    def _release(self, limiter, started, status=None, retry_after=None):
+        if limiter is not None:
+            limiter.release(started, status, retry_after)
+
+    def generate_to_file(self, prompt, images, output_file, log=None, timer=None, cancel=None):
+        """Sends the prompt with (path, mime_type) images and writes the returned image(s).
+
+        Returns ``(summary, outputs)`` as write_image_from_chunks does. Raises
+        GeminiAPIError for transport/HTTP failures and ResponseFormatError
+        when the response carries no usable image. Stage timings are
+        recorded on ``timer`` when one is given. Cancelling ``cancel`` aborts
+        the upload or download mid-stream, closes the connection and raises
+        Cancelled without leaving a partial output file.
+        """
+        with reserved(self.budget, "upload", payload_memory(prompt, images), timer, cancel):
+            payload = StreamingPayload(prompt, images, timer, cancel, self.candidate_count)
+            try:
+                response = self.post(self.model_url, payload, log, timer=timer, cancel=cancel)
+            finally:
+                payload.close()
+        unregister = cancel.on_cancel(response.close) if cancel is not None else None
+        with response, reserved(self.budget, "download", DOWNLOAD_BUFFER_BYTES, timer, cancel):
+            try:
+                return write_image_from_chunks(response.iter_content(RESPONSE_CHUNK_SIZE), output_file,
+                                               timer, cancel, self.save_all_images)
+            except Cancelled:
+                raise
+            except Exception as e:
+                if cancel is not None and cancel.cancelled:
+                    # Closing the response from another thread surfaces as a read error
+                    raise Cancelled("Generation cancelled") from None
+                if isinstance(e, requests.exceptions.RequestException):
+                    raise GeminiAPIError(f"Error while downloading the API response: {e}")
+                raise
+            finally:
+                if unregister is not None:
+                    unregister()
+
+    @property
+    def upload_url(self):
+        return f"{self.base_url}/upload/v1beta/files"
+
+    def upload_file(self, path, mime_type, display_name=None, log=None):
+        """Uploads a file through the Files API resumable protocol.
+
+        Returns the ``file`` resource from the response, which carries the
+        ``uri`` to use in ``fileData`` parts and its ``expirationTime``.
+        """
+        size = os.path.getsize(path)
+        start_headers = {
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+        }
+        body = json.dumps({"file": {"display_name": display_name or os.path.basename(path)}})
+        with self.post(self.upload_url, body.encode("utf-8"), log, start_headers, limited=False) as response:
+            session_url = response.headers.get("X-Goog-Upload-URL")
+        if not session_url:
+            raise GeminiAPIError("File upload did not return an upload URL")
+
+        upload_headers = {
+            "Content-Type": mime_type,
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+        }
+        with open(path, "rb") as f:
+            with self.post(session_url, f, log, upload_headers, limited=False) as response:
+                try:
+                    return response.json()["file"]
+                except (ValueError, KeyError) as e:
+                    raise GeminiAPIError(f"Unexpected file upload response: {e}")
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
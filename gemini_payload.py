@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Streaming Request Body)
+# ======================================================
+
+import os
+import json
+import time
+import base64
+
+# Raw bytes read per step; a multiple of 3 so every chunk encodes to
+# base64 without padding and the chunks can simply be concatenated.
+RAW_CHUNK_SIZE = 3 * 64 * 1024
+
+def _b64_length(size):
+    """Length of the base64 encoding of size raw bytes."""
+    return 4 * ((size + 2) // 3)
+
+def payload_memory(prompt, images):
+    """Bytes a StreamingPayload for these arguments holds while it is sent.
+
+    That is the envelope, including any already-encoded sources copied into
+    it, plus one raw and one encoded read buffer; image files themselves
+    are never held whole.
+    """
+    size = len(prompt.encode("utf-8")) + RAW_CHUNK_SIZE + _b64_length(RAW_CHUNK_SIZE)
+    for source, _ in images:
+        if isinstance(source, bytes):
+            size += len(source)
+    return size
+
+class FileData:
+    """An image already uploaded through the Files API, referenced by its URI."""
+
+    def __init__(self, uri):
+        self.uri = uri
+
+class StreamingPayload:
+    """File-like generateContent request body that is produced on the fly.
+
+    The JSON envelope is small and built up front; the image parts are read
+    from disk and base64-encoded one chunk at a time while the HTTP client
+    consumes the body. Memory use stays at a few hundred KB per request no
+    matter how large the images are, and the exact length is known in
+    advance, so the request is sent with a regular Content-Length header.
+
+    Parts are ``{"text": ...}`` followed by one ``inlineData`` part per
+    ``(source, mime_type)`` in ``images``, matching the in-memory payload the
+    tool used to build with ``json=``. A source is a file path, or bytes
+    that are already base64-encoded and are sent as they are. A FileData
+    source becomes a ``fileData`` part pointing at an uploaded file instead.
+    A ``candidate_count`` above 1 asks for that many alternative answers
+    through ``generationConfig``.
+
+    With a CancelToken, every read checks it, so a cancelled job aborts the
+    upload mid-stream. With a StageTimer, building the envelope is recorded as "serialize",
+    file reads as "read", base64 encoding as "encode" and the rest of the
+    time until the body is fully consumed as "upload".
+    """
+
+    def __init__(self, prompt, images, timer=None, cancel=None, candidate_count=1):
+        started = time.perf_counter()
+        self.timer = timer
+        self.cancel = cancel
+        self._segments = []
+        head = '{"contents": [{"parts": [{"text": ' + json.dumps(prompt) + '}'
+        pending = head.encode("utf-8")
+        for source, mime_type in images:
+            if isinstance(source, FileData):
+                pending += (', {"fileData": {"mimeType": ' + json.dumps(mime_type)
+                            + ', "fileUri": ' + json.dumps(source.uri) + '}}').encode("utf-8")
+                continue
+            pending += (', {"inlineData": {"mimeType": ' + json.dumps(mime_type)
+                        + ', "data": "').encode("utf-8")
+            if isinstance(source, bytes):
+                # Already base64-encoded (e.g. a memoized reference image)
+                pending += source
+            else:
+                size = os.path.getsize(source)  # Fails early on missing files
+                self._segments.append(("bytes", pending))
+                self._segments.append(("file", (source, size)))
+                pending = b""
+            pending += b'"}}'
+        pending += b"]}]"
+        if candidate_count > 1:
+            pending += f', "generationConfig": {{"candidateCount": {int(candidate_count)}}}'.encode("utf-8")
+        pending += b"}"
+        self._segments.append(("bytes", pending))
+
+        self._length = 0
+        envelope = 0
+        for kind, value in self._segments:
+            if kind == "bytes":
+                envelope += len(value)
+            self._length += len(value) if kind == "bytes" else _b64_length(value[1])
+        self.rewind()
+        if timer is not None:
+            timer.add("serialize", time.perf_counter() - started, envelope)
+
+    def __len__(self):
+        return self._length
+
+    def rewind(self):
+        """Restarts the body from the beginning, e.g. before a retry."""
+        self.close()
+        self._chunks = self._iter_chunks()
+        self._buffer = b""
+        self._offset = 0
+        self._position = 0
+        self._send_started = None
+        self._sent = False
+        self._work = 0.0  # Seconds spent reading and encoding during this attempt
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise OSError("StreamingPayload can only be rewound to the start")
+        self.rewind()
+        return 0
+
+    def tell(self):
+        return self._position
+
+    def _iter_chunks(self):
+        for kind, value in self._segments:
+            if kind == "bytes":
+                yield value
+                continue
+            path, size = value
+            timer = self.timer
+            with open(path, "rb") as f:
+                read = 0
+                while True:
+                    t0 = time.perf_counter()
+                    chunk = f.read(RAW_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    t1 = time.perf_counter()
+                    encoded = base64.b64encode(chunk)
+                    if timer is not None:
+                        t2 = time.perf_counter()
+                        timer.add("read", t1 - t0, len(chunk))
+                        timer.add("encode", t2 - t1, len(encoded))
+                        self._work += t2 - t0
+                    read += len(chunk)
+                    yield encoded
+            if read != size:
+                # The advertised Content-Length would no longer be valid
+                raise OSError(f"{path} changed size while it was being sent")
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(RAW_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        """Returns up to size bytes of the body (everything left when size < 0)."""
+        if self.cancel is not None:
+            self.cancel.check()
+        if self.timer is not None and self._send_started is None:
+            self.timer.enter("upload")
+            self._send_started = time.perf_counter()
+        if size is None or size < 0:
+            data = self._buffer[self._offset:] + b"".join(self._chunks)
+            self._buffer, self._offset = b"", 0
+        else:
+            parts = []
+            wanted = size
+            while wanted > 0:
+                if self._offset >= len(self._buffer):
+                    self._buffer, self._offset = next(self._chunks, b""), 0
+                    if not self._buffer:
+                        break
+                piece = self._buffer[self._offset:self._offset + wanted]
+                self._offset += len(piece)
+                wanted -= len(piece)
+                parts.append(piece)
+            data = b"".join(parts)
+        self._position += len(data)
+        if self.timer is not None and self._position == self._length and not self._sent:
+            self._finish_upload()
+        return data
+
+    def _finish_upload(self):
+        """Books the network part of this attempt once the last byte has been handed over."""
+        elapsed = time.perf_counter() - self._send_started
+        self.timer.add("upload", max(0.0, elapsed - self._work), self._length)
+        self.timer.upload_finished = time.monotonic()
+        self._sent = True
+        self.timer.enter("server_wait")
+
+    def close(self):
+        chunks = getattr(self, "_chunks", None)
+        if chunks is not None:
+            chunks.close()  # Closes any image file still open in the generator
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Streaming Response Parser)
+# ======================================================
+
+import os
+import json
+import time
+import base64
+import binascii
+import tempfile
+
+from image_discovery import HEADER_BYTES, MIME_EXTENSIONS, sniff_mime_type, with_image_extension
+
+# Bytes requested from the HTTP response per read
+RESPONSE_CHUNK_SIZE = 64 * 1024
+# Upper bound on what one response stream holds at a time: the chunk being
+# parsed, a base64 remainder and the decoded block on its way to disk
+DOWNLOAD_BUFFER_BYTES = 4 * RESPONSE_CHUNK_SIZE
+# Longest string kept verbatim when a response is dumped for diagnostics
+BLOB_PREVIEW_CHARS = 80
+
+_WHITESPACE = b" \t\r\n"
+
+class ResponseFormatError(ValueError):
+    """Raised when the API response is not valid JSON or carries broken image data."""
+
+class _Base64Sink:
+    """Decodes base64 text fed in arbitrary pieces and writes the bytes to a file."""
+
+    def __init__(self, file_obj, timer=None):
+        self.file = file_obj
+        self.timer = timer
+        self.encoded_chars = 0
+        self.decoded_bytes = 0
+        self._pending = b""
+
+    def write(self, text):
+        self.encoded_chars += len(text)
+        if self.file is None:
+            return
+        data = self._pending + text
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if usable:
+            self._decode(data[:usable])
+
+    def finish(self):
+        if self.file is not None and self._pending:
+            self._decode(self._pending)
+            self._pending = b""
+
+    def _decode(self, text):
+        t0 = time.perf_counter()
+        try:
+            decoded = base64.b64decode(text, validate=True)
+        except binascii.Error as e:
+            raise ResponseFormatError(f"Invalid base64 image data in response: {e}")
+        t1 = time.perf_counter()
+        self.file.write(decoded)
+        self.decoded_bytes += len(decoded)
+        if self.timer is not None:
+            self.timer.add("decode", t1 - t0, len(decoded))
+            self.timer.add("write", time.perf_counter() - t1, len(decoded))
+
+class InlineDataStreamParser:
+    """Incremental JSON reader that pulls ``inlineData.data`` strings out of a response.
+
+    Bytes are fed as they arrive from the network. Every ``inlineData.data``
+    string is base64-decoded on the fly into the file returned by
+    ``sink_factory(index)`` (or skipped when it returns None), so the image
+    never exists in memory as a whole. The rest of the document is kept, with
+    each image string replaced by a short placeholder, and returned by
+    ``close()`` for diagnostics: text parts, finish reasons, safety ratings.
+    Decoding and file writes are recorded on ``timer`` when one is given.
+    """
+
+    def __init__(self, sink_factory, timer=None):
+        self._sink_factory = sink_factory
+        self._timer = timer
+        self._skeleton = bytearray()
+        # One frame per open container: [is_object, parent_key, current_key, expect_key]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_role = None  # "key", "value" or "image"
+        self._key_buffer = bytearray()
+        self._sink = None
+        self.images = []  # _Base64Sink per inlineData part, in response order
+
+    def feed(self, data):
+        """Consumes the next piece of the response body."""
+        i, n = 0, len(data)
+        while i < n:
+            if self._in_string:
+                i = self._consume_string(data, i)
+                continue
+            c = data[i:i + 1]
+            i += 1
+            if c in _WHITESPACE:
+                continue
+            if c == b'"':
+                self._start_string()
+                continue
+            top = self._stack[-1] if self._stack else None
+            if c == b"{" or c == b"[":
+                parent_key = top[2] if top and top[0] else (top[1] if top else None)
+                self._stack.append([c == b"{", parent_key, None, c == b"{"])
+            elif c == b"}" or c == b"]":
+                if not self._stack:
+                    raise ResponseFormatError("Unbalanced JSON in response")
+                self._stack.pop()
+            elif c == b":":
+                if top and top[0]:
+                    top[3] = False
+            elif c == b",":
+                if top and top[0]:
+                    top[3] = True
+            self._skeleton += c
+
+    def _start_string(self):
+        top = self._stack[-1] if self._stack else None
+        self._in_string = True
+        if top and top[0] and top[3]:
+            self._string_role = "key"
+            self._key_buffer = bytearray()
+        elif top and top[0] and top[2] == "data" and top[1] == "inlineData":
+            self._string_role = "image"
+            self._sink = _Base64Sink(self._sink_factory(len(self.images)), self._timer)
+            self.images.append(self._sink)
+        else:
+            self._string_role = "value"
+            self._skeleton += b'"'
+
+    def _string_text(self, text):
+        if self._string_role == "image":
+            self._sink.write(text)
+        elif self._string_role == "key":
+            self._key_buffer += text
+        else:
+            self._skeleton += text
+
+    def _consume_string(self, data, i):
+        """Handles string content starting at data[i]; returns the next index to read."""
+        if self._escape:
+            self._escape = False
+            escaped = data[i:i + 1]
+            if self._string_role != "image":
+                self._string_text(b"\\" + escaped)
+            elif escaped == b"/":
+                self._sink.write(b"/")
+            elif escaped not in b"nrt":
+                raise ResponseFormatError("Unexpected escape sequence in image data")
+            return i + 1
+
+        quote = data.find(b'"', i)
+        backslash = data.find(b"\\", i)
+        stops = [pos for pos in (quote, backslash) if pos != -1]
+        if not stops:
+            self._string_text(data[i:])
+            return len(data)
+        stop = min(stops)
+        if stop > i:
+            self._string_text(data[i:stop])
+        if stop == backslash:
+            self._escape = True
+        else:
+            self._end_string()
+        return stop + 1
+
+    def _end_string(self):
+        self._in_string = False
+        top = self._stack[-1]
+        if self._string_role == "key":
+            key = json.loads(b'"' + bytes(self._key_buffer) + b'"')
+            top[2] = key
+            self._skeleton += json.dumps(key).encode("utf-8")
+        elif self._string_role == "image":
+            self._sink.finish()
+            placeholder = f"<{self._sink.encoded_chars} base64 chars>"
+            self._skeleton += json.dumps(placeholder).encode("utf-8")
+            self._sink = None
+        else:
+            self._skeleton += b'"'
+        self._string_role = None
+
+    def close(self):
+        """Finishes parsing and returns the response with image data replaced by placeholders."""
+        if self._in_string or self._stack:
+            raise ResponseFormatError("Response ended before the JSON document was complete")
+        try:
+            return json.loads(bytes(self._skeleton))
+        except ValueError as e:
+            raise ResponseFormatError(f"Response is not valid JSON: {e}")
+
+def truncate_blobs(value, limit=BLOB_PREVIEW_CHARS):
+    """Returns a copy of a decoded JSON value with long strings shortened for display."""
+    if isinstance(value, dict):
+        return {k: truncate_blobs(v, limit) for k, v in value.items()}
+    if isinstance(value, list):
+        return [truncate_blobs(v, limit) for v in value]
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... <{len(value)} chars>"
+    return value
+
+def format_for_log(response_data):
+    """Pretty-prints a response for error messages without dumping base64 blobs."""
+    return json.dumps(truncate_blobs(response_data), indent=2)
+
+def _timed_chunks(chunks, timer):
+    """Yields chunks, recording the time spent waiting for each as "download"."""
+    chunks = iter(chunks)
+    timer.enter("download")
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        timer.add("download", time.perf_counter() - start, len(chunk))
+        yield chunk
+
+def image_output_path(output_file, index):
+    """Where image number index of a response is saved: output_file, then ``<name>_2<ext>``, ``<name>_3<ext>``..."""
+    if index == 0:
+        return output_file
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{index + 1}{ext}"
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Read once at import: os.umask() can only be queried by changing it, which is not thread-safe
+_UMASK = _current_umask()
+
+def partial_path(path):
+    """Creates an empty hidden temporary file next to path and returns its name.
+
+    Results are written there first and then renamed over their final
+    name, so other programs only ever see complete images. Discovery skips
+    hidden files, so batch and watch modes never take one for an input.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".part")
+    os.close(fd)
+    # mkstemp creates the file owner-only; give it the mode a plain open() would
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    return tmp_path
+
+def image_target(path, header):
+    """path with its extension matching the image format the header bytes start with (kept if unknown)."""
+    return with_image_extension(path, MIME_EXTENSIONS.get(sniff_mime_type(header), ""))
+
+def settle_image(tmp_path, path):
+    """Renames a finished temporary file to path, its extension fixed to the data; returns the final path."""
+    with open(tmp_path, "rb") as f:
+        target = image_target(path, f.read(HEADER_BYTES))
+    os.replace(tmp_path, target)
+    return target
+
+class _PartFile:
+    """Temporary file of one image that keeps its first bytes, which tell the format of the data."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = partial_path(path)
+        self.header = b""
+        self._file = open(self.tmp_path, "wb")
+
+    def write(self, data):
+        if len(self.header) < HEADER_BYTES:
+            self.header += data[:HEADER_BYTES - len(self.header)]
+        self._file.write(data)
+
+    @property
+    def target(self):
+        """Where the image ends up: path, with the extension of the format actually received."""
+        return image_target(self.path, self.header)
+
+    def close(self):
+        self._file.close()
+
+class ImageFiles:
+    """sink_factory for InlineDataStreamParser that saves the first image, or every image, to disk.
+
+    Images are numbered in response order across all candidates and parts,
+    so the same response always lands in the same files (see
+    image_output_path()). Each image streams into a hidden temporary file
+    next to its target. ``commit()`` renames them into place once the whole
+    response has been read, with each extension fixed to the format the
+    API actually returned, so no one sees a partial or misnamed image.
+    """
+
+    def __init__(self, output_file, keep_all=False):
+        self.output_file = output_file
+        self.keep_all = keep_all
+        self.paths = []  # Final paths, filled in by commit()
+        self._parts = []
+
+    def __call__(self, index):
+        if index and not self.keep_all:
+            return None
+        part = _PartFile(image_output_path(self.output_file, index))
+        self._parts.append(part)
+        return part
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+
+    def commit(self):
+        """Moves every image written so far to its final path and returns those paths."""
+        self.close()
+        while self._parts:
+            part = self._parts.pop(0)
+            target = part.target
+            os.replace(part.tmp_path, target)
+            self.paths.append(target)
+        return self.paths
+
+    def discard(self):
+        """Closes and removes every temporary file that was not committed."""
+        self.close()
+        for part in self._parts:
+            if os.path.exists(part.tmp_path):
+                os.remove(part.tmp_path)
+        self._parts = []
+
+def write_image_from_chunks(chunks, output_file, timer=None, cancel=None, keep_all=False):
+    """Streams a generateContent response body into output_file.
+
+    The first ``inlineData`` image is decoded as it arrives and saved as
+    output_file, with the extension changed if the image is in another
+    format (a PNG asked for as ``out.jpg`` becomes ``out.png``). Further
+    images, from more parts or more candidates, are skipped, or with
+    ``keep_all`` saved next to it as described in image_output_path().
+    Nothing appears under the final names until the response is complete
+    (see ImageFiles). Returns ``(summary, outputs)`` where summary is the
+    response without image data and outputs lists ``(path, size)`` per
+    saved image. Raises ResponseFormatError when no image is present or
+    the data is invalid. With a StageTimer, network reads, decoding and
+    writes are timed separately. With a CancelToken, the download stops at
+    the next chunk once it is cancelled and the partial files are removed.
+    """
+    files = ImageFiles(output_file, keep_all)
+    parser = InlineDataStreamParser(files, timer)
+    if timer is not None:
+        chunks = _timed_chunks(chunks, timer)
+    try:
+        try:
+            for chunk in chunks:
+                if cancel is not None:
+                    cancel.check()
+                parser.feed(chunk)
+            summary = parser.close()
+        finally:
+            files.close()
+        if not parser.images:
+            raise ResponseFormatError("No image data found in response\nFull API response:\n"
+                                      + format_for_log(summary))
+        paths = files.commit()
+    except BaseException:
+        files.discard()
+        raise
+    saved = [sink for sink in parser.images if sink.file is not None]
+    return summary, [(path, sink.decoded_bytes) for path, sink in zip(paths, saved)]
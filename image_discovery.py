@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Image Discovery)
+# ======================================================
+
+import os
+import re
+import fnmatch
+from collections import namedtuple
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif', '.avif']
+# Bytes read from the start and the end of a file to identify and sanity-check it
+HEADER_BYTES = 32
+TAIL_BYTES = 1024
+# File extension written for each image type sniff_mime_type() recognises
+MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp",
+    "image/bmp": ".bmp", "image/heic": ".heic", "image/heif": ".heif", "image/avif": ".avif",
+}
+
+ImageFile = namedtuple("ImageFile", "path size mtime_ns mime_type")
+
+def sniff_mime_type(header):
+    """Returns the image MIME type given by a file's leading magic bytes, or None."""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:2] == b"BM" and len(header) >= 14:
+        return "image/bmp"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1"):
+            return "image/heif"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+    return None
+
+def with_image_extension(path, ext):
+    """Returns path with the image extension ext (such as ``.png``).
+
+    An existing image extension is replaced, unless it already names the
+    same format (``.jpeg`` stays ``.jpeg``); any other suffix is kept and ext
+    is appended. An empty ext leaves path unchanged.
+    """
+    root, current = os.path.splitext(path)
+    current, wanted = current.lower(), ext.lower()
+    if not ext or current == wanted or {current, wanted} <= {".jpg", ".jpeg"}:
+        return path
+    if current in IMAGE_EXTENSIONS:
+        return root + ext
+    return path + ext
+
+def find_image(path):
+    """Returns path if it exists, else the same name with another image extension that does, else None.
+
+    Results are saved with the extension of their actual format, which may
+    differ from the name that was asked for.
+    """
+    if os.path.isfile(path):
+        return path
+    for ext in MIME_EXTENSIONS.values():
+        candidate = with_image_extension(path, ext)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def _is_complete(mime_type, head, tail, size):
+    """Cheap check that a file was not cut short, from its first and last bytes."""
+    if mime_type == "image/jpeg":
+        return b"\xff\xd9" in tail  # End-of-image marker, possibly followed by padding
+    if mime_type == "image/png":
+        return b"IEND" in tail
+    if mime_type == "image/gif":
+        return tail.rstrip(b"\0").endswith(b";")
+    if mime_type == "image/webp":
+        return int.from_bytes(head[4:8], "little") + 8 <= size
+    if mime_type == "image/bmp":
+        return int.from_bytes(head[2:6], "little") <= size
+    return True  # HEIF containers cannot be checked without parsing them
+
+def probe_image(path, size=None):
+    """Identifies an image by content, reading only its first and last bytes.
+
+    Returns ``(mime_type, None)`` for a usable image, or ``(None, reason)``
+    for an empty, unreadable, truncated or non-image file, so bad inputs
+    are rejected before anything is uploaded.
+    """
+    try:
+        if size is None:
+            size = os.path.getsize(path)
+        if size == 0:
+            return None, "empty file"
+        with open(path, "rb") as f:
+            head = f.read(HEADER_BYTES)
+            if size > HEADER_BYTES:
+                f.seek(max(0, size - TAIL_BYTES))
+                tail = f.read()
+            else:
+                tail = head
+    except OSError as e:
+        return None, f"unreadable ({e.strerror or e})"
+    mime_type = sniff_mime_type(head)
+    if mime_type is None:
+        return None, "not a recognised image format"
+    if not _is_complete(mime_type, head, tail, size):
+        return None, f"truncated {mime_type.split('/')[1].upper()} data"
+    return mime_type, None
+
+def _compile(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+class PathFilter:
+    """Decides which files and directories discovery looks at.
+
+    Include and exclude patterns are shell globs matched against the path
+    relative to the scanned root (with ``/`` separators) and against the
+    bare name, so ``raw/*`` and ``*.png`` both work. Excluded directories
+    are not descended into. Hidden entries are always skipped, and only
+    files with an image extension are considered.
+    """
+
+    def __init__(self, include=(), exclude=(), extensions=IMAGE_EXTENSIONS):
+        self._include = _compile(include)
+        self._exclude = _compile(exclude)
+        self.extensions = frozenset(extensions)
+
+    @staticmethod
+    def _matches(pattern, rel_path):
+        rel_path = rel_path.replace(os.sep, "/")
+        return bool(pattern.match(rel_path) or pattern.match(rel_path.rsplit("/", 1)[-1]))
+
+    def accepts_dir(self, rel_path):
+        name = os.path.basename(rel_path)
+        return not name.startswith(".") and not (self._exclude and self._matches(self._exclude, rel_path))
+
+    def accepts_file(self, rel_path):
+        name = os.path.basename(rel_path)
+        if name.startswith(".") or os.path.splitext(name)[1].lower() not in self.extensions:
+            return False
+        if self._exclude and self._matches(self._exclude, rel_path):
+            return False
+        return not self._include or self._matches(self._include, rel_path)
+
+def iter_image_entries(roots, recursive=False, path_filter=None, rel_root=""):
+    """Yields ``(os.DirEntry, relative path)`` for candidate image files under roots, lazily.
+
+    Directories are read with os.scandir one at a time, so memory use does
+    not grow with the size of a directory and the first results arrive
+    before the walk is done. Symbolic links to directories are not
+    followed. Unreadable directories are skipped. ``rel_root`` is the
+    relative path of the roots themselves when they lie inside a larger
+    tree the filter's patterns refer to.
+    """
+    path_filter = path_filter or PathFilter()
+    for root in roots:
+        pending = [(root, rel_root)]
+        while pending:
+            folder, rel_folder = pending.pop()
+            try:
+                it = os.scandir(folder)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    rel_path = f"{rel_folder}/{entry.name}" if rel_folder else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and path_filter.accepts_dir(rel_path):
+                                pending.append((entry.path, rel_path))
+                        elif path_filter.accepts_file(rel_path) and entry.is_file():
+                            yield entry, rel_path
+                    except OSError:
+                        continue  # Vanished while we were looking at it
+
+def discover_images(roots, recursive=False, path_filter=None, on_skip=None):
+    """Yields an ImageFile for every usable image under roots, lazily.
+
+    Each candidate is identified from its magic bytes rather than its
+    extension, so ``mime_type`` is the real format. Zero-byte, truncated
+    and non-image files are passed to ``on_skip(path, reason)`` instead.
+    """
+    for entry, _ in iter_image_entries(roots, recursive, path_filter):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        mime_type, problem = probe_image(entry.path, st.st_size)
+        if problem is None:
+            yield ImageFile(entry.path, st.st_size, st.st_mtime_ns, mime_type)
+        elif on_skip is not None:
+            on_skip(entry.path, problem)
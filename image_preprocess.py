@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Upload Pre-processing)
+# ======================================================
+
+import os
+import shutil
+import tempfile
+import itertools
+import mimetypes
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from image_discovery import HEADER_BYTES, sniff_mime_type
+from memory_budget import reserved
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_QUALITY = 90
+MIN_QUALITY = 50
+# Formats the Gemini API accepts as inline image data
+UPLOAD_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+def guess_mime_type(path):
+    """Returns an image's MIME type from its magic bytes, else from its name, defaulting to JPEG."""
+    try:
+        with open(path, "rb") as f:
+            mime_type = sniff_mime_type(f.read(HEADER_BYTES))
+    except OSError:
+        mime_type = None
+    if mime_type:
+        return mime_type
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type and mime_type.startswith("image/"):
+        return mime_type
+    return "image/jpeg"
+
+class PreprocessOptions:
+    """How images are shrunk before upload.
+
+    Images are scaled so their longest edge is at most ``max_edge`` pixels and
+    re-encoded as ``image_format``. With ``max_bytes`` set, quality and then
+    size are lowered step by step until the encoded file fits the budget.
+    """
+
+    def __init__(self, max_edge=DEFAULT_MAX_EDGE, max_bytes=None, image_format="JPEG",
+                 quality=DEFAULT_QUALITY):
+        image_format = image_format.upper().replace("JPG", "JPEG")
+        if image_format not in UPLOAD_MIME_TYPES:
+            raise ValueError(f"Unsupported upload format: {image_format}")
+        self.max_edge = max_edge
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.quality = quality
+
+    def signature(self):
+        """Stable description of the options, used to tell cached results apart."""
+        return f"preprocess:{self.max_edge}:{self.max_bytes}:{self.image_format}:{self.quality}"
+
+class PreprocessResult:
+    """Outcome of preparing one image: the file to upload and its size before and after."""
+
+    def __init__(self, source_path, path, mime_type, original_bytes, upload_bytes):
+        self.source_path = source_path
+        self.path = path
+        self.mime_type = mime_type
+        self.original_bytes = original_bytes
+        self.upload_bytes = upload_bytes
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.upload_bytes
+
+def _encode(img, out_path, options, quality):
+    """Saves img in the upload format and returns the encoded size."""
+    save_kwargs = {"optimize": True} if options.image_format in ("JPEG", "PNG") else {}
+    if options.image_format in ("JPEG", "WEBP"):
+        save_kwargs["quality"] = quality
+    img.save(out_path, options.image_format, **save_kwargs)
+    return os.path.getsize(out_path)
+
+def preprocess_image(source_path, out_path, options):
+    """Downscales and re-encodes source_path into out_path. Runs in a worker process.
+
+    When the re-encoded file would not be smaller than an original that is
+    already in an accepted format and within limits, the original is kept.
+    Returns a PreprocessResult.
+    """
+    original_bytes = os.path.getsize(source_path)
+    out_path += _EXTENSIONS[options.image_format]
+
+    with Image.open(source_path) as img:
+        source_format = img.format
+        needs_resize = max(img.size) > options.max_edge
+        # Let the JPEG decoder skip straight to a reduced scale when possible
+        img.draft("RGB", (options.max_edge, options.max_edge))
+        img = ImageOps.exif_transpose(img)
+        if options.image_format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.thumbnail((options.max_edge, options.max_edge), Image.LANCZOS)
+
+        quality = options.quality
+        size = _encode(img, out_path, options, quality)
+        while options.max_bytes and size > options.max_bytes:
+            if options.image_format != "PNG" and quality > MIN_QUALITY:
+                quality = max(MIN_QUALITY, quality - 10)
+            elif min(img.size) > 64:
+                img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            else:
+                break
+            size = _encode(img, out_path, options, quality)
+
+    keep_original = (
+        source_format in UPLOAD_MIME_TYPES
+        and not needs_resize
+        and original_bytes <= size
+        and (not options.max_bytes or original_bytes <= options.max_bytes)
+    )
+    if keep_original:
+        os.remove(out_path)
+        return PreprocessResult(source_path, source_path, UPLOAD_MIME_TYPES[source_format],
+                                original_bytes, original_bytes)
+    return PreprocessResult(source_path, out_path, UPLOAD_MIME_TYPES[options.image_format],
+                            original_bytes, size)
+
+def decode_memory(path, max_edge=DEFAULT_MAX_EDGE):
+    """Estimates the bytes preprocess_image() holds for path: the decoded pixels plus the thumbnail.
+
+    Only the image header is read. JPEGs count at the reduced scale their
+    decoder will be asked for.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            scale = 1
+            if img.format == "JPEG":
+                while scale < 8 and min(width, height) // (scale * 2) >= max_edge:
+                    scale *= 2
+    except Exception:
+        return max_edge * max_edge * 8  # preprocess_image() will report the actual problem
+    width, height = width // scale, height // scale
+    shrink = min(1.0, max_edge / max(width, height, 1))
+    return width * height * 4 + int(width * shrink) * int(height * shrink) * 4
+
+class Preprocessor:
+    """Runs preprocess_image on a process pool and owns the temporary output files.
+
+    ``prepare()`` may be called from many threads at once; the work is spread
+    over ``workers`` processes (all cores by default). With ``workers=0`` the
+    images are processed in the calling thread, which suits one-off GUI runs.
+    With a MemoryBudget, each call first reserves the estimated decode
+    memory of all its images, so large images queue instead of being
+    decoded all at once.
+    """
+
+    def __init__(self, options=None, workers=None, budget=None):
+        if not PIL_AVAILABLE:
+            raise RuntimeError("Image pre-processing needs Pillow: pip install Pillow")
+        self.options = options or PreprocessOptions()
+        self._workers = workers
+        self.budget = budget
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._temp_dir = tempfile.mkdtemp(prefix="gemini-preprocess-")
+        self._counter = itertools.count()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._workers)
+            return self._pool
+
+    def prepare(self, paths):
+        """Preprocesses the given images concurrently; returns PreprocessResults in order."""
+        out_paths = [os.path.join(self._temp_dir, f"{next(self._counter)}_{os.path.basename(p)}")
+                     for p in paths]
+        memory = sum(decode_memory(p, self.options.max_edge) for p in paths) if self.budget is not None else 0
+        with reserved(self.budget, "preprocess", memory):
+            if self._workers == 0:
+                return [preprocess_image(p, o, self.options) for p, o in zip(paths, out_paths)]
+            pool = self._executor()
+            futures = [pool.submit(preprocess_image, p, o, self.options) for p, o in zip(paths, out_paths)]
+            return [f.result() for f in futures]
+
+    def release(self, results):
+        """Deletes the temporary files behind results once they have been uploaded."""
+        for result in results:
+            if result.path != result.source_path and os.path.exists(result.path):
+                os.remove(result.path)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
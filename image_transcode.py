@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Output Transcoding)
+# ======================================================
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from gemini_response import partial_path
+from image_discovery import HEADER_BYTES, MIME_EXTENSIONS, sniff_mime_type, with_image_extension
+from image_preprocess import decode_memory
+from memory_budget import reserved
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+DEFAULT_QUALITY = 92
+# Formats results can be converted to, by their Pillow names
+OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+class TranscodeOptions:
+    """Which format results are saved in: ``image_format`` at ``quality`` (JPEG and WebP only)."""
+
+    def __init__(self, image_format, quality=DEFAULT_QUALITY):
+        image_format = image_format.upper().replace("JPG", "JPEG")
+        if image_format not in OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported output format: {image_format}")
+        self.image_format = image_format
+        self.quality = quality
+
+    def signature(self):
+        """Stable description of the options, used to tell finished jobs apart."""
+        return f"transcode:{self.image_format}:{self.quality}"
+
+    @property
+    def mime_type(self):
+        return OUTPUT_MIME_TYPES[self.image_format]
+
+    @property
+    def extension(self):
+        return MIME_EXTENSIONS[self.mime_type]
+
+def transcode_image(path, options):
+    """Re-encodes the image at path in the requested format. Runs in a worker process.
+
+    The result is written to a temporary file and renamed into place with
+    the matching extension; the original is removed if the name changed.
+    Returns ``(path, size)`` of the result.
+    """
+    target = with_image_extension(path, options.extension)
+    tmp_path = partial_path(target)
+    try:
+        with Image.open(path) as img:
+            if options.image_format == "JPEG" and img.mode != "RGB":
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            save_kwargs = {"optimize": True} if options.image_format in ("JPEG", "PNG") else {}
+            if options.image_format in ("JPEG", "WEBP"):
+                save_kwargs["quality"] = options.quality
+            img.save(tmp_path, options.image_format, **save_kwargs)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if os.path.abspath(target) != os.path.abspath(path):
+        os.remove(path)
+    return target, os.path.getsize(target)
+
+def _needs_transcode(path, options):
+    with open(path, "rb") as f:
+        return sniff_mime_type(f.read(HEADER_BYTES)) != options.mime_type
+
+class Transcoder:
+    """Converts saved results to one format on a process pool, after their API call has finished.
+
+    ``convert()`` may be called from many threads at once. Images already
+    in the requested format are left alone. With ``workers=0`` the work is
+    done in the calling thread, which suits one-off runs. With a
+    MemoryBudget, the decoded pixels are reserved as "transcode" first.
+    """
+
+    def __init__(self, options, workers=None, budget=None):
+        if not PIL_AVAILABLE:
+            raise RuntimeError("Output conversion needs Pillow: pip install Pillow")
+        self.options = options
+        self._workers = workers
+        self.budget = budget
+        self.converted = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._workers)
+            return self._pool
+
+    def convert(self, paths):
+        """Converts the images at paths as needed; returns their final paths in order."""
+        todo = [p for p in paths if _needs_transcode(p, self.options)]
+        if not todo:
+            return list(paths)
+        # An edge no image reaches: pixels are decoded at full size
+        memory = sum(decode_memory(p, 1 << 16) for p in todo) if self.budget is not None else 0
+        with reserved(self.budget, "transcode", memory):
+            if self._workers == 0:
+                results = [transcode_image(p, self.options) for p in todo]
+            else:
+                pool = self._executor()
+                futures = [pool.submit(transcode_image, p, self.options) for p in todo]
+                results = [f.result() for f in futures]
+        with self._lock:
+            self.converted += len(todo)
+        renamed = {p: target for p, (target, _) in zip(todo, results)}
+        return [renamed.get(p, p) for p in paths]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -5,20 +5,41 @@
 # ======================================================
 
 import os
-import base64
-import json
+import time
+import asyncio
 import datetime
 import sys
 import subprocess
-import binascii
 from pathlib import Path
 
+from gemini_response import ResponseFormatError, image_output_path, partial_path, settle_image
+from image_discovery import IMAGE_EXTENSIONS
+from image_preprocess import PIL_AVAILABLE, Preprocessor, guess_mime_type
+from image_transcode import TranscodeOptions, Transcoder
+from reference_memo import ReferenceMemo
+from result_cache import ResultCache, cache_key
+from stage_metrics import DEFAULT_JSONL_PATH, MetricsRecorder, StageTimer
+
 try:
     import requests
 except ImportError:
     print("The 'requests' library is not installed. Please install it by running: pip install requests")
     sys.exit(1)
 
+from gemini_client import GeminiAPIError, GeminiClient
+
+DEFAULT_PROMPT = "Recreate a new very realistic, sharp and defined color image, high resolution, with current quality standards. As if it was taken by a digital reflex camera."
+# Suggested custom prompts, also the default variants of a prompt sweep
+PROMPT_EXAMPLES = [
+    "Transform into artistic watercolor style",
+    "Recreate in vintage black and white",
+    "Enhance quality and increase sharpness",
+    "Transform into modern digital illustration",
+]
+
+class RecreationError(Exception):
+    """Raised when a recreation job cannot be completed."""
+
 def print_header():
     """Prints the tool's header."""
     print("=======================================")
@@ -43,13 +64,11 @@ def select_image_path(prompt_message="Input image"):
 
     choice = input("➡ Choose an option (1-3): ")
     
-    img_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-
     if choice == '1':
         return input("📂 Enter the full image file path: ")
     elif choice == '2':
         print("📂 Image files in current directory:")
-        files = [f for f in os.listdir('.') if os.path.splitext(f)[1].lower() in img_extensions]
+        files = [f for f in os.listdir('.') if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS]
         if not files:
             print("No image files found")
             return None
@@ -64,7 +83,7 @@ def select_image_path(prompt_message="Input image"):
             return input("📂 Enter the full path: ")
         
         print(f"📂 Image files in {docs_dir}:")
-        files = [f for f in os.listdir(docs_dir) if os.path.splitext(f)[1].lower() in img_extensions]
+        files = [f for f in os.listdir(docs_dir) if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS]
         if not files:
             print("No image files found")
             return None
@@ -94,10 +113,8 @@ def get_output_path(input_path):
     elif choice == '2':
         return os.path.join('.', f"{input_name}_recreated_{timestamp}.jpg")
     elif choice == '3':
-        output_file = input("📂 Enter the full output file path: ")
-        if not output_file.lower().endswith(('.jpg', '.jpeg')):
-            output_file += ".jpg"
-        return output_file
+        # The extension is set to the format of the returned image once it arrives
+        return input("📂 Enter the full output file path: ")
     else:
         print("❌ Invalid option")
         return None
@@ -111,26 +128,310 @@ def get_custom_prompt():
     choice = input("➡ Choose an option (1-2): ")
 
     if choice == '1':
-        return "Recreate a new very realistic, sharp and defined color image, high resolution, with current quality standards. As if it was taken by a digital reflex camera."
+        return DEFAULT_PROMPT
     elif choice == '2':
         print("💡 Prompt examples:")
-        print("   - 'Transform into artistic watercolor style'")
-        print("   - 'Recreate in vintage black and white'")
-        print("   - 'Enhance quality and increase sharpness'")
-        print("   - 'Transform into modern digital illustration'")
+        for example in PROMPT_EXAMPLES:
+            print(f"   - '{example}'")
         return input("📝 Enter your prompt: ")
     else:
         print("❌ Invalid option")
         return None
 
-def encode_image_to_base64(file_path):
-    """Reads an image file and returns its base64 encoded string."""
+def _reference_parts(ref_paths, preprocessor, ref_memo, ref_uploader, log):
+    """Returns (images, inline_bytes) for the references, via the upload index or the memo."""
+    encoder = ref_memo if ref_memo is not None else ReferenceMemo(0)
+    images = []
+    inline_bytes = 0
+    for ref_path in ref_paths:
+        if ref_uploader is not None:
+            try:
+                images.append(ref_uploader.get(ref_path, preprocessor, log))
+                continue
+            except (GeminiAPIError, OSError) as e:
+                log(f"⚠️ Could not upload reference {ref_path}, sending it inline: {e}")
+        try:
+            ref = encoder.get(ref_path, preprocessor)
+        except Exception as e:
+            raise RecreationError(f"Failed to encode image {ref_path}: {e}")
+        images.append((ref.data, ref.mime_type))
+        inline_bytes += ref.upload_bytes
+    return images, inline_bytes
+
+def _generate(client, prompt, images, output_file, log, timer, cancel):
+    """Calls the API, turning response and file errors into RecreationError."""
     try:
-        with open(file_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    except IOError as e:
-        print(f"❌ Error reading file {file_path}: {e}")
-        return None
+        return client.generate_to_file(prompt, images, output_file, log, timer, cancel)
+    except ResponseFormatError as e:
+        raise RecreationError(f"Could not extract image from response. Error: {e}")
+    except IOError as io_e:
+        raise RecreationError(f"Error writing to file {output_file}: {io_e}")
+
+def _discard(*paths):
+    """Removes outputs that a cancelled job should not leave behind."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def request_key(client, prompt, img_path, ref_paths=(), preprocessor=None):
+    """Returns the result cache key of a request, covering every setting that changes what is sent."""
+    extra = (preprocessor.options.signature() if preprocessor else "") + client.request_signature
+    return cache_key(client.model_url, prompt, img_path, ref_paths, extra)
+
+def _cache_get(cache, key, output_file):
+    """Restores a cached result; returns its output paths, or None on a miss.
+
+    Further images of a multi-image result are stored as ``<key>.<n>``.
+    Each image is copied to a temporary file and renamed into place with
+    the extension of its format, as freshly generated results are.
+    """
+    outputs = []
+    while True:
+        target = image_output_path(output_file, len(outputs))
+        tmp_path = partial_path(target)
+        try:
+            if not cache.get(f"{key}.{len(outputs)}" if outputs else key, tmp_path, count=not outputs):
+                os.remove(tmp_path)
+                return outputs or None
+            outputs.append(settle_image(tmp_path, target))
+        except BaseException:
+            _discard(tmp_path)
+            raise
+
+def _cache_put(cache, key, outputs):
+    for index, path in enumerate(outputs):
+        cache.put(key if index == 0 else f"{key}.{index}", path)
+
+def _finish_outputs(result, paths, transcoder, timer, log):
+    """Converts the saved images with the Transcoder, if any, and records their final paths in result."""
+    if transcoder is not None:
+        try:
+            with timer.stage("transcode"):
+                converted = transcoder.convert(paths)
+        except Exception as e:
+            _discard(*paths)
+            raise RecreationError(f"Error converting output to {transcoder.options.image_format}: {e}")
+        for old, new in zip(paths, converted):
+            if new != old:
+                log(f"🎨 Converted to {transcoder.options.image_format}: {new}")
+        paths = converted
+    result["output_file"] = paths[0]
+    result["outputs"] = paths
+    return result
+
+def recreate_image(client, img_path, ref_paths, prompt, output_file, log=print, cache=None,
+                   preprocessor=None, ref_memo=None, ref_uploader=None, timer=None, cancel=None,
+                   key=None, shared_input=False, transcoder=None):
+    """Runs a single recreation through a GeminiClient without any user interaction.
+
+    Progress messages are passed to ``log``; failures raise RecreationError.
+    When a ResultCache is given, identical requests are served from it
+    without calling the API. With a Preprocessor, images are downscaled and
+    re-encoded before upload. With a ReferenceMemo, reference images are
+    read, pre-processed and encoded once and then reused by later jobs.
+    With a ReferenceUploader, references are uploaded once through the
+    Files API and sent as file URIs, falling back to inline data when the
+    server no longer accepts a URI. Wall time and bytes per stage are
+    recorded on ``timer`` (a StageTimer), if given. A CancelToken passed as
+    ``cancel`` is checked between stages and aborts the API call mid-stream;
+    the job then ends with Cancelled and leaves no output file behind.
+    ``key`` is the request's request_key() if the caller has already computed
+    it, which saves hashing the images twice. With ``shared_input``, the
+    input image goes through the memo or the upload index like the
+    references, so jobs that send one input with many prompts prepare it
+    only once.
+
+    Results keep the format the API returned, so output_file's extension
+    is corrected when it does not match (``out.jpg`` may be saved as
+    ``out.png``). With a Transcoder, they are converted to its format
+    instead, once the API call is over; the cache keeps the original.
+
+    Returns a dict with the path of the first image as ``output_file``,
+    every saved image in ``outputs`` (more than one when the client saves
+    all images), whether it came from the cache and the image bytes before
+    and after pre-processing.
+    """
+    timer = timer if timer is not None else StageTimer(img_path)
+    check = cancel.check if cancel is not None else (lambda: None)
+    check()
+    source_paths = [img_path] + list(ref_paths)
+    result = {"output_file": output_file, "cached": False}
+    try:
+        result["original_bytes"] = sum(os.path.getsize(p) for p in source_paths)
+    except OSError as e:
+        raise RecreationError(f"Error reading file {e.filename}: {e}")
+    result["upload_bytes"] = result["original_bytes"]
+
+    if cache is not None:
+        with timer.stage("cache"):
+            if key is None:
+                key = request_key(client, prompt, img_path, ref_paths, preprocessor)
+            hit = _cache_get(cache, key, output_file)
+        if hit:
+            if cancel is not None and cancel.cancelled:
+                _discard(*hit)
+                cancel.check()
+            log(f"♻️ Cache hit, result copied to: {hit[0]}")
+            result["cached"] = True
+            result["upload_bytes"] = 0
+            return _finish_outputs(result, hit, transcoder, timer, log)
+
+    # With a memo or an upload index, references are prepared once and reused across jobs
+    shared_refs = ref_memo is not None or ref_uploader is not None
+    to_read = [img_path] if shared_refs else source_paths
+    shared_paths = list(ref_paths)
+    if shared_refs and shared_input:
+        to_read, shared_paths = [], source_paths
+    prepared = []
+    try:
+        if preprocessor is not None and to_read:
+            log("🗜️ Pre-processing images...")
+            timer.enter("preprocess")
+            start = time.perf_counter()
+            try:
+                prepared = preprocessor.prepare(to_read)
+            except Exception as e:
+                raise RecreationError(f"Error pre-processing images: {e}")
+            images = [(r.path, r.mime_type) for r in prepared]
+            upload_bytes = sum(r.upload_bytes for r in prepared)
+            timer.add("preprocess", time.perf_counter() - start, upload_bytes)
+        else:
+            images = [(p, guess_mime_type(p)) for p in to_read]
+            upload_bytes = sum(os.path.getsize(p) for p in to_read)
+
+        check()
+        ref_images = []
+        if shared_refs:
+            timer.enter("encode")
+            start = time.perf_counter()
+            ref_images, ref_bytes = _reference_parts(shared_paths, preprocessor, ref_memo, ref_uploader, log)
+            timer.add("encode", time.perf_counter() - start, ref_bytes)
+            upload_bytes += ref_bytes
+
+        result["upload_bytes"] = upload_bytes
+        if preprocessor is not None:
+            log(f"🗜️ Upload size {result['original_bytes']} -> {upload_bytes} bytes")
+
+        check()
+        log("🚀 Sending request to Gemini API...")
+        try:
+            summary, outputs = _generate(client, prompt, images + ref_images, output_file, log, timer, cancel)
+        except GeminiAPIError as e:
+            if ref_uploader is None or not shared_paths or e.status_code not in (400, 403, 404):
+                raise RecreationError(str(e))
+            # Most likely an uploaded reference expired or was deleted server-side
+            log(f"⚠️ Request with uploaded references failed ({e.status_code}), retrying inline...")
+            for ref_path in shared_paths:
+                ref_uploader.forget(ref_path, preprocessor)
+            ref_images, ref_bytes = _reference_parts(shared_paths, preprocessor, ref_memo, None, log)
+            result["upload_bytes"] += ref_bytes
+            try:
+                summary, outputs = _generate(client, prompt, images + ref_images, output_file, log, timer,
+                                             cancel)
+            except GeminiAPIError as retry_e:
+                raise RecreationError(str(retry_e))
+    finally:
+        if preprocessor is not None:
+            preprocessor.release(prepared)
+    if cancel is not None and cancel.cancelled:
+        _discard(*(path for path, _ in outputs))
+        cancel.check()
+    log(f"🔍 Response data keys: {list(summary.keys())}")
+    for path, size in outputs:
+        log(f"📏 Length of decoded image: {size} bytes")
+        log(f"📁 File written to: {path}")
+    log(f"⏱️ Stages: {timer.format_summary()}")
+
+    first = outputs[0][0]
+    if not (os.path.isfile(first) and os.path.getsize(first) > 0):
+        raise RecreationError("Could not create output file or file is empty")
+    paths = [path for path, _ in outputs]
+
+    if cache is not None:
+        try:
+            with timer.stage("cache"):
+                _cache_put(cache, key, paths)
+        except OSError as e:
+            log(f"⚠️ Could not store result in cache: {e}")
+    return _finish_outputs(result, paths, transcoder, timer, log)
+
+async def recreate_image_async(client, img_path, ref_paths, prompt, output_file, log=print, cache=None,
+                               ref_memo=None, timer=None, key=None, on_event=None, transcoder=None):
+    """recreate_image() for an AsyncGeminiClient, run as a coroutine on the caller's event loop.
+
+    Hashing, cache copies, reference encoding and output conversion run in
+    worker threads so the loop stays free for other requests. ``on_event`` receives the
+    client's stream events (progress, text, image, done) as they arrive.
+    Pre-processing and Files API references are not supported here.
+    Returns the same dict as recreate_image().
+    """
+    timer = timer if timer is not None else StageTimer(img_path)
+    source_paths = [img_path] + list(ref_paths)
+    result = {"output_file": output_file, "cached": False}
+    try:
+        result["original_bytes"] = sum(os.path.getsize(p) for p in source_paths)
+    except OSError as e:
+        raise RecreationError(f"Error reading file {e.filename}: {e}")
+    result["upload_bytes"] = result["original_bytes"]
+
+    if cache is not None:
+        start = time.perf_counter()
+        if key is None:
+            key = await asyncio.to_thread(request_key, client, prompt, img_path, ref_paths)
+        hit = await asyncio.to_thread(_cache_get, cache, key, output_file)
+        timer.add("cache", time.perf_counter() - start)
+        if hit:
+            log(f"♻️ Cache hit, result copied to: {hit[0]}")
+            result["cached"] = True
+            result["upload_bytes"] = 0
+            return await asyncio.to_thread(_finish_outputs, result, hit, transcoder, timer, log)
+
+    images = [(img_path, guess_mime_type(img_path))]
+    if ref_memo is not None:
+        timer.enter("encode")
+        start = time.perf_counter()
+        ref_images, ref_bytes = await asyncio.to_thread(_reference_parts, ref_paths, None, ref_memo, None, log)
+        timer.add("encode", time.perf_counter() - start, ref_bytes)
+        images += ref_images
+    else:
+        images += [(p, guess_mime_type(p)) for p in ref_paths]
+
+    log("🚀 Streaming request to Gemini API...")
+    try:
+        summary, outputs = await client.generate_to_file(prompt, images, output_file, log, timer, on_event)
+    except GeminiAPIError as e:
+        raise RecreationError(str(e))
+    except ResponseFormatError as e:
+        raise RecreationError(f"Could not extract image from response. Error: {e}")
+    except IOError as io_e:
+        raise RecreationError(f"Error writing to file {output_file}: {io_e}")
+    for path, size in outputs:
+        log(f"📏 Length of decoded image: {size} bytes")
+        log(f"📁 File written to: {path}")
+    paths = [path for path, _ in outputs]
+
+    if cache is not None:
+        try:
+            start = time.perf_counter()
+            await asyncio.to_thread(_cache_put, cache, key, paths)
+            timer.add("cache", time.perf_counter() - start)
+        except OSError as e:
+            log(f"⚠️ Could not store result in cache: {e}")
+    return await asyncio.to_thread(_finish_outputs, result, paths, transcoder, timer, log)
+
+def open_file(path):
+    """Opens a file with the platform's default viewer."""
+    if sys.platform == "win32":
+        os.startfile(path)
+    elif sys.platform == "darwin":
+        subprocess.run(["open", path])
+    else:
+        try:
+            subprocess.run(["xdg-open", path])
+        except FileNotFoundError:
+            print(f"\n👁️ To view the image, open: {path}")
 
 def main():
     """Main function to run the script."""
@@ -168,13 +469,33 @@ def main():
     if not custom_prompt:
         sys.exit(1)
 
+    # Pre-processing
+    preprocess = False
+    if PIL_AVAILABLE:
+        answer = input("\n🗜️ Downscale and re-encode images before upload to save bandwidth? (y/N): ")
+        preprocess = answer.lower() == 'y'
+
+    # Output format
+    output_format = None
+    if PIL_AVAILABLE:
+        answer = input("\n🎨 Save the result as jpeg, png or webp? (default: the format Gemini returns): ")
+        if answer.strip().lower() in ("jpeg", "jpg", "png", "webp"):
+            output_format = answer.strip().upper()
+
+    # Candidates
+    candidates = input("\n🎲 Alternative images to request in one call (1-4, default 1): ")
+    candidates = int(candidates) if candidates.isdigit() and 1 <= int(candidates) <= 4 else 1
+
     # Configuration summary
     print("\n📋 CONFIGURATION SUMMARY:")
     print(f"   Input:  {img_path}")
     for i, ref in enumerate(ref_paths, 1):
         print(f"   Reference {i}: {ref}")
     print(f"   Output: {output_file}")
-    print(f"   Prompt: {custom_prompt}\n")
+    print(f"   Prompt: {custom_prompt}")
+    print(f"   Pre-processing: {'on' if preprocess else 'off'}")
+    print(f"   Output format: {output_format or 'as returned'}")
+    print(f"   Candidates: {candidates}\n")
 
     confirm = input("🚀 Proceed with generation? (y/N): ")
     if confirm.lower() != 'y':
@@ -183,107 +504,44 @@ def main():
 
     print("\n🔄 Starting recreation process...")
 
-    # Image encoding
-    print("📸 Encoding image to base64...")
-    img_base64 = encode_image_to_base64(img_path)
-    if not img_base64:
-        sys.exit(1)
-
-    ref_base64_list = []
-    for i, ref_path in enumerate(ref_paths, 1):
-        print(f"📸 Encoding reference {i} to base64...")
-        ref_base64 = encode_image_to_base64(ref_path)
-        if not ref_base64:
-            sys.exit(1)
-        ref_base64_list.append(ref_base64)
-
-    # Build JSON payload
-    parts = [
-        {"text": custom_prompt},
-        {"inlineData": {"mimeType": "image/jpeg", "data": img_base64}}
-    ]
-    for ref_b64 in ref_base64_list:
-        parts.append({"inlineData": {"mimeType": "image/jpeg", "data": ref_b64}})
-    
-    payload = {"contents": [{"parts": parts}]}
-    
-    # API call
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image-preview:generateContent"
-    headers = {"x-goog-api-key": api_key, "Content-Type": "application/json"}
-
-    print("🚀 Sending request to Gemini API...")
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()  # Raise an exception for bad status codes
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error during API call: {e}")
-        sys.exit(1)
-
-    print("🔄 Processing response...")
+    preprocessor = Preprocessor(workers=0) if preprocess else None
+    transcoder = Transcoder(TranscodeOptions(output_format), workers=0) if output_format else None
+    client = GeminiClient(api_key, candidate_count=candidates)
+    timer = StageTimer(img_path)
+    start = time.monotonic()
+    error = None
+    result = {}
     try:
-        response_data = response.json()
-        print(f"🔍 Response data keys: {list(response_data.keys())}")
-        
-        # Extract the image data from the response - UPDATED CODE
-        candidate = response_data['candidates'][0]
-        content = candidate['content']
-        
-        # Search for the image data in all parts
-        img_data_b64 = None
-        for part in content['parts']:
-            if 'inlineData' in part:
-                img_data_b64 = part['inlineData']['data']
-                break
-        
-        if not img_data_b64:
-            print("❌ No image data found in response")
-            print("Full API response:")
-            print(json.dumps(response_data, indent=2))
-            sys.exit(1)
-            
-        print(f"📏 Length of base64 data: {len(img_data_b64)}")
-
-        try:
-            decoded_img = base64.b64decode(img_data_b64)
-            print(f"📏 Length of decoded image: {len(decoded_img)} bytes")
-            with open(output_file, "wb") as f:
-                f.write(decoded_img)
-            print(f"📁 File written to: {output_file}")
-        except binascii.Error as decode_e:
-            print(f"❌ Error decoding base64 data from API response: {decode_e}")
-            print("The API might have returned invalid base64 or text instead of an image.")
-            sys.exit(1)
-        except IOError as io_e:
-            print(f"❌ Error writing to file {output_file}: {io_e}")
-            sys.exit(1)
-
-    except (KeyError, IndexError, TypeError) as e:
-        print(f"❌ Could not extract image from response. Error: {e}")
-        print("Full API response:")
-        print(json.dumps(response_data, indent=2))
-        sys.exit(1)
-
-    # Verify output
-    if os.path.isfile(output_file) and os.path.getsize(output_file) > 0:
-        print("\n🎉 SUCCESS!")
-        print(f"✅ Recreated image saved as: {output_file}")
-        
-        # Open file
-        if sys.platform == "win32":
-            os.startfile(output_file)
-        elif sys.platform == "darwin":
-            subprocess.run(["open", output_file])
-        else:
-            try:
-                subprocess.run(["xdg-open", output_file])
-            except FileNotFoundError:
-                print(f"\n👁️ To view the image, open: {output_file}")
-
-    else:
-        print("❌ Error: Could not create output file or file is empty")
-        print("API response received:")
-        print(json.dumps(response.json(), indent=2))
+        result = recreate_image(client, img_path, ref_paths, custom_prompt, output_file,
+                                cache=ResultCache(), preprocessor=preprocessor, timer=timer, transcoder=transcoder)
+    except RecreationError as e:
+        error = str(e)
+        print(f"❌ {e}")
         sys.exit(1)
+    finally:
+        client.close()
+        if preprocessor is not None:
+            preprocessor.close()
+        if transcoder is not None:
+            transcoder.close()
+        if DEFAULT_JSONL_PATH:
+            recorder = MetricsRecorder(DEFAULT_JSONL_PATH)
+            recorder.record(timer, ok=error is None, output=result.get("output_file", output_file),
+                            elapsed=round(time.monotonic() - start, 6),
+                            cached=result.get("cached", False), error=error)
+            recorder.close()
+
+    print("\n🎉 SUCCESS!")
+    print(f"✅ Recreated image saved as: {result['output_file']}")
+    for extra in result["outputs"][1:]:
+        print(f"✅ Additional image saved as: {extra}")
+
+    # Open file
+    open_file(result["output_file"])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Any command-line arguments switch to the non-interactive batch mode
+        from batch_recreation import batch_main
+        sys.exit(batch_main(sys.argv[1:]))
+    main()
@@ -5,8 +5,9 @@
 # ======================================================
 
 import os
-import base64
 import json
+import time
+import queue
 import datetime
 import sys
 import threading
@@ -14,7 +15,18 @@ import subprocess
 from pathlib import Path
 import customtkinter as ctk
 from tkinter import filedialog, messagebox, Scrollbar
-from PIL import Image, ImageTk
+from PIL import ImageTk
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import CancelToken, Cancelled
+from image_preprocess import Preprocessor
+from rate_limiter import AdaptiveLimiter
+from reference_memo import ReferenceMemo
+from result_cache import ResultCache
+from stage_metrics import DEFAULT_JSONL_PATH, MetricsRecorder, ProgressEstimator, StageTimer
+from thumbnails import ThumbnailCache
 
 try:
     import requests
@@ -22,10 +34,45 @@ except ImportError:
     messagebox.showerror("Errore", "La libreria 'requests' non è installata. Installala con: pip install requests")
     sys.exit(1)
 
+from batch_recreation import BatchJob
+from gemini_client import GeminiClient
+from interactive_recreation import IMAGE_EXTENSIONS, recreate_image
+from result_gallery import ResultGallery
+
+# How often the Tk main loop applies updates queued by worker threads
+UI_POLL_MS = 50
+DEFAULT_GUI_WORKERS = 2
+MAX_GUI_WORKERS = 8
+# Light/dark mode text color of the default CustomTkinter theme
+ROW_TEXT_COLOR = ("gray14", "gray84")
+# File dialog filter for every format discovery accepts
+IMAGE_FILE_PATTERNS = " ".join(f"*{ext}" for ext in IMAGE_EXTENSIONS)
+
+class QueuedJob(BatchJob):
+    """A BatchJob in the GUI queue, with its own settings, state and cancel token."""
+
+    def __init__(self, input_path, ref_paths, prompt, output_path, api_key, preprocess):
+        super().__init__(input_path, ref_paths, prompt, output_path)
+        self.api_key = api_key
+        self.preprocess = preprocess
+        self.status = "queued"  # queued, running, done, failed or cancelled
+        self.token = CancelToken()
+        self.timer = None  # StageTimer while running
+        self.row = None  # (frame, status label, progress bar, action button)
+
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
 
 class GeminiRecreationGUI:
+    PHASE_LABELS = {
+        "preprocess": "Optimizing images...",
+        "encode": "Encoding reference images...",
+        "upload": "Sending to Gemini API...",
+        "server_wait": "Waiting for Gemini...",
+        "download": "Receiving result...",
+        "preview": "Loading result...",
+    }
+
     def __init__(self):
         self.root = ctk.CTk()
         self.root.title("Gemini Image Recreation Tool")
@@ -33,19 +80,35 @@ class GeminiRecreationGUI:
         self.root.resizable(True, True)
 
         # Variables
-        self.api_key = ""
         self.input_path = ""
         self.ref_paths = []
-        self.output_path = ""
-        self.custom_prompt = ""
-        self.is_processing = False
+        self.clients = {}  # api key -> GeminiClient
+        self.lock = threading.Lock()
+        self.limiter = AdaptiveLimiter()
+        self.result_cache = ResultCache()
+        self.preprocessor = None
+        self.ref_memo = ReferenceMemo()
+        self.thumbnails = ThumbnailCache()  # Previews are decoded on its worker threads
+        self.progress = ProgressEstimator()
+        self.ui_queue = queue.Queue()  # (callback, args) posted by worker threads
+
+        # Job queue
+        self.jobs = []  # Every job shown in the queue panel
+        self.pending = deque()  # Jobs waiting for a worker
+        self.session_jobs = []  # Jobs since the queue was last idle, for aggregate progress
+        self.session_started = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=MAX_GUI_WORKERS)
 
         # Image data
         self.input_image = None
         self.result_image = None
 
+        self.gallery = ResultGallery(self.root, self.post_ui, self.open_output_file)
+
         self.setup_ui()
         self.center_window()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.process_ui_queue()
 
     def center_window(self):
         self.root.update_idletasks()
@@ -165,6 +228,16 @@ class GeminiRecreationGUI:
 
         self.prompt_var.trace("w", self.on_prompt_radio_change)
 
+        # Upload options
+        upload_frame = ctk.CTkFrame(main_frame)
+        upload_frame.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(upload_frame, text="🗜️ Upload Options", font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(10, 0))
+
+        self.preprocess_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(upload_frame, text="Downscale and re-encode images before upload (max 2048 px)",
+                        variable=self.preprocess_var).pack(anchor="w", padx=10, pady=(0, 10))
+
         # Progress and Control
         control_frame = ctk.CTkFrame(main_frame)
         control_frame.pack(fill="x", pady=(0, 10))
@@ -182,10 +255,37 @@ class GeminiRecreationGUI:
         self.start_btn = ctk.CTkButton(button_frame, text="🚀 Start Generation", command=self.start_generation, height=40)
         self.start_btn.pack(side="left", expand=True, fill="x", padx=(0, 10))
 
-        self.cancel_btn = ctk.CTkButton(button_frame, text="❌ Cancel", command=self.cancel_generation, fg_color="transparent",
+        self.cancel_btn = ctk.CTkButton(button_frame, text="❌ Cancel All", command=self.cancel_generation, fg_color="transparent",
                                        state="disabled", height=40)
         self.cancel_btn.pack(side="left", expand=True, fill="x")
 
+        # Job queue
+        queue_frame = ctk.CTkFrame(main_frame)
+        queue_frame.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(queue_frame, text="📋 Job Queue", font=ctk.CTkFont(weight="bold")).pack(anchor="w", padx=10, pady=(10, 0))
+
+        queue_btn_frame = ctk.CTkFrame(queue_frame, fg_color="transparent")
+        queue_btn_frame.pack(fill="x", padx=10, pady=(0, 5))
+
+        ctk.CTkButton(queue_btn_frame, text="Queue Files", command=self.queue_files).pack(side="left")
+        ctk.CTkButton(queue_btn_frame, text="Queue Folder", command=self.queue_folder).pack(side="left", padx=(10, 0))
+        ctk.CTkButton(queue_btn_frame, text="Clear Finished", command=self.clear_finished_jobs,
+                      fg_color="transparent").pack(side="left", padx=(10, 0))
+        ctk.CTkButton(queue_btn_frame, text="🖼️ Gallery", command=self.gallery.show,
+                      width=100).pack(side="left", padx=(10, 0))
+
+        self.workers_var = ctk.StringVar(value=str(DEFAULT_GUI_WORKERS))
+        ctk.CTkOptionMenu(queue_btn_frame, values=[str(n) for n in (1, 2, 4, 8)], variable=self.workers_var,
+                          width=70).pack(side="right")
+        ctk.CTkLabel(queue_btn_frame, text="Parallel jobs:").pack(side="right", padx=(0, 5))
+
+        self.queue_label = ctk.CTkLabel(queue_frame, text="No jobs queued", anchor="w")
+        self.queue_label.pack(fill="x", padx=10)
+
+        self.queue_list_frame = ctk.CTkScrollableFrame(queue_frame, height=160)
+        self.queue_list_frame.pack(fill="x", padx=10, pady=(0, 10))
+
     def on_output_radio_change(self, *args):
         if self.output_var.get() == "custom":
             self.custom_output_entry.configure(state="normal")
@@ -201,7 +301,7 @@ class GeminiRecreationGUI:
     def select_input_image(self):
         file_path = filedialog.askopenfilename(
             title="Select Input Image",
-            filetypes=[("Image files", "*.jpg *.jpeg *.png *.gif *.bmp *.webp")]
+            filetypes=[("Image files", IMAGE_FILE_PATTERNS)]
         )
         if file_path:
             self.input_path = file_path
@@ -210,18 +310,24 @@ class GeminiRecreationGUI:
             self.load_input_preview()
 
     def load_input_preview(self):
-        try:
-            img = Image.open(self.input_path)
-            img.thumbnail((200, 200))
-            self.input_image = ImageTk.PhotoImage(img)
-            self.input_image_label.configure(image=self.input_image, text="Input Image")
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not load image preview: {e}")
+        self.input_image_label.configure(text="Input Image: Loading...")
+        self.thumbnails.request(self.input_path,
+                                lambda path, thumb, error: self.post_ui(self.show_input_preview, path, thumb, error))
+
+    def show_input_preview(self, path, thumb, error):
+        if path != self.input_path:
+            return  # Another image was selected while this one was decoding
+        if error is not None:
+            self.input_image_label.configure(text="Input Image: No image loaded")
+            messagebox.showerror("Error", f"Could not load image preview: {error}")
+            return
+        self.input_image = ImageTk.PhotoImage(thumb)
+        self.input_image_label.configure(image=self.input_image, text="Input Image")
 
     def add_reference_image(self):
         file_path = filedialog.askopenfilename(
             title="Select Reference Image",
-            filetypes=[("Image files", "*.jpg *.jpeg *.png *.gif *.bmp *.webp")]
+            filetypes=[("Image files", IMAGE_FILE_PATTERNS)]
         )
         if file_path:
             self.ref_paths.append(file_path)
@@ -254,178 +360,390 @@ class GeminiRecreationGUI:
             self.update_ref_list()
 
     def cancel_generation(self):
-        self.is_processing = False
+        # Aborts running uploads/downloads, discards partial output and drops queued jobs
+        for job in self.jobs:
+            if job.status in ("queued", "running"):
+                self.cancel_job(job)
         self.status_label.configure(text="Cancelled", text_color="orange")
-        self.start_btn.configure(state="normal")
-        self.cancel_btn.configure(state="disabled")
-        self.progress_bar.set(0)
 
-    def start_generation(self):
-        # Validate inputs
-        self.api_key = self.api_entry.get().strip()
-        if not self.api_key:
+    def read_settings(self):
+        """Validates the shared settings; returns (api_key, ref_paths, prompt) or None."""
+        api_key = self.api_entry.get().strip()
+        if not api_key:
             messagebox.showwarning("Warning", "Please enter your Gemini API key")
-            return
-
-        if not self.input_path:
-            messagebox.showwarning("Warning", "Please select an input image")
-            return
-
-        if not os.path.isfile(self.input_path):
-            messagebox.showerror("Error", "Input image file does not exist")
-            return
+            return None
 
         # Validate reference images
         for ref in self.ref_paths:
             if not os.path.isfile(ref):
                 messagebox.showerror("Error", f"Reference image file does not exist: {ref}")
-                return
+                return None
 
-        # Set output path
+        # Set prompt
+        if self.prompt_var.get() == "default":
+            prompt = "Recreate a new very realistic, sharp and defined color image, high resolution, with current quality standards. As if it was taken by a digital reflex camera."
+        else:
+            prompt = self.prompt_textbox.get("1.0", "end-1c").strip()
+            if not prompt:
+                messagebox.showwarning("Warning", "Please enter a custom prompt")
+                return None
+        return api_key, list(self.ref_paths), prompt
+
+    def build_output_path(self, input_path, single=True):
+        """Output path for input_path per the output options; a custom path is a directory for multiple files."""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        input_name = Path(input_path).stem
         if self.output_var.get() == "auto_same":
-            input_dir = os.path.dirname(self.input_path)
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            input_name = Path(self.input_path).stem
-            self.output_path = os.path.join(input_dir, f"{input_name}_recreated_{timestamp}.jpg")
+            path = os.path.join(os.path.dirname(input_path), f"{input_name}_recreated_{timestamp}.jpg")
         elif self.output_var.get() == "auto_current":
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            input_name = Path(self.input_path).stem
-            self.output_path = os.path.join('.', f"{input_name}_recreated_{timestamp}.jpg")
+            path = os.path.join('.', f"{input_name}_recreated_{timestamp}.jpg")
         else:
             custom_path = self.custom_output_entry.get().strip()
             if not custom_path:
                 messagebox.showwarning("Warning", "Please enter a custom output path")
-                return
-            if not custom_path.lower().endswith(('.jpg', '.jpeg')):
-                custom_path += ".jpg"
-            self.output_path = custom_path
-
-        # Set prompt
-        if self.prompt_var.get() == "default":
-            self.custom_prompt = "Recreate a new very realistic, sharp and defined color image, high resolution, with current quality standards. As if it was taken by a digital reflex camera."
-        else:
-            self.custom_prompt = self.prompt_textbox.get("1.0", "end-1c").strip()
-            if not self.custom_prompt:
-                messagebox.showwarning("Warning", "Please enter a custom prompt")
-                return
+                return None
+            if single:
+                return custom_path  # Its extension is set to the format of the returned image
+            path = os.path.join(custom_path, f"{input_name}_recreated_{timestamp}.jpg")
+
+        # Several jobs for the same input within one second would otherwise share a name.
+        # "-N" rather than "_N", which names the further images of a result (image_output_path)
+        taken = {job.output_path for job in self.jobs}
+        base, ext = os.path.splitext(path)
+        counter = 2
+        while path in taken:
+            path = f"{base}-{counter}{ext}"
+            counter += 1
+        return path
 
-        # Start processing
-        self.is_processing = True
-        self.start_btn.configure(state="disabled")
-        self.cancel_btn.configure(state="normal")
-        self.progress_bar.set(0)
-        self.status_label.configure(text="Starting generation...", text_color="blue")
-
-        # Run in separate thread
-        threading.Thread(target=self.process_generation, daemon=True).start()
-
-    def process_generation(self):
-        try:
-            self.status_label.configure(text="Encoding images...")
-            self.progress_bar.set(0.2)
-
-            # Encode input image
-            img_base64 = self.encode_image_to_base64(self.input_path)
-            if not img_base64:
-                raise Exception("Failed to encode input image")
-
-            # Encode reference images
-            ref_base64_list = []
-            for ref_path in self.ref_paths:
-                ref_base64 = self.encode_image_to_base64(ref_path)
-                if not ref_base64:
-                    raise Exception(f"Failed to encode reference image: {ref_path}")
-                ref_base64_list.append(ref_base64)
-
-            if self.is_processing:
-                self.status_label.configure(text="Sending to Gemini API...")
-                self.progress_bar.set(0.5)
-
-                # API call
-                payload = self.build_payload(self.custom_prompt, img_base64, ref_base64_list)
-                response = requests.post(
-                    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image-preview:generateContent",
-                    headers={"x-goog-api-key": self.api_key, "Content-Type": "application/json"},
-                    json=payload
-                )
-                response.raise_for_status()
-
-                self.status_label.configure(text="Processing response...")
-                self.progress_bar.set(0.7)
-
-                # Extract and save image
-                self.save_result_image(response.json(), self.output_path)
+    def start_generation(self):
+        if not self.input_path:
+            messagebox.showwarning("Warning", "Please select an input image")
+            return
 
-                self.status_label.configure(text="Loading result...")
-                self.progress_bar.set(0.9)
+        if not os.path.isfile(self.input_path):
+            messagebox.showerror("Error", "Input image file does not exist")
+            return
 
-                # Load result preview
-                self.load_result_preview()
+        self.enqueue([self.input_path], single=True)
 
-                self.progress_bar.set(1.0)
-                self.status_label.configure(text="✅ Generation completed!", text_color="green")
+    def queue_files(self):
+        paths = filedialog.askopenfilenames(
+            title="Select Input Images",
+            filetypes=[("Image files", IMAGE_FILE_PATTERNS)]
+        )
+        if paths:
+            self.enqueue(list(paths), single=False)
 
-                # Open file
-                self.open_output_file()
+    def queue_folder(self):
+        folder = filedialog.askdirectory(title="Select a Folder of Images")
+        if not folder:
+            return
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                 if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+                 and os.path.isfile(os.path.join(folder, name))]
+        if not paths:
+            messagebox.showinfo("Info", "No image files found in that folder")
+            return
+        self.enqueue(paths, single=False)
 
+    def enqueue(self, input_paths, single):
+        """Adds one job per input with the current prompt, references and options."""
+        settings = self.read_settings()
+        if settings is None:
+            return
+        api_key, ref_paths, prompt = settings
+        if not self.active_jobs():
+            # The queue was idle: start a new session for the aggregate progress and throughput
+            self.session_jobs = []
+            self.session_started = time.monotonic()
+        for input_path in input_paths:
+            output_path = self.build_output_path(input_path, single)
+            if output_path is None:
+                return
+            job = QueuedJob(input_path, ref_paths, prompt, output_path, api_key, self.preprocess_var.get())
+            self.jobs.append(job)
+            self.session_jobs.append(job)
+            self.pending.append(job)
+            self.add_job_row(job)
+        self.cancel_btn.configure(state="normal")
+        self.status_label.configure(text=f"Queued {len(input_paths)} job(s)", text_color="blue")
+        self.schedule_jobs()
+
+    def active_jobs(self):
+        return [job for job in self.jobs if job.status in ("queued", "running")]
+
+    def schedule_jobs(self):
+        """Starts queued jobs while fewer than the selected number are running."""
+        limit = int(self.workers_var.get())
+        running = sum(1 for job in self.jobs if job.status == "running")
+        while self.pending and running < limit:
+            job = self.pending.popleft()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            job.timer = StageTimer(job.input_path, on_phase=lambda phase, job=job: self.on_phase(job, phase))
+            self.update_job_row(job, "Starting...")
+            self.executor.submit(self.process_generation, job, job.token, job.timer)
+            running += 1
+
+    def cancel_job(self, job):
+        job.token.cancel()
+        job.status = "cancelled"
+        job.timer = None
+        self.update_job_row(job, "Cancelled")
+
+    def retry_job(self, job):
+        job.token = CancelToken()
+        job.ok, job.error, job.cached = False, None, False
+        job.status = "queued"
+        if not self.active_jobs():
+            self.session_jobs = []
+            self.session_started = time.monotonic()
+        if job not in self.session_jobs:
+            self.session_jobs.append(job)
+        self.pending.append(job)
+        self.update_job_row(job, "Queued")
+        self.cancel_btn.configure(state="normal")
+        self.schedule_jobs()
+
+    def job_action(self, job):
+        if job.status in ("queued", "running"):
+            self.cancel_job(job)
+        elif job.status in ("failed", "cancelled"):
+            self.retry_job(job)
+        elif job.status == "done":
+            threading.Thread(target=self.open_output_file, args=(job.outputs[0],), daemon=True).start()
+
+    def clear_finished_jobs(self):
+        for job in [j for j in self.jobs if j.status not in ("queued", "running")]:
+            self.jobs.remove(job)
+            if job in self.session_jobs:
+                self.session_jobs.remove(job)
+            job.row[0].destroy()
+            job.row = None
+
+    def add_job_row(self, job):
+        frame = ctk.CTkFrame(self.queue_list_frame)
+        frame.pack(fill="x", pady=(0, 5))
+
+        name = os.path.basename(job.input_path)
+        if job.ref_paths:
+            name += f" (+{len(job.ref_paths)} ref)"
+        ctk.CTkLabel(frame, text=name, anchor="w", width=220).pack(side="left", padx=(5, 0))
+
+        status_label = ctk.CTkLabel(frame, text="Queued", anchor="w", width=170)
+        status_label.pack(side="left", padx=(10, 0))
+
+        bar = ctk.CTkProgressBar(frame, width=140)
+        bar.pack(side="left", padx=(10, 0))
+        bar.set(0)
+
+        action_btn = ctk.CTkButton(frame, text="Cancel", width=80, command=lambda: self.job_action(job))
+        action_btn.pack(side="right", padx=(0, 5))
+        job.row = (frame, status_label, bar, action_btn)
+
+    def update_job_row(self, job, text, color=None):
+        if job.row is None:
+            return
+        _, status_label, bar, action_btn = job.row
+        status_label.configure(text=text, text_color=color or ("gray50" if job.status == "cancelled" else ROW_TEXT_COLOR))
+        if job.status in ("queued", "running"):
+            action_btn.configure(text="Cancel")
+        elif job.status == "done":
+            action_btn.configure(text="Open")
+            bar.set(1.0)
+        else:
+            action_btn.configure(text="Retry")
+            bar.set(0)
+        if job.status == "queued":
+            bar.set(0)
+
+    def get_client(self, api_key):
+        """One pooled client per API key, shared by all workers."""
+        with self.lock:
+            client = self.clients.get(api_key)
+            if client is None:
+                client = self.clients[api_key] = GeminiClient(api_key, limiter=self.limiter)
+            return client
+
+    def get_preprocessor(self):
+        with self.lock:
+            if self.preprocessor is None:
+                self.preprocessor = Preprocessor(workers=0)
+            return self.preprocessor
+
+    def process_generation(self, job, token, timer):
+        """Runs one queued job on a worker thread; widget updates go through post_ui()."""
+        start = time.monotonic()
+        error = None
+        result = {}
+        try:
+            token.check()
+            preprocessor = self.get_preprocessor() if job.preprocess else None
+            out_dir = os.path.dirname(job.output_path)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+
+            # Cache lookup, pre-processing, reference encoding and the API call itself;
+            # the response image is decoded straight into the output file
+            result = recreate_image(self.get_client(job.api_key), job.input_path, job.ref_paths, job.prompt,
+                                    job.output_path, log=lambda message: None, cache=self.result_cache,
+                                    preprocessor=preprocessor, ref_memo=self.ref_memo,
+                                    timer=timer, cancel=token)
+            job.outputs = result["outputs"]  # The extension may differ from output_path's
+
+            # Load result preview
+            token.check()
+            timer.enter("preview")
+            with timer.stage("preview"):
+                preview = self.make_preview(job.outputs[0])
+            token.check()
+
+            if not result["cached"]:
+                self.progress.learn(timer)
+            job.elapsed = time.monotonic() - start
+            self.post_ui(self.finish_generation, job, token, preview, result["cached"])
+
+        except Cancelled:
+            error = "cancelled"
+            if result.get("outputs"):
+                # Cancelled after the files were written; don't leave them behind
+                self.post_ui(self.discard_outputs, job, token, result["outputs"])
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Generation failed: {str(e)}"))
-            self.status_label.configure(text=f"❌ Error: {str(e)[:50]}...", text_color="red")
+            error = str(e)
+            self.post_ui(self.fail_generation, job, token, error)
         finally:
-            self.is_processing = False
-            self.root.after(0, lambda: self.start_btn.configure(state="normal"))
-            self.root.after(0, lambda: self.cancel_btn.configure(state="disabled"))
-
-    def encode_image_to_base64(self, file_path):
-        try:
-            with open(file_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except IOError as e:
-            return None
-
-    def build_payload(self, prompt, img_base64, ref_base64_list):
-        parts = [{"text": prompt}, {"inlineData": {"mimeType": "image/jpeg", "data": img_base64}}]
-        for ref_b64 in ref_base64_list:
-            parts.append({"inlineData": {"mimeType": "image/jpeg", "data": ref_b64}})
-        return {"contents": [{"parts": parts}]}
-
-    def save_result_image(self, response_data, output_path):
-        candidate = response_data['candidates'][0]
-        content = candidate['content']
-
-        img_data_b64 = None
-        for part in content['parts']:
-            if 'inlineData' in part:
-                img_data_b64 = part['inlineData']['data']
+            if DEFAULT_JSONL_PATH:
+                self.record_metrics(timer, result.get("output_file", job.output_path), error,
+                                    result.get("cached", False), time.monotonic() - start)
+
+    def post_ui(self, callback, *args):
+        """Queues a widget update for the Tk main loop; safe to call from any thread."""
+        self.ui_queue.put((callback, args))
+
+    def process_ui_queue(self):
+        """Applies queued widget updates, starts queued jobs and refreshes progress (main thread)."""
+        while True:
+            try:
+                callback, args = self.ui_queue.get_nowait()
+            except queue.Empty:
                 break
+            callback(*args)
+        self.schedule_jobs()
+        self.update_queue_progress()
+        self.root.after(UI_POLL_MS, self.process_ui_queue)
+
+    def update_queue_progress(self):
+        """Per-job bars from stage timings, plus the aggregate bar and throughput."""
+        total = len(self.session_jobs)
+        finished = 0.0
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+        for job in self.session_jobs:
+            counts[job.status] += 1
+            if job.status == "running" and job.timer is not None:
+                fraction = self.progress.progress(job.timer)
+                job.row[2].set(fraction)
+                finished += fraction
+            elif job.status != "queued":
+                finished += 1
+        if not total:
+            return
 
-        if not img_data_b64:
-            raise Exception("No image data found in response")
-
-        decoded_img = base64.b64decode(img_data_b64)
-        with open(output_path, "wb") as f:
-            f.write(decoded_img)
+        self.progress_bar.set(finished / total)
+        elapsed = time.monotonic() - self.session_started
+        rate = counts["done"] / elapsed * 60 if elapsed > 0 else 0.0
+        text = f"{counts['running']} running, {counts['queued']} queued, {counts['done']} done"
+        if counts["failed"]:
+            text += f", {counts['failed']} failed"
+        if counts["cancelled"]:
+            text += f", {counts['cancelled']} cancelled"
+        self.queue_label.configure(text=f"{text} · {rate:.1f} images/min")
+        if not counts["running"] and not counts["queued"]:
+            self.cancel_btn.configure(state="disabled")
+
+    def on_phase(self, job, phase):
+        """Called from a worker thread when a job moves to a new stage."""
+        text = self.PHASE_LABELS.get(phase)
+        if text:
+            self.post_ui(self.show_phase, job, job.token, text)
+
+    def show_phase(self, job, token, text):
+        if token is job.token and job.status == "running":
+            self.update_job_row(job, text)
+
+    def finish_generation(self, job, token, preview, cached):
+        if token is not job.token or job.status != "running":
+            return  # Cancelled meanwhile
+        job.status = "done"
+        job.ok = True
+        job.cached = cached
+        job.timer = None
+        self.gallery.add_result(job.input_path, job.outputs[0])
+        if preview is not None:
+            self.result_image = ImageTk.PhotoImage(preview)
+            self.result_image_label.configure(image=self.result_image, text="Result Image")
+        message = "Loaded from cache!" if cached else "Generation completed!"
+        self.update_job_row(job, f"{message} ({job.elapsed:.1f}s)", "green")
+        self.status_label.configure(text=f"✅ {os.path.basename(job.outputs[0])}: {message}", text_color="green")
+        if len(self.session_jobs) == 1:
+            # A single generation opens its result, as before; queued batches do not
+            threading.Thread(target=self.open_output_file, args=(job.outputs[0],), daemon=True).start()
+
+    def fail_generation(self, job, token, error):
+        if token is not job.token or job.status != "running":
+            return
+        job.status = "failed"
+        job.error = error
+        job.timer = None
+        self.update_job_row(job, f"❌ {error[:40]}", "red")
+        self.status_label.configure(text=f"❌ Error: {error[:50]}...", text_color="red")
+        if len(self.session_jobs) == 1:
+            messagebox.showerror("Error", f"Generation failed: {error}")
+
+    def discard_outputs(self, job, token, paths):
+        # A retry reuses the output names, so once it has started the files may be its own
+        if token is not job.token:
+            return
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
 
-    def load_result_preview(self):
+    def record_metrics(self, timer, output_path, error, cached, elapsed):
         try:
-            img = Image.open(self.output_path)
-            img.thumbnail((200, 200))
-            self.result_image = ImageTk.PhotoImage(img)
-            self.result_image_label.configure(image=self.result_image, text="Result Image")
-        except Exception as e:
-            pass  # Silently fail for preview
+            recorder = MetricsRecorder(DEFAULT_JSONL_PATH)
+            recorder.record(timer, ok=error is None, output=output_path, elapsed=round(elapsed, 6),
+                            cached=cached, error=error)
+            recorder.close()
+        except OSError:
+            pass  # Metrics are best effort
+
+    def make_preview(self, path):
+        """Thumbnail of path for the result preview, decoded on the calling worker thread."""
+        try:
+            return self.thumbnails.get(path)
+        except Exception:
+            return None  # Silently fail for preview
 
-    def open_output_file(self):
+    def open_output_file(self, path):
         try:
             if sys.platform == "win32":
-                os.startfile(self.output_path)
+                os.startfile(path)
             elif sys.platform == "darwin":
-                subprocess.run(["open", self.output_path])
+                subprocess.run(["open", path])
             else:
-                subprocess.run(["xdg-open", self.output_path])
+                subprocess.run(["xdg-open", path])
         except FileNotFoundError:
             pass  # Silently fail if no default opener
 
+    def on_close(self):
+        for job in self.active_jobs():
+            job.token.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.thumbnails.close()
+        self.gallery.close()
+        self.root.destroy()
+
     def run(self):
         self.root.mainloop()
 
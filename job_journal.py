@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Batch Job Journal)
+# ======================================================
+
+import os
+import time
+import sqlite3
+import threading
+
+from image_discovery import find_image
+
+JOURNAL_NAME = ".recreation_journal.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    output_path TEXT PRIMARY KEY,
+    input_path TEXT NOT NULL,
+    inputs_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    cached INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    elapsed REAL
+)
+"""
+
+class JobJournal:
+    """Durable record of batch jobs in SQLite, so an interrupted run can resume.
+
+    Each job is keyed by its output path and stores the content hash of its
+    inputs (the result cache key), status, attempt count, error and timing.
+    A job counts as done only if it finished with the same inputs hash;
+    jobs left "running" by a crash are simply run again. Safe to share
+    between worker threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps per-job commits cheap and the file readable while a batch runs
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def lookup(self, output_path):
+        """Returns the journal row of a job as a dict, or None if it never ran."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT input_path, inputs_hash, status, attempts, error, cached, elapsed "
+                "FROM jobs WHERE output_path = ?", (os.path.abspath(output_path),)).fetchone()
+        if row is None:
+            return None
+        keys = ("input_path", "inputs_hash", "status", "attempts", "error", "cached", "elapsed")
+        return dict(zip(keys, row))
+
+    def is_done(self, output_path, inputs_hash):
+        """True if the job already succeeded with these inputs and its output still exists, in any image format."""
+        row = self.lookup(output_path)
+        return (row is not None and row["status"] == "done" and row["inputs_hash"] == inputs_hash
+                and find_image(output_path) is not None)
+
+    def start(self, output_path, input_path, inputs_hash):
+        """Marks a job as running and returns its attempt number (1 for the first run)."""
+        key = os.path.abspath(output_path)
+        with self._lock, self._db:
+            row = self._db.execute("SELECT inputs_hash, attempts FROM jobs WHERE output_path = ?",
+                                   (key,)).fetchone()
+            # Changed inputs make it a new job as far as attempts are concerned
+            attempts = row[1] + 1 if row is not None and row[0] == inputs_hash else 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (output_path, input_path, inputs_hash, status, attempts, "
+                "error, cached, started_at, finished_at, elapsed) "
+                "VALUES (?, ?, ?, 'running', ?, NULL, 0, ?, NULL, NULL)",
+                (key, os.path.abspath(input_path), inputs_hash, attempts, time.time()))
+        return attempts
+
+    def finish(self, output_path, ok, error=None, elapsed=0.0, cached=False):
+        """Records the outcome of a job started with start()."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, cached = ?, finished_at = ?, elapsed = ? "
+                "WHERE output_path = ?",
+                ("done" if ok else "failed", error, int(cached), time.time(), round(elapsed, 6),
+                 os.path.abspath(output_path)))
+
+    def counts(self):
+        """Returns the number of journaled jobs per status."""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (In-Flight Memory Budget)
+# ======================================================
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+DEFAULT_BUDGET_BYTES = int(os.getenv("GEMINI_MEMORY_BUDGET_MB", "0")) * 1024 * 1024  # 0 = unlimited
+# How often a waiter with a cancel token, or on an event loop, checks again
+POLL_INTERVAL = 0.05
+
+class MemoryBudget:
+    """Process-wide cap on the bytes that jobs in flight hold in memory, with backpressure.
+
+    Before a stage reads, decodes or buffers data it reserves an estimate
+    of what it is about to hold under a stage name ("preprocess", "upload",
+    "download", ...), and releases it when done. Once reservations would
+    exceed ``max_bytes``, new ones wait in arrival order, so a large image
+    is not starved by a stream of small ones. A reservation larger than the
+    whole budget is let through when nothing else is in flight rather than
+    blocking forever. With ``max_bytes=0`` nothing ever waits, but current
+    and peak usage are still tracked per stage for reporting.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BUDGET_BYTES):
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._queue = deque()  # Tickets of waiting reservations, oldest first
+        self.in_use = 0
+        self.peak = 0
+        self._stage_use = {}
+        self._stage_peak = {}
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _admit(self, ticket, stage, nbytes):
+        """Takes the reservation if it is first in line and fits. Caller holds the lock."""
+        if self._queue[0] is not ticket:
+            return False
+        if self.max_bytes and self.in_use and self.in_use + nbytes > self.max_bytes:
+            return False
+        self._queue.popleft()
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+        used = self._stage_use[stage] = self._stage_use.get(stage, 0) + nbytes
+        self._stage_peak[stage] = max(self._stage_peak.get(stage, 0), used)
+        self._cond.notify_all()  # The next in line may fit as well
+        return True
+
+    def _withdraw(self, ticket):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def _count_wait(self, seconds):
+        if seconds > 0.001:
+            with self._cond:
+                self.waits += 1
+                self.wait_seconds += seconds
+
+    def acquire(self, stage, nbytes, cancel=None):
+        """Blocks until nbytes can be reserved for stage; returns the seconds spent waiting.
+
+        With a CancelToken, the wait ends with Cancelled once it is cancelled.
+        """
+        started = time.perf_counter()
+        ticket = object()
+        try:
+            with self._cond:
+                self._queue.append(ticket)
+                while not self._admit(ticket, stage, nbytes):
+                    if cancel is not None:
+                        cancel.check()
+                    self._cond.wait(POLL_INTERVAL if cancel is not None else None)
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        waited = time.perf_counter() - started
+        self._count_wait(waited)
+        return waited
+
+    async def acquire_async(self, stage, nbytes):
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread."""
+        started = time.perf_counter()
+        ticket = object()
+        try:
+            with self._cond:
+                self._queue.append(ticket)
+            while True:
+                with self._cond:
+                    if self._admit(ticket, stage, nbytes):
+                        break
+                await asyncio.sleep(POLL_INTERVAL)
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        waited = time.perf_counter() - started
+        self._count_wait(waited)
+        return waited
+
+    def release(self, stage, nbytes):
+        with self._cond:
+            self.in_use -= nbytes
+            self._stage_use[stage] -= nbytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, stage, nbytes, timer=None, cancel=None):
+        """Holds a reservation for the duration of the block; waiting is booked as "queue" on timer."""
+        waited = self.acquire(stage, nbytes, cancel)
+        if timer is not None and waited:
+            timer.add("queue", waited)
+        try:
+            yield
+        finally:
+            self.release(stage, nbytes)
+
+    @asynccontextmanager
+    async def reserve_async(self, stage, nbytes, timer=None):
+        waited = await self.acquire_async(stage, nbytes)
+        if timer is not None and waited:
+            timer.add("queue", waited)
+        try:
+            yield
+        finally:
+            self.release(stage, nbytes)
+
+    def stats(self):
+        """Returns the budget, current and peak bytes overall and per stage, and the waits so far."""
+        with self._cond:
+            return {"max_bytes": self.max_bytes, "in_use": self.in_use, "peak": self.peak,
+                    "stage_peaks": dict(self._stage_peak), "waiting": len(self._queue),
+                    "waits": self.waits, "wait_seconds": round(self.wait_seconds, 3)}
+
+def reserved(budget, stage, nbytes, timer=None, cancel=None):
+    """budget.reserve(), or a no-op context when there is no budget."""
+    if budget is None:
+        return nullcontext()
+    return budget.reserve(stage, nbytes, timer, cancel)
+
+def reserved_async(budget, stage, nbytes, timer=None):
+    """budget.reserve_async(), or a no-op async context when there is no budget."""
+    if budget is None:
+        return nullcontext()
+    return budget.reserve_async(stage, nbytes, timer)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Local Mock API Server)
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from image_discovery import HEADER_BYTES, sniff_mime_type
+
+class MockConfig:
+    """Behaviour of the mock server; can be changed at runtime through POST /__config."""
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, image_kb=512, image_file=""):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image_kb = image_kb
+        self.image_file = image_file
+
+    def update(self, values):
+        for name in ("latency", "jitter", "error_rate", "image_kb", "image_file"):
+            if name in values:
+                setattr(self, name, type(getattr(self, name))(values[name]))
+
+    def as_dict(self):
+        return {"latency": self.latency, "jitter": self.jitter,
+                "error_rate": self.error_rate, "image_kb": self.image_kb, "image_file": self.image_file}
+
+class MockState:
+    """Counters and uploaded files shared by all handler threads."""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.files = {}
+        self._images = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def count(self, received=0, sent=0, error=False):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+            self.errors += int(error)
+
+    def image_b64(self, image_kb, image_file=""):
+        """Returns (base64 text, MIME type) of the answer image, built once per setting.
+
+        That is image_file if one is configured, else a pseudo-random
+        'JPEG' of image_kb kilobytes.
+        """
+        with self.lock:
+            image = self._images.get((image_kb, image_file))
+            if image is None:
+                if image_file:
+                    with open(image_file, "rb") as f:
+                        raw = f.read()
+                    mime_type = sniff_mime_type(raw[:HEADER_BYTES]) or "image/png"
+                else:
+                    raw = b"\xff\xd8\xff\xe0" + os.urandom(max(0, image_kb * 1024 - 4))
+                    mime_type = "image/jpeg"
+                image = self._images[(image_kb, image_file)] = (base64.b64encode(raw), mime_type)
+            return image
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors,
+                    "bytes_received": self.bytes_received, "bytes_sent": self.bytes_sent,
+                    "config": self.config.as_dict()}
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    """Stand-in for generateContent, streamGenerateContent, the Files API upload endpoints and the control endpoints."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _read_body(self):
+        length = self.headers.get("Content-Length")
+        if length is not None:
+            return self.rfile.read(int(length))
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return b""
+
+    def _send(self, status, body=b"", headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def _send_json(self, status, value, headers=None):
+        return self._send(status, json.dumps(value).encode("utf-8"), headers)
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            self._send_json(200, self.state.stats())
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split("?")[0]
+        if path == "/__config":
+            self.state.config.update(json.loads(body or b"{}"))
+            self._send_json(200, self.state.config.as_dict())
+        elif path == "/__reset":
+            self.state.reset()
+            self._send_json(200, {})
+        elif path == "/upload/v1beta/files" and "upload_id" not in self.path:
+            upload_id = f"{time.time_ns()}{random.randrange(1000)}"
+            location = f"http://{self.headers.get('Host')}/upload/v1beta/files?upload_id={upload_id}"
+            sent = self._send(200, b"", {"X-Goog-Upload-URL": location})
+            self.state.count(len(body), sent)
+        elif path == "/upload/v1beta/files":
+            name = f"files/mock{len(self.state.files)}"
+            uri = f"http://{self.headers.get('Host')}/v1beta/{name}"
+            expires = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 48 * 3600))
+            resource = {"name": name, "uri": uri, "expirationTime": expires, "state": "ACTIVE",
+                        "mimeType": self.headers.get("Content-Type"), "sizeBytes": str(len(body))}
+            with self.state.lock:
+                self.state.files[uri] = resource
+            sent = self._send_json(200, {"file": resource})
+            self.state.count(len(body), sent)
+        elif path.startswith("/v1beta/models/") and path.endswith(":generateContent"):
+            self._generate(body)
+        elif path.startswith("/v1beta/models/") and path.endswith(":streamGenerateContent"):
+            self._generate(body, stream=True)
+        else:
+            sent = self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            self.state.count(len(body), sent, error=True)
+
+    def _write_chunk(self, data):
+        """Writes one piece of a chunked response body."""
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        return len(data)
+
+    def _generate(self, body, stream=False):
+        config = self.state.config
+        latency = max(0.0, config.latency + random.uniform(-config.jitter, config.jitter))
+        # A streamed answer starts with its text half way through the latency
+        time.sleep(latency / 2 if stream else latency)
+
+        if config.error_rate and random.random() < config.error_rate:
+            status = random.choice((429, 503))
+            sent = self._send_json(status, {"error": {"code": status, "message": "Simulated failure"}},
+                                   {"Retry-After": "1"} if status == 429 else None)
+            self.state.count(len(body), sent, error=True)
+            return
+
+        try:
+            request = json.loads(body)
+            parts = request["contents"][0]["parts"]
+        except (ValueError, KeyError, IndexError) as e:
+            sent = self._send_json(400, {"error": {"code": 400, "message": f"Invalid request: {e}"}})
+            self.state.count(len(body), sent, error=True)
+            return
+        for part in parts:
+            uri = part.get("fileData", {}).get("fileUri")
+            if uri is not None and uri not in self.state.files:
+                sent = self._send_json(403, {"error": {"code": 403, "message": f"Unknown file {uri}"}})
+                self.state.count(len(body), sent, error=True)
+                return
+
+        image, mime_type = self.state.image_b64(config.image_kb, config.image_file)
+        candidates = max(1, int((request.get("generationConfig") or {}).get("candidateCount", 1)))
+        if stream:
+            self._stream_events(len(body), image, latency / 2, candidates, mime_type)
+            return
+        head = json.dumps({"candidates": [{"index": n, "content": {"parts": [
+            {"text": "Here is the recreated image."},
+            {"inlineData": {"mimeType": mime_type, "data": "@@"}}]}, "finishReason": "STOP"}
+            for n in range(candidates)]})
+        pieces = head.encode("utf-8").split(b"@@")
+        length = sum(len(piece) for piece in pieces) + len(image) * candidates
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        for n, piece in enumerate(pieces):
+            if n:
+                self.wfile.write(image)
+            self.wfile.write(piece)
+        self.state.count(len(body), length)
+
+    def _stream_events(self, received, image, delay, candidates=1, mime_type="image/jpeg"):
+        """Answers streamGenerateContent?alt=sse: a text event, then one image event per candidate, chunked."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        text = {"candidates": [{"content": {"role": "model", "parts": [{"text": "Here is the recreated image."}]}}]}
+        sent = self._write_chunk(b"data: " + json.dumps(text).encode("utf-8") + b"\r\n\r\n")
+        self.wfile.flush()
+        time.sleep(delay)
+        for n in range(candidates):
+            head = json.dumps({"candidates": [{"index": n, "content": {"role": "model", "parts": [
+                {"inlineData": {"mimeType": mime_type, "data": "@@"}}]}, "finishReason": "STOP"}]})
+            before, after = head.encode("utf-8").split(b"@@")
+            sent += self._write_chunk(b"data: " + before)
+            for start in range(0, len(image), 256 * 1024):
+                sent += self._write_chunk(image[start:start + 256 * 1024])
+            sent += self._write_chunk(after + b"\r\n\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.state.count(received, sent)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are routine, not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the mock server on a background thread and returns it (see server.server_port)."""
+    server = MockServer((host, port), MockGeminiHandler)
+    server.state = MockState(config or MockConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini generateContent API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/503")
+    parser.add_argument("--image-kb", type=int, default=512, help="Size of the returned image in KB")
+    parser.add_argument("--image-file", default="",
+                        help="Answer with this image instead of random bytes (e.g. a PNG, to test format handling)")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.image_kb, args.image_file)
+    server = start_server(config, args.host, args.port)
+    # The first line tells a parent process which port was picked
+    print(f"Mock Gemini API listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
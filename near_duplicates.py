@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Near-Duplicate Detection)
+# ======================================================
+
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from gemini_response import partial_path
+
+try:
+    import numpy as np
+    from PIL import Image, ImageOps
+    DEDUPE_AVAILABLE = True
+except ImportError:
+    DEDUPE_AVAILABLE = False
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(str(Path.home()), ".cache")),
+    "gemini-recreation", "near_duplicates.sqlite")
+DEFAULT_MAX_DISTANCE = 6  # Differing bits out of 64
+HASH_ALGORITHMS = ("ahash", "dhash", "phash")
+DEFAULT_ALGORITHM = "phash"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    grp TEXT NOT NULL,
+    phash TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+DuplicateMatch = namedtuple("DuplicateMatch", "input_path output_path distance")
+
+def _gray(path, size):
+    """Loads an image as a float32 grayscale array of size (width, height), decoding as little as possible."""
+    with Image.open(path) as img:
+        img.draft("L", (size[0] * 4, size[1] * 4))  # JPEG decodes straight at a reduced scale
+        img = ImageOps.exif_transpose(img).convert("L")
+        return np.asarray(img.resize(size, Image.BILINEAR), dtype=np.float32)
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+def average_hash(path):
+    """64-bit aHash: which pixels of an 8x8 thumbnail are brighter than its mean."""
+    pixels = _gray(path, (8, 8))
+    return _pack(pixels > pixels.mean())
+
+def difference_hash(path):
+    """64-bit dHash: whether each pixel of a 9x8 thumbnail is brighter than its left neighbour."""
+    pixels = _gray(path, (9, 8))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+_DCT_CACHE = {}
+
+def _dct_matrix(n):
+    matrix = _DCT_CACHE.get(n)
+    if matrix is None:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        matrix[0] /= np.sqrt(2.0)
+        matrix = _DCT_CACHE[n] = matrix.astype(np.float32)
+    return matrix
+
+def perceptual_hash(path):
+    """64-bit pHash: signs of the low 8x8 DCT frequencies of a 32x32 thumbnail against their median."""
+    dct = _dct_matrix(32)
+    pixels = _gray(path, (32, 32))
+    low = (dct @ pixels @ dct.T)[:8, :8]
+    return _pack(low > np.median(low.ravel()[1:]))  # The DC term would skew the median
+
+_HASHERS = {"ahash": average_hash, "dhash": difference_hash, "phash": perceptual_hash}
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+class _HashGroup:
+    """The hashes of one prompt/reference combination, in a growable uint64 array."""
+
+    def __init__(self):
+        self.hashes = np.zeros(64, dtype=np.uint64)
+        self.alive = np.zeros(64, dtype=bool)
+        self.rows = []  # (input_path, output_path) per slot
+
+    def add(self, phash, input_path, output_path):
+        slot = len(self.rows)
+        if slot == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros(slot, dtype=np.uint64)])
+            self.alive = np.concatenate([self.alive, np.zeros(slot, dtype=bool)])
+        self.hashes[slot] = phash
+        self.alive[slot] = True
+        self.rows.append((input_path, output_path))
+
+    def within(self, phash, max_distance):
+        """Yields (slot, distance) of live hashes within max_distance, closest first."""
+        count = len(self.rows)
+        if not count:
+            return
+        distances = _popcount(np.bitwise_xor(self.hashes[:count], np.uint64(phash))).astype(np.int16)
+        distances[~self.alive[:count]] = 65
+        slots = np.flatnonzero(distances <= max_distance)
+        for slot in slots[np.argsort(distances[slots], kind="stable")]:
+            yield int(slot), int(distances[slot])
+
+class NearDuplicateIndex:
+    """Perceptual hashes of inputs already recreated, for reusing results of near-identical inputs.
+
+    Hashes are grouped by request context (model, prompt, references and
+    settings, see result_cache.context_key()), since a near-identical input
+    only counts as a duplicate under the same request. Lookups XOR the
+    query against every hash of the group at once and count the differing
+    bits with NumPy, which takes a few milliseconds even for a million
+    hashes. Entries whose output file has since disappeared are dropped.
+
+    Near-duplicates that arrive while a match is still being generated
+    wait for it instead of calling the API as well, so a burst of frames
+    costs one call. Hashes and output paths are kept in SQLite and survive
+    restarts. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, max_distance=DEFAULT_MAX_DISTANCE, algorithm=DEFAULT_ALGORITHM,
+                 link=False):
+        if algorithm not in _HASHERS:
+            raise ValueError(f"Unknown hash algorithm {algorithm!r} (expected one of {', '.join(HASH_ALGORITHMS)})")
+        self.path = path
+        self.max_distance = max_distance
+        self.algorithm = algorithm
+        self.link = link
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._by_output = {}  # output path -> (group, slot) of the hash it currently belongs to
+        self._pending = {}  # group -> [(phash, event)] of near-duplicates being generated
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        for group, phash, input_path, output_path in self._db.execute(
+                "SELECT grp, phash, input_path, output_path FROM hashes ORDER BY rowid"):
+            self._add(group, int(phash, 16), input_path, output_path)
+
+    def _add(self, group, phash, input_path, output_path):
+        """Adds a hash in memory; an older hash for the same output no longer matches. Caller holds the lock."""
+        previous = self._by_output.get(output_path)
+        if previous is not None:
+            self._groups[previous[0]].alive[previous[1]] = False
+        hashes = self._groups.setdefault(group, _HashGroup())
+        self._by_output[output_path] = (group, len(hashes.rows))
+        hashes.add(phash, input_path, output_path)
+
+    def hash_file(self, path):
+        """Returns the image's 64-bit hash, or None if it cannot be decoded."""
+        try:
+            return _HASHERS[self.algorithm](path)
+        except Exception:
+            return None
+
+    def _find(self, group, phash):
+        """Closest finished near-duplicate whose output still exists. Caller holds the lock."""
+        hashes = self._groups.get(group)
+        if hashes is None:
+            return None
+        for slot, distance in hashes.within(phash, self.max_distance):
+            input_path, output_path = hashes.rows[slot]
+            if os.path.isfile(output_path):
+                return DuplicateMatch(input_path, output_path, distance)
+            hashes.alive[slot] = False
+        return None
+
+    def try_claim(self, group, phash):
+        """Non-blocking claim(): returns ``(match, ticket, pending)`` with exactly one of them set.
+
+        ``pending`` is a threading.Event set once a near-duplicate that is
+        still being generated finishes; claim again after it fires.
+        """
+        with self._lock:
+            match = self._find(group, phash)
+            if match is not None:
+                self.duplicates += 1
+                return match, None, None
+            for other, event in self._pending.get(group, ()):
+                if bin(other ^ phash).count("1") <= self.max_distance:
+                    return None, None, event
+            ticket = (group, phash, threading.Event())
+            self._pending.setdefault(group, []).append((phash, ticket[2]))
+            return None, ticket, None
+
+    def claim(self, group, phash):
+        """Returns ``(match, None)`` for a near-duplicate to reuse, or ``(None, ticket)`` to generate one.
+
+        Waits while a near-duplicate is being generated elsewhere. A ticket
+        must be passed to complete() or release().
+        """
+        while True:
+            match, ticket, pending = self.try_claim(group, phash)
+            if pending is None:
+                return match, ticket
+            pending.wait()
+
+    def _unpend(self, ticket):
+        group, phash, event = ticket
+        pending = self._pending.get(group, [])
+        if (phash, event) in pending:
+            pending.remove((phash, event))
+        if not pending:
+            self._pending.pop(group, None)
+        event.set()
+
+    def complete(self, ticket, input_path, output_path):
+        """Records a generated result, so later near-duplicates reuse it."""
+        group, phash, _ = ticket
+        input_path, output_path = os.path.abspath(input_path), os.path.abspath(output_path)
+        with self._lock:
+            self._add(group, phash, input_path, output_path)
+            with self._db:
+                self._db.execute("DELETE FROM hashes WHERE output_path = ?", (output_path,))
+                self._db.execute("INSERT INTO hashes VALUES (?, ?, ?, ?, ?)",
+                                 (group, f"{phash:016x}", input_path, output_path, time.time()))
+            self._unpend(ticket)
+
+    def release(self, ticket):
+        """Gives up a ticket without a result, letting a waiting near-duplicate generate instead."""
+        with self._lock:
+            self._unpend(ticket)
+
+    def reuse(self, match, output_path):
+        """Puts the matched result at output_path, as a hard link if enabled and possible, else a copy."""
+        if os.path.abspath(match.output_path) == os.path.abspath(output_path):
+            return
+        tmp_path = partial_path(output_path)
+        try:
+            linked = False
+            if self.link:
+                os.remove(tmp_path)
+                try:
+                    os.link(match.output_path, tmp_path)
+                    linked = True
+                except OSError:
+                    pass  # Other filesystem or no hard link support
+            if not linked:
+                shutil.copyfile(match.output_path, tmp_path)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {"entries": sum(int(g.alive[:len(g.rows)].sum()) for g in self._groups.values()),
+                    "groups": len(self._groups), "duplicates": self.duplicates}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
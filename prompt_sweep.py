@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Prompt Sweep)
+# ======================================================
+
+import os
+import re
+import sys
+import json
+import time
+import string
+import argparse
+import itertools
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_recreation import BatchJob, Pipeline, add_pipeline_arguments, print_summary, run_batch
+from image_discovery import probe_image
+from interactive_recreation import PROMPT_EXAMPLES
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+    from thumbnails import make_thumbnail
+    CONTACT_SHEET_AVAILABLE = True
+except ImportError:
+    CONTACT_SHEET_AVAILABLE = False
+
+SHEET_NAME = "contact_sheet.jpg"
+MANIFEST_NAME = "sweep.json"
+DEFAULT_CELL_EDGE = 384
+CAPTION_LINES = 2
+_MARGIN = 8
+_LINE_HEIGHT = 14
+
+class Variant:
+    """One prompt of a sweep, with the template values it was built from (if any)."""
+
+    def __init__(self, prompt, values=None):
+        self.prompt = prompt
+        self.values = values or {}
+
+    @property
+    def label(self):
+        """Short description for captions and file names: the template values, else the prompt."""
+        if self.values:
+            return ", ".join(f"{name}={value}" for name, value in self.values.items())
+        return self.prompt
+
+def parse_variable(text):
+    """Parses ``NAME=VALUE1|VALUE2`` into ``(name, [values])``."""
+    name, sep, values = text.partition("=")
+    name = name.strip()
+    if not sep or not name.isidentifier():
+        raise ValueError(f"Expected NAME=VALUE1|VALUE2, got {text!r}")
+    values = [v.strip() for v in values.split("|") if v.strip()]
+    if not values:
+        raise ValueError(f"No values given for {name}")
+    return name, values
+
+def expand_template(template, variables):
+    """Returns a Variant for every combination of the variables' values, in order.
+
+    ``template`` uses str.format fields (``{style}``; literal braces are
+    doubled). ``variables`` is a list of ``(name, values)``; a name given
+    more than once collects the values of every occurrence. A field
+    without values, or values without a field, raise ValueError.
+    """
+    merged = {}
+    for name, values in variables:
+        merged.setdefault(name, []).extend(values)
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    except ValueError as e:
+        raise ValueError(f"Invalid template: {e}")
+    if not all(field.isidentifier() for field in fields):
+        raise ValueError("Template fields must be plain names such as {style}")
+    missing = fields - set(merged)
+    if missing:
+        raise ValueError(f"No values for template field(s): {', '.join(sorted(missing))}")
+    unused = set(merged) - fields
+    if unused:
+        raise ValueError(f"Variable(s) not used in the template: {', '.join(sorted(unused))}")
+    names = [name for name in merged]
+    return [Variant(template.format(**dict(zip(names, combo))), dict(zip(names, combo)))
+            for combo in itertools.product(*(merged[name] for name in names))]
+
+def load_prompts(path):
+    """Reads one prompt per line; blank lines and lines starting with # are skipped."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def _slug(text, limit=40):
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-").lower()
+    return slug[:limit].rstrip("-") or "prompt"
+
+def sweep_jobs(input_path, ref_paths, variants, output_dir):
+    """Builds one BatchJob per variant, all sharing the input so it is encoded only once.
+
+    Outputs are named ``.jpg`` here; the extension follows the format they are saved in.
+    """
+    stem = Path(input_path).stem
+    return [BatchJob(input_path, ref_paths, variant.prompt,
+                     os.path.join(output_dir, f"{stem}_recreated_{index:02d}_{_slug(variant.label)}.jpg"),
+                     shared_input=True)
+            for index, variant in enumerate(variants, 1)]
+
+def _fit_caption(draw, font, text, width):
+    """Word-wraps text to at most CAPTION_LINES lines of width pixels, ending in … if cut."""
+    lines = []
+    words = text.split()
+    while words and len(lines) < CAPTION_LINES:
+        line = words.pop(0)
+        while words and draw.textlength(f"{line} {words[0]}", font=font) <= width:
+            line += " " + words.pop(0)
+        lines.append(line)
+    if words or (lines and draw.textlength(lines[-1], font=font) > width):
+        last = lines[-1]
+        while last and draw.textlength(last + "…", font=font) > width:
+            last = last[:-1]
+        lines[-1] = last + "…"
+    return lines
+
+def build_contact_sheet(cells, output_path, columns=0, cell_edge=DEFAULT_CELL_EDGE):
+    """Lays out ``(image_path or None, caption)`` cells in a captioned grid saved as a JPEG.
+
+    Thumbnails are decoded in parallel at reduced scale. A cell without an
+    image (a failed variant) is left grey. ``columns=0`` picks a roughly
+    square grid.
+    """
+    columns = columns or max(1, round(len(cells) ** 0.5 + 0.49))
+    rows = (len(cells) + columns - 1) // columns
+    cell_height = cell_edge + CAPTION_LINES * _LINE_HEIGHT + _MARGIN
+    sheet = Image.new("RGB", (columns * (cell_edge + _MARGIN) + _MARGIN, rows * (cell_height + _MARGIN) + _MARGIN),
+                      "white")
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default()
+
+    def load(path):
+        if path is None:
+            return None
+        try:
+            return make_thumbnail(path, (cell_edge, cell_edge))
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(8, len(cells)) or 1) as pool:
+        thumbs = list(pool.map(load, [path for path, _ in cells]))
+    for i, ((_, caption), thumb) in enumerate(zip(cells, thumbs)):
+        x = _MARGIN + (i % columns) * (cell_edge + _MARGIN)
+        y = _MARGIN + (i // columns) * (cell_height + _MARGIN)
+        if thumb is None:
+            draw.rectangle([x, y, x + cell_edge - 1, y + cell_edge - 1], fill="#cccccc")
+        else:
+            sheet.paste(thumb, (x + (cell_edge - thumb.width) // 2, y + (cell_edge - thumb.height) // 2))
+        for n, line in enumerate(_fit_caption(draw, font, caption, cell_edge)):
+            draw.text((x, y + cell_edge + 4 + n * _LINE_HEIGHT), line, fill="black", font=font)
+    sheet.save(output_path, "JPEG", quality=90)
+    return output_path
+
+def write_manifest(path, input_path, variants, jobs):
+    """Records which output belongs to which prompt, in sweep order."""
+    entries = [{"index": index, "prompt": variant.prompt, "values": variant.values,
+                "outputs": job.outputs, "error": job.error}
+               for index, (variant, job) in enumerate(zip(variants, jobs), 1)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"input": input_path, "variants": entries}, f, indent=2)
+
+def collect_variants(args):
+    """Turns the prompt options into Variants; raises ValueError when they make no sense together."""
+    if args.template:
+        if args.prompts or args.prompts_file or args.examples:
+            raise ValueError("--template cannot be combined with listed prompts")
+        return expand_template(args.template, [parse_variable(v) for v in args.variables])
+    if args.variables:
+        raise ValueError("--var needs a --template")
+    prompts = list(args.prompts)
+    if args.prompts_file:
+        prompts += load_prompts(args.prompts_file)
+    if args.examples:
+        prompts += PROMPT_EXAMPLES
+    if not prompts:
+        raise ValueError("Give prompts, --prompts-file, --examples or a --template with --var")
+    return [Variant(prompt) for prompt in dict.fromkeys(prompts)]  # Drops repeats, keeps order
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Recreate one image with many prompts side by side, encoding it only once.")
+    parser.add_argument("input",
+                        help="Input image")
+    parser.add_argument("prompts", nargs="*",
+                        help="Prompt variants to try")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for the results (default: <input name>_sweep next to the input)")
+    parser.add_argument("--prompts-file",
+                        help="File with one prompt per line (# starts a comment)")
+    parser.add_argument("--examples", action="store_true",
+                        help="Also try the example prompts offered by the interactive tool")
+    parser.add_argument("-t", "--template",
+                        help="Prompt template with {name} fields, e.g. 'Transform into {style} at {time}'")
+    parser.add_argument("--var", action="append", default=[], dest="variables", metavar="NAME=V1|V2",
+                        help="Values for a template field; every combination is tried (repeatable)")
+    parser.add_argument("--columns", type=int, default=0,
+                        help="Columns of the contact sheet (default: roughly square)")
+    parser.add_argument("--cell-size", type=int, default=DEFAULT_CELL_EDGE,
+                        help=f"Edge of each contact sheet cell in pixels (default: {DEFAULT_CELL_EDGE})")
+    parser.add_argument("--no-sheet", action="store_true",
+                        help="Do not build a contact sheet")
+    add_pipeline_arguments(parser)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.api_key:
+        print("❌ No API key: pass --api-key or set GEMINI_API_KEY")
+        return 2
+    _, problem = probe_image(args.input)
+    if problem is not None:
+        print(f"❌ Cannot use {args.input}: {problem}")
+        return 2
+    try:
+        variants = collect_variants(args)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    output_dir = args.output_dir or os.path.join(os.path.dirname(args.input), Path(args.input).stem + "_sweep")
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        pipeline = Pipeline.from_args(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    jobs = sweep_jobs(args.input, args.refs, variants, output_dir)
+    print(f"🎛️ Sweeping {len(jobs)} prompt(s) over {args.input} with concurrency {args.concurrency}...")
+    start = time.monotonic()
+    try:
+        done = run_batch(jobs, pipeline.client, args.concurrency, pipeline.cache, pipeline.preprocessor,
+                         pipeline.ref_memo, pipeline.ref_uploader, pipeline.recorder, dedupe=pipeline.dedupe,
+                         transcoder=pipeline.transcoder)
+    finally:
+        pipeline.close()
+    wall_time = time.monotonic() - start
+
+    write_manifest(os.path.join(output_dir, MANIFEST_NAME), args.input, variants, jobs)
+    if not args.no_sheet:
+        if not CONTACT_SHEET_AVAILABLE:
+            print("⚠️ Skipping the contact sheet: it needs Pillow (pip install Pillow)")
+        else:
+            cells = [(args.input, "Original")]
+            for index, (variant, job) in enumerate(zip(variants, jobs), 1):
+                if not job.ok:
+                    cells.append((None, f"{index}. {variant.label} (failed)"))
+                for n, path in enumerate(job.outputs, 1):
+                    cells.append((path, f"{index}. {variant.label}" + (f" ({n})" if n > 1 else "")))
+            sheet_path = build_contact_sheet(cells, os.path.join(output_dir, SHEET_NAME), args.columns,
+                                             args.cell_size)
+            print(f"🖼️ Contact sheet: {sheet_path}")
+    print_summary(done, wall_time, pipeline.cache, pipeline.limiter, pipeline.ref_memo, pipeline.ref_uploader,
+                  pipeline.dedupe, pipeline.budget, pipeline.transcoder)
+    return 0 if all(j.ok for j in done) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
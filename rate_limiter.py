@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Adaptive Rate Limiter)
+# ======================================================
+
+import os
+import time
+import threading
+
+DEFAULT_RPM = float(os.getenv("GEMINI_RPM", "0"))  # 0 disables the requests/minute bucket
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "8"))
+# How often a caller waiting with a cancel token checks it
+CANCEL_POLL_INTERVAL = 0.1
+# Statuses that mean "slow down" rather than "this request is broken"
+THROTTLE_STATUSES = (429, 503)
+
+class AdaptiveLimiter:
+    """Schedules outbound API calls under a token bucket and an AIMD concurrency limit.
+
+    ``rpm`` tokens per minute are issued (with a burst of up to ``burst``
+    tokens); a call needs one token and a free in-flight slot. The number of
+    slots floats between ``min_limit`` and ``max_limit``: every successful
+    call whose latency stays within ``latency_tolerance`` times the best
+    smoothed latency seen so far adds ``1 / limit`` (about one slot per
+    round of calls), slow calls shrink it by 10% and throttled calls halve
+    it. A Retry-After from the server pauses all callers, not just the one
+    that was throttled.
+
+    The same instance is meant to be shared by every thread of a process,
+    so batch workers and the GUI's worker thread all count against it.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, max_limit=DEFAULT_MAX_IN_FLIGHT, min_limit=1,
+                 initial_limit=None, burst=None, latency_tolerance=2.0):
+        self.rpm = rpm
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        if initial_limit is None:
+            initial_limit = max(self.min_limit, self.max_limit // 2)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self.burst = burst if burst is not None else max(1.0, rpm / 60.0 * 5)
+        self.latency_tolerance = latency_tolerance
+
+        self._cond = threading.Condition()
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+        self._ewma_latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+
+        # Counters for metrics()
+        self.completed = 0
+        self.throttled = 0
+
+    def _refill(self, now):
+        if self.rpm > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rpm / 60.0)
+        self._last_refill = now
+
+    def _wait_time(self, now):
+        """Seconds until a call could start, or 0 if it can start now. Caller holds the lock."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.limit):
+            return None  # Wait for a release
+        if self.rpm > 0 and self._tokens < 1.0:
+            return (1.0 - self._tokens) * 60.0 / self.rpm
+        return 0
+
+    def acquire(self, cancel=None):
+        """Blocks until a call may start; returns the start time to pass to release().
+
+        With a CancelToken, the wait ends with Cancelled once it is cancelled.
+        """
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if cancel is not None:
+                        cancel.check()
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(now)
+                    if wait == 0:
+                        break
+                    if cancel is not None:
+                        wait = CANCEL_POLL_INTERVAL if wait is None else min(wait, CANCEL_POLL_INTERVAL)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+            if self.rpm > 0:
+                self._tokens -= 1.0
+            self._in_flight += 1
+            return time.monotonic()
+
+    def try_acquire(self):
+        """Non-blocking acquire() for callers on an event loop.
+
+        Returns ``(started, None)`` when a call may start now, otherwise
+        ``(None, wait)`` with the seconds until one might (None while every
+        slot is taken).
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait_time(now)
+            if wait != 0:
+                return None, wait
+            if self.rpm > 0:
+                self._tokens -= 1.0
+            self._in_flight += 1
+            return time.monotonic(), None
+
+    def release(self, started, status=None, retry_after=None):
+        """Records the outcome of a call started with acquire() and frees its slot.
+
+        ``status`` is the HTTP status code, or None when the call failed
+        before a response arrived.
+        """
+        latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                self._decrease(0.5)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            elif status is not None and status < 400:
+                self.completed += 1
+                self._observe_latency(latency)
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        if self._ewma_latency is None:
+            self._ewma_latency = latency
+        else:
+            self._ewma_latency = 0.8 * self._ewma_latency + 0.2 * latency
+        if self._best_latency is None or self._ewma_latency < self._best_latency:
+            self._best_latency = self._ewma_latency
+        if self._ewma_latency > self.latency_tolerance * self._best_latency:
+            self._decrease(0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, factor):
+        """Shrinks the limit at most once per round trip, so a burst of 429s counts once."""
+        now = time.monotonic()
+        if now - self._last_decrease < max(1.0, self._ewma_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def metrics(self):
+        """Returns the current limit, in-flight calls, queue depth and counters."""
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "completed": self.completed,
+                "throttled": self.throttled,
+                "latency_ewma": round(self._ewma_latency or 0.0, 3),
+            }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Reference Image Memo)
+# ======================================================
+
+import os
+import base64
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from image_preprocess import guess_mime_type
+
+DEFAULT_MEMO_BYTES = 64 * 1024 * 1024  # 64 MiB of base64 text
+
+class EncodedReference:
+    """A reference image ready to be inlined: base64 text plus upload accounting."""
+
+    def __init__(self, data, mime_type, original_bytes, upload_bytes):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_bytes = original_bytes
+        self.upload_bytes = upload_bytes
+
+class ReferenceMemo:
+    """In-process memo of base64-encoded reference images, shared across jobs.
+
+    Entries are keyed by (path, size, mtime) and, when a Preprocessor is
+    used, by its options, so an edited file or a different pre-processing
+    setting is never served stale. The total size of the stored base64 text
+    is capped and the least recently used references are evicted first.
+    Concurrent requests for the same reference wait for a single encode.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMO_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> EncodedReference, least recently used first
+        self._pending = {}  # key -> Future for encodes in progress
+        self._total_bytes = 0
+
+    def get(self, path, preprocessor=None):
+        """Returns the EncodedReference for path, encoding it on first use."""
+        st = os.stat(path)
+        variant = preprocessor.options.signature() if preprocessor else ""
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, variant)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            entry = self._encode(path, st.st_size, preprocessor)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._store(key, entry)
+        future.set_result(entry)
+        return entry
+
+    def _encode(self, path, size, preprocessor):
+        if preprocessor is None:
+            with open(path, "rb") as f:
+                data = base64.b64encode(f.read())
+            return EncodedReference(data, guess_mime_type(path), size, size)
+
+        prepared = preprocessor.prepare([path])
+        try:
+            with open(prepared[0].path, "rb") as f:
+                data = base64.b64encode(f.read())
+        finally:
+            preprocessor.release(prepared)
+        return EncodedReference(data, prepared[0].mime_type, size, prepared[0].upload_bytes)
+
+    def _store(self, key, entry):
+        """Adds an entry and evicts old ones over the cap. Caller holds the lock."""
+        if len(entry.data) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._total_bytes += len(entry.data)
+        while self._total_bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._total_bytes -= len(old.data)
+
+    def stats(self):
+        """Returns hit/miss counters and current usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
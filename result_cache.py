@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Result Cache)
+# ======================================================
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(str(Path.home()), ".cache")),
+    "gemini-recreation", "results")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+_CHUNK_SIZE = 1024 * 1024
+
+def _update_with_field(digest, data):
+    """Adds a length-prefixed field so adjacent fields can never run together."""
+    digest.update(len(data).to_bytes(8, "big"))
+    digest.update(data)
+
+def _update_with_file(digest, path):
+    """Adds a file's size and raw bytes to the digest without loading it whole."""
+    digest.update(os.path.getsize(path).to_bytes(8, "big"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+def cache_key(model_url, prompt, input_path, ref_paths=(), extra=""):
+    """Returns the content address of a generation request.
+
+    The key covers the model URL, the prompt text and the raw bytes of the
+    input and every reference image, in order. File names and timestamps
+    are deliberately not part of it. ``extra`` carries any other setting
+    that changes what is sent, such as the pre-processing options.
+    """
+    digest = hashlib.sha256()
+    _update_with_field(digest, model_url.encode("utf-8"))
+    _update_with_field(digest, prompt.encode("utf-8"))
+    if extra:
+        _update_with_field(digest, extra.encode("utf-8"))
+    _update_with_file(digest, input_path)
+    digest.update(len(ref_paths).to_bytes(4, "big"))
+    for ref_path in ref_paths:
+        _update_with_file(digest, ref_path)
+    return digest.hexdigest()
+
+def context_key(model_url, prompt, ref_paths=(), extra=""):
+    """Like cache_key(), but without the input image: what a request adds around it."""
+    digest = hashlib.sha256()
+    _update_with_field(digest, model_url.encode("utf-8"))
+    _update_with_field(digest, prompt.encode("utf-8"))
+    _update_with_field(digest, extra.encode("utf-8"))
+    digest.update(len(ref_paths).to_bytes(4, "big"))
+    for ref_path in ref_paths:
+        _update_with_file(digest, ref_path)
+    return digest.hexdigest()
+
+class ResultCache:
+    """On-disk store of generated images keyed by request content, with LRU eviction.
+
+    Entries are plain files named after their key. File mtimes serve as the
+    LRU clock, so the recency order survives restarts without an index file.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuilds the in-memory LRU order from the files already in the cache directory."""
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".bin"):
+                    st = entry.stat()
+                    found.append((st.st_mtime, entry.name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        # The cap may have been lowered since the last run
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".bin")
+
+    def get(self, key, output_path, count=True):
+        """Copies a cached result to output_path. Returns True on a hit.
+
+        ``count=False`` leaves the hit/miss counters alone, for the extra
+        images stored alongside a result that was already counted.
+        """
+        count = int(count)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += count
+                return False
+            self._entries.move_to_end(key)
+            self.hits += count
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, output_path)
+            os.utime(path)
+        except FileNotFoundError:
+            # Removed behind our back (another process evicted it): treat as a miss
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+                self.hits -= count
+                self.misses += count
+            return False
+        return True
+
+    def locate(self, key):
+        """Returns the path of a cached entry without copying it, or None on a miss.
+
+        The file may still be evicted by another process before it is read;
+        callers should treat FileNotFoundError as a miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return path
+
+    def put(self, key, result_path):
+        """Stores a copy of result_path under key and evicts old entries over the size cap."""
+        size = os.path.getsize(result_path)
+        if size > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(result_path, "rb") as src:
+                shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits its cap. Caller holds the lock."""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Returns a dict of hit/miss counters and current usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Result Gallery)
+# ======================================================
+
+import os
+import re
+import threading
+
+import customtkinter as ctk
+from tkinter import filedialog, messagebox
+from PIL import ImageTk
+
+from interactive_recreation import IMAGE_EXTENSIONS
+from thumbnails import ThumbnailCache
+
+GALLERY_COLUMNS = 3
+GALLERY_ROWS = 4
+GALLERY_THUMB_SIZE = (120, 120)
+# "photo_recreated_20250101_120000" -> "photo"
+_OUTPUT_NAME = re.compile(r"^(?P<stem>.+)_recreated(?:_.*)?$")
+
+def find_results(folder):
+    """Lists (input path or None, output path) pairs for the results in folder, newest first.
+
+    Outputs are matched to inputs in the same folder by the auto-generated
+    ``<input>_recreated_...`` name. A folder without such names is treated
+    as plain outputs.
+    """
+    images = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                images.append((entry.stat().st_mtime, entry.name))
+    images.sort(reverse=True)
+
+    inputs = {}
+    outputs = []
+    for _, name in images:
+        stem = os.path.splitext(name)[0]
+        match = _OUTPUT_NAME.match(stem)
+        if match:
+            outputs.append((match.group("stem"), name))
+        else:
+            inputs.setdefault(stem, name)
+    if not outputs:
+        return [(None, os.path.join(folder, name)) for _, name in images]
+    return [(os.path.join(folder, inputs[stem]) if stem in inputs else None, os.path.join(folder, name))
+            for stem, name in outputs]
+
+class _GalleryCell:
+    """Widgets of one grid cell; rebound to a different item on every page change."""
+
+    def __init__(self, parent, on_open):
+        self.frame = ctk.CTkFrame(parent)
+        self.item = None
+        self.ticket = 0  # Bumped on rebind so late thumbnails for the old item are dropped
+        self.images = {}  # label -> PhotoImage, kept referenced while shown
+
+        pair = ctk.CTkFrame(self.frame, fg_color="transparent")
+        pair.pack(padx=5, pady=(5, 0))
+        self.input_label = ctk.CTkLabel(pair, text="", width=GALLERY_THUMB_SIZE[0], height=GALLERY_THUMB_SIZE[1])
+        self.input_label.pack(side="left", padx=(0, 5))
+        self.output_label = ctk.CTkLabel(pair, text="", width=GALLERY_THUMB_SIZE[0], height=GALLERY_THUMB_SIZE[1])
+        self.output_label.pack(side="left")
+
+        footer = ctk.CTkFrame(self.frame, fg_color="transparent")
+        footer.pack(fill="x", padx=5, pady=5)
+        self.name_label = ctk.CTkLabel(footer, text="", anchor="w", width=170)
+        self.name_label.pack(side="left")
+        ctk.CTkButton(footer, text="Open", width=60, command=lambda: on_open(self)).pack(side="right")
+
+class ResultGallery:
+    """Paged grid of input/output pairs for reviewing results inside the tool.
+
+    Only one page of cells is ever created. Paging rebinds those cells to
+    other items and requests their thumbnails lazily from a ThumbnailCache,
+    so the window costs the same with ten results or ten thousand. The next
+    page is prefetched into the cache while the current one is viewed.
+    """
+
+    def __init__(self, root, post_ui, open_file):
+        self.root = root
+        self.post_ui = post_ui  # Queues a callback for the Tk main loop
+        self.open_file = open_file
+        self.thumbnails = ThumbnailCache(size=GALLERY_THUMB_SIZE)
+        self.session_items = []  # Results generated since the GUI started
+        self.items = self.session_items
+        self.page = 0
+        self.window = None
+        self.cells = []
+
+    def add_result(self, input_path, output_path):
+        """Adds a finished job to the session results (main thread)."""
+        self.session_items.append((input_path, output_path))
+        if self.window is not None and self.items is self.session_items:
+            per_page = len(self.cells)
+            if len(self.session_items) - 1 < (self.page + 1) * per_page:
+                self.render()
+            else:
+                self.update_page_label()
+
+    def show(self):
+        if self.window is None:
+            self.build()
+        else:
+            self.window.deiconify()
+            self.window.lift()
+        self.render()
+
+    def build(self):
+        self.window = ctk.CTkToplevel(self.root)
+        self.window.title("Result Gallery")
+        self.window.geometry("900x720")
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+
+        toolbar = ctk.CTkFrame(self.window, fg_color="transparent")
+        toolbar.pack(fill="x", padx=10, pady=10)
+        ctk.CTkButton(toolbar, text="This Session", width=110, command=self.show_session).pack(side="left")
+        ctk.CTkButton(toolbar, text="Open Folder...", width=110, command=self.open_folder).pack(side="left", padx=(10, 0))
+        self.source_label = ctk.CTkLabel(toolbar, text="This session", anchor="w")
+        self.source_label.pack(side="left", padx=(10, 0))
+
+        ctk.CTkButton(toolbar, text="⏭", width=40, command=lambda: self.go_to(None)).pack(side="right")
+        ctk.CTkButton(toolbar, text="▶", width=40, command=lambda: self.go_to(self.page + 1)).pack(side="right", padx=(5, 5))
+        self.page_label = ctk.CTkLabel(toolbar, text="")
+        self.page_label.pack(side="right", padx=5)
+        ctk.CTkButton(toolbar, text="◀", width=40, command=lambda: self.go_to(self.page - 1)).pack(side="right", padx=(5, 0))
+        ctk.CTkButton(toolbar, text="⏮", width=40, command=lambda: self.go_to(0)).pack(side="right")
+
+        grid = ctk.CTkFrame(self.window, fg_color="transparent")
+        grid.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        for index in range(GALLERY_ROWS * GALLERY_COLUMNS):
+            cell = _GalleryCell(grid, self.open_cell)
+            cell.frame.grid(row=index // GALLERY_COLUMNS, column=index % GALLERY_COLUMNS, padx=5, pady=5, sticky="n")
+            self.cells.append(cell)
+
+        # The wheel and paging keys flip pages instead of scrolling
+        self.window.bind("<MouseWheel>", lambda e: self.go_to(self.page + (1 if e.delta < 0 else -1)))
+        self.window.bind("<Button-4>", lambda e: self.go_to(self.page - 1))
+        self.window.bind("<Button-5>", lambda e: self.go_to(self.page + 1))
+        self.window.bind("<Prior>", lambda e: self.go_to(self.page - 1))
+        self.window.bind("<Next>", lambda e: self.go_to(self.page + 1))
+        self.window.bind("<Home>", lambda e: self.go_to(0))
+        self.window.bind("<End>", lambda e: self.go_to(None))
+
+    def page_count(self):
+        return max(1, -(-len(self.items) // len(self.cells)))
+
+    def go_to(self, page):
+        """Shows page (the last one if None), clamped to the valid range."""
+        last = self.page_count() - 1
+        page = last if page is None else max(0, min(page, last))
+        if page != self.page:
+            self.page = page
+            self.render()
+
+    def update_page_label(self):
+        self.page_label.configure(text=f"Page {self.page + 1} / {self.page_count()} · {len(self.items)} results")
+
+    def render(self):
+        """Binds the cells to the items of the current page and prefetches the next one."""
+        if self.window is None:
+            return
+        per_page = len(self.cells)
+        self.page = min(self.page, self.page_count() - 1)
+        start = self.page * per_page
+        for offset, cell in enumerate(self.cells):
+            index = start + offset
+            self.bind_cell(cell, self.items[index] if index < len(self.items) else None)
+        self.update_page_label()
+
+        for input_path, output_path in self.items[start + per_page:start + 2 * per_page]:
+            for path in (input_path, output_path):
+                if path:
+                    self.thumbnails.request(path, lambda *args: None)
+
+    def bind_cell(self, cell, item):
+        cell.ticket += 1
+        cell.item = item
+        cell.images = {}
+        if item is None:
+            cell.frame.grid_remove()
+            return
+        cell.frame.grid()
+        input_path, output_path = item
+        cell.name_label.configure(text=os.path.basename(output_path)[:28])
+        for label, path in ((cell.input_label, input_path), (cell.output_label, output_path)):
+            if path is None:
+                label.configure(image=None, text="No input")
+                continue
+            label.configure(image=None, text="Loading...")
+            ticket = cell.ticket
+            self.thumbnails.request(
+                path, lambda p, thumb, error, label=label, ticket=ticket:
+                self.post_ui(self.show_thumbnail, cell, ticket, label, thumb, error))
+
+    def show_thumbnail(self, cell, ticket, label, thumb, error):
+        if ticket != cell.ticket:
+            return  # The cell shows another item by now
+        if error is not None:
+            label.configure(image=None, text="Unreadable")
+            return
+        photo = ImageTk.PhotoImage(thumb)
+        cell.images[label] = photo
+        label.configure(image=photo, text="")
+
+    def open_cell(self, cell):
+        if cell.item is not None:
+            threading.Thread(target=self.open_file, args=(cell.item[1],), daemon=True).start()
+
+    def show_session(self):
+        self.items = self.session_items
+        self.page = 0
+        self.source_label.configure(text="This session")
+        self.render()
+
+    def open_folder(self):
+        folder = filedialog.askdirectory(title="Select a Folder of Results", parent=self.window)
+        if not folder:
+            return
+        self.source_label.configure(text=f"Scanning {os.path.basename(folder)}...")
+        threading.Thread(target=self.scan_folder, args=(folder,), daemon=True).start()
+
+    def scan_folder(self, folder):
+        """Lists a folder on a worker thread; large folders would otherwise stall the UI."""
+        try:
+            items, error = find_results(folder), None
+        except OSError as e:
+            items, error = [], e
+        self.post_ui(self.show_folder, folder, items, error)
+
+    def show_folder(self, folder, items, error):
+        if error is not None:
+            self.source_label.configure(text="This session" if self.items is self.session_items else "")
+            messagebox.showerror("Error", f"Could not read folder: {error}", parent=self.window)
+            return
+        self.items = items
+        self.page = 0
+        self.source_label.configure(text=os.path.basename(folder) or folder)
+        self.render()
+
+    def close(self):
+        self.thumbnails.close()
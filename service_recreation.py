@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Local HTTP Service)
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from batch_recreation import BatchJob, Pipeline, add_pipeline_arguments
+from interactive_recreation import request_key
+from image_discovery import HEADER_BYTES, sniff_mime_type
+from image_preprocess import guess_mime_type
+
+DEFAULT_PORT = 8765
+DEFAULT_SYNC_TIMEOUT = 20.0  # Seconds a request waits before it is answered with a job ID
+MAX_WAIT = 300.0
+DEFAULT_MAX_JOBS = 1000  # Finished jobs kept for polling before the oldest are forgotten
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+def _sniff_extension(data):
+    """File extension for uploaded image bytes, from their magic number; ValueError if not an image."""
+    mime_type = sniff_mime_type(data[:HEADER_BYTES])
+    if mime_type is None:
+        raise ValueError("Uploaded data is not a recognised image format")
+    return "." + mime_type.split("/")[1].replace("jpeg", "jpg")
+
+def _string_field(request, name):
+    """The request's name field, or None if absent; ValueError unless it is a string."""
+    value = request.get(name)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"'{name}' must be a string")
+    return value
+
+def _string_list_field(request, name):
+    """The request's name field as a list, empty if absent; ValueError unless it is a list of strings."""
+    value = request.get(name)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{name}' must be a list of strings")
+    return value
+
+class ServiceJob:
+    """A recreation request as seen by HTTP callers; shared by every caller it was coalesced with."""
+
+    def __init__(self, job_id, key, batch_job, owns_output):
+        self.id = job_id
+        self.key = key
+        self.batch = batch_job
+        self.owns_output = owns_output  # Output lives in the service's spool directory
+        self.status = "queued"  # queued, running, done or failed
+        self.callers = 1
+        self.created = time.time()
+        self.finished = threading.Event()
+
+    def as_dict(self):
+        job = self.batch
+        value = {"id": self.id, "status": self.status, "input": job.input_path, "refs": job.ref_paths,
+                 "output": job.output_path, "callers": self.callers}
+        if self.status == "done":
+            # The saved file may carry another extension than the one asked for
+            value.update(output=job.outputs[0], cached=job.cached, duplicate_of=job.duplicate_of,
+                         elapsed=round(job.elapsed, 3),
+                         image_url=f"/v1/jobs/{self.id}/image",
+                         image_urls=[f"/v1/jobs/{self.id}/image?n={n}" for n in range(1, len(job.outputs) + 1)])
+        elif self.status == "failed":
+            value.update(error=job.error, elapsed=round(job.elapsed, 3))
+        return value
+
+class RecreationService:
+    """Runs recreation requests on one shared pipeline (client, connection pool, limiter, caches).
+
+    Requests with the same inputs, references, prompt and output that
+    arrive while an identical one is still queued or running are attached
+    to that job instead of causing a second upstream call.
+    """
+
+    def __init__(self, pipeline, spool_dir, concurrency, default_prompt, default_refs=(),
+                 max_jobs=DEFAULT_MAX_JOBS):
+        self.pipeline = pipeline
+        self.spool_dir = spool_dir
+        self.default_prompt = default_prompt
+        self.default_refs = list(default_refs)
+        self.max_jobs = max_jobs
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # id -> ServiceJob, oldest first
+        self._in_flight = {}  # coalescing key -> ServiceJob
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        os.makedirs(os.path.join(spool_dir, "uploads"), exist_ok=True)
+        os.makedirs(os.path.join(spool_dir, "outputs"), exist_ok=True)
+
+    def _spool(self, encoded):
+        """Writes base64 image data to the spool directory under its content hash; returns the path."""
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except ValueError:
+            raise ValueError("Invalid base64 image data")
+        name = hashlib.sha256(data).hexdigest() + _sniff_extension(data)
+        path = os.path.join(self.spool_dir, "uploads", name)
+        if not os.path.isfile(path):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def _local(self, path):
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise ValueError(f"The image file {path} does not exist")
+        return path
+
+    def submit(self, request):
+        """Queues a request (a dict from the JSON body). Returns (job, coalesced); raises ValueError if invalid."""
+        input_base64 = _string_field(request, "input_base64")
+        input_local = _string_field(request, "input")
+        if input_base64:
+            input_path = self._spool(input_base64)
+        elif input_local:
+            input_path = self._local(input_local)
+        else:
+            raise ValueError("Missing 'input' or 'input_base64'")
+        if "refs" in request or "refs_base64" in request:
+            refs = [self._local(path) for path in _string_list_field(request, "refs")]
+            refs += [self._spool(data) for data in _string_list_field(request, "refs_base64")]
+        else:
+            refs = list(self.default_refs)
+        prompt = (_string_field(request, "prompt") or "").strip() or self.default_prompt
+        output = _string_field(request, "output")
+
+        key = (request_key(self.pipeline.client, prompt, input_path, refs, self.pipeline.preprocessor),
+               os.path.abspath(output) if output else None)
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.callers += 1
+                self.coalesced += 1
+                return job, True
+            job_id = uuid.uuid4().hex
+            output_path = output or os.path.join(self.spool_dir, "outputs", job_id + ".jpg")
+            job = ServiceJob(job_id, key, BatchJob(input_path, refs, prompt, output_path), owns_output=not output)
+            self._jobs[job_id] = job
+            self._in_flight[key] = job
+            self._forget_old_jobs()
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def _run(self, job):
+        job.status = "running"
+        self.pipeline.run_job(job.batch)
+        with self._lock:
+            job.status = "done" if job.batch.ok else "failed"
+            self._in_flight.pop(job.key, None)
+        job.finished.set()
+
+    def _forget_old_jobs(self):
+        """Drops the oldest finished jobs over max_jobs with their spooled files. Caller holds the lock."""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        uploads_dir = os.path.join(self.spool_dir, "uploads")
+        dropped = set()
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            job = self._jobs[job_id]
+            if job.finished.is_set():
+                del self._jobs[job_id]
+                excess -= 1
+                if job.owns_output:
+                    dropped.update(job.batch.outputs or [job.batch.output_path])
+                dropped.update(p for p in [job.batch.input_path] + job.batch.ref_paths
+                               if os.path.dirname(p) == uploads_dir)
+        # Uploads are shared by content, so keep those a remaining job still uses
+        for job in self._jobs.values():
+            dropped.difference_update([job.batch.input_path] + job.batch.ref_paths)
+        for path in dropped:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            value = {"jobs": counts, "coalesced": self.coalesced}
+        if self.pipeline.limiter is not None:
+            value["limiter"] = self.pipeline.limiter.metrics()
+        if self.pipeline.cache is not None:
+            value["cache"] = self.pipeline.cache.stats()
+        if self.pipeline.dedupe is not None:
+            value["dedupe"] = self.pipeline.dedupe.stats()
+        value["memory"] = self.pipeline.budget.stats()
+        return value
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON API: POST /v1/recreate, GET /v1/jobs/<id>[/image], GET /v1/stats and GET /healthz."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send(self, status, body=b"", headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, value, headers=None):
+        self._send(status, json.dumps(value).encode("utf-8"), headers)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": {"code": status, "message": message}})
+
+    def _wait_seconds(self, value, default):
+        try:
+            return max(0.0, min(MAX_WAIT, float(value if value is not None else default)))
+        except (TypeError, ValueError):
+            return default
+
+    def _send_job(self, job, wait, coalesced=None):
+        """Waits up to wait seconds for the job, then answers 200 if it finished or 202 with its ID."""
+        job.finished.wait(wait)
+        value = job.as_dict()
+        if coalesced is not None:
+            value["coalesced"] = coalesced
+        if job.finished.is_set():
+            self._send_json(200, value)
+        else:
+            self._send_json(202, value, {"Location": f"/v1/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if url.path == "/healthz":
+            self._send_json(200, {"ok": True})
+        elif url.path == "/v1/stats":
+            self._send_json(200, self.service.stats())
+        elif len(parts) in (3, 4) and parts[:2] == ["v1", "jobs"]:
+            job = self.service.get(parts[2])
+            if job is None:
+                self._send_error(404, "Unknown job")
+            elif len(parts) == 3:
+                wait = parse_qs(url.query).get("wait", [None])[0]
+                self._send_job(job, self._wait_seconds(wait, 0.0))
+            elif parts[3] != "image":
+                self._send_error(404, "Not found")
+            elif job.status != "done":
+                self._send_error(409, f"Job is {job.status}")
+            else:
+                outputs = job.batch.outputs or [job.batch.output_path]
+                n = parse_qs(url.query).get("n", ["1"])[0]
+                if not n.isdigit() or not 1 <= int(n) <= len(outputs):
+                    self._send_error(404, f"The job has {len(outputs)} image(s)")
+                    return
+                try:
+                    with open(outputs[int(n) - 1], "rb") as f:
+                        data = f.read()
+                except OSError:
+                    self._send_error(410, "The result file is no longer available")
+                    return
+                self._send(200, data, content_type=guess_mime_type(outputs[int(n) - 1]))
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/v1/recreate":
+            self._send_error(404, "Not found")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_error(413 if length > 0 else 411, "Missing or oversized request body")
+            return
+        try:
+            # The raw body, its parsed strings and the decoded images are all alive until they are spooled
+            with self.service.pipeline.budget.reserve("request", 3 * length):
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError("The request body must be a JSON object")
+                job, coalesced = self.service.submit(request)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except (TypeError, KeyError) as e:
+            self._send_error(400, f"Invalid request: {e}")
+            return
+        self._send_job(job, self._wait_seconds(request.get("wait"), self.server.sync_timeout), coalesced)
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Callers giving up on a long wait are routine, not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve image recreation over a local HTTP/JSON API.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--spool-dir", default=os.path.join(tempfile.gettempdir(), "gemini-recreation-service"),
+                        help="Directory for uploaded images and outputs of requests without an output path")
+    parser.add_argument("--sync-timeout", type=float, default=DEFAULT_SYNC_TIMEOUT,
+                        help="Seconds a request waits for its result before getting a job ID to poll "
+                             f"(default: {DEFAULT_SYNC_TIMEOUT:g}; per request: \"wait\")")
+    parser.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS,
+                        help=f"Finished jobs kept for polling (default: {DEFAULT_MAX_JOBS})")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Log every HTTP request")
+    add_pipeline_arguments(parser)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.api_key:
+        print("❌ No API key: pass --api-key or set GEMINI_API_KEY")
+        return 2
+    try:
+        pipeline = Pipeline.from_args(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    service = RecreationService(pipeline, args.spool_dir, args.concurrency, args.prompt, args.refs, args.max_jobs)
+    try:
+        server = ServiceServer((args.host, args.port), ServiceHandler)
+    except OSError as e:
+        print(f"❌ Could not listen on {args.host}:{args.port}: {e}")
+        pipeline.close()
+        return 2
+    server.service = service
+    server.sync_timeout = args.sync_timeout
+    server.verbose = args.verbose
+    print(f"🌐 Recreation service listening on http://{args.host}:{server.server_port} "
+          f"(concurrency {args.concurrency})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping")
+    finally:
+        server.server_close()
+        service.close()
+        pipeline.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
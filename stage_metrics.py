@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Per-Stage Metrics)
+# ======================================================
+
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+from gemini_response import partial_path
+
+# Stages in pipeline order. Read/encode happen while the request body is
+# uploaded and decode/write while the response downloads; "upload" and
+# "download" only count the time spent on the network itself.
+STAGES = ("cache", "dedupe", "preprocess", "read", "encode", "serialize", "queue", "upload",
+          "server_wait", "download", "decode", "write", "transcode", "preview")
+# Coarse phases a job moves through, used for progress reporting
+PHASES = ("preprocess", "encode", "upload", "server_wait", "download", "preview")
+JOB_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+DEFAULT_EXPORT_INTERVAL = 5.0
+# Where the interactive front ends append their JSON lines, if anywhere
+DEFAULT_JSONL_PATH = os.getenv("GEMINI_METRICS_JSONL")
+
+class StageTimer:
+    """Accumulates wall time and bytes per stage for one generation.
+
+    Stages may be entered many times (once per chunk for the streamed
+    ones) and their totals add up. ``on_phase(name)`` is called whenever
+    the job moves on to a new phase, from the thread doing the work.
+    """
+
+    def __init__(self, job=None, on_phase=None):
+        self.job = job
+        self.on_phase = on_phase
+        self.started = time.time()
+        self.stages = {}
+        self.phase = None
+        self.phase_started = time.monotonic()
+        self.upload_finished = None  # monotonic time the request body was fully sent
+
+    def add(self, name, seconds, nbytes=0):
+        totals = self.stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += nbytes
+
+    @contextmanager
+    def stage(self, name, nbytes=0):
+        """Times the enclosed block as stage ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, nbytes)
+
+    def enter(self, phase):
+        """Marks the start of a phase (no-op if the job is already in it)."""
+        if phase == self.phase:
+            return
+        self.phase = phase
+        self.phase_started = time.monotonic()
+        if self.on_phase is not None:
+            self.on_phase(phase)
+
+    def seconds(self, name):
+        return self.stages.get(name, (0.0, 0))[0]
+
+    def as_record(self, **fields):
+        """Returns a JSON-serializable record of the stage totals plus extra fields."""
+        record = {"job": self.job, "started": round(self.started, 3)}
+        record.update(fields)
+        record["stages"] = {
+            name: {"seconds": round(self.stages[name][0], 6), "bytes": self.stages[name][1]}
+            for name in STAGES + tuple(sorted(set(self.stages) - set(STAGES)))
+            if name in self.stages
+        }
+        return record
+
+    def format_summary(self):
+        """One-line human-readable breakdown, slowest stages first."""
+        parts = sorted(self.stages.items(), key=lambda item: -item[1][0])
+        return ", ".join(f"{name} {seconds:.2f}s" for name, (seconds, _) in parts if seconds >= 0.005)
+
+class ProgressEstimator:
+    """Turns the current phase of a StageTimer into a 0..1 progress value.
+
+    Each phase is weighted by a running average of how long it took in
+    earlier generations, so the bar moves in proportion to where time is
+    actually spent rather than in fixed steps.
+    """
+
+    def __init__(self, defaults=None):
+        self.expected = {"preprocess": 0.5, "encode": 0.2, "upload": 1.0,
+                         "server_wait": 10.0, "download": 1.0, "preview": 0.2}
+        self.expected.update(defaults or {})
+
+    def learn(self, timer):
+        """Folds a finished generation's phase times into the averages."""
+        observed = {
+            "preprocess": timer.seconds("preprocess"),
+            "encode": timer.seconds("encode") + timer.seconds("serialize"),
+            "upload": timer.seconds("upload") + timer.seconds("read") + timer.seconds("queue"),
+            "server_wait": timer.seconds("server_wait"),
+            "download": timer.seconds("download") + timer.seconds("decode") + timer.seconds("write"),
+            "preview": timer.seconds("preview"),
+        }
+        for phase, seconds in observed.items():
+            if seconds > 0:
+                self.expected[phase] = 0.7 * self.expected[phase] + 0.3 * seconds
+
+    def progress(self, timer, phases=PHASES):
+        """Estimated fraction done, never reaching 1.0 before the last phase ends."""
+        if timer.phase not in phases:
+            return 0.0
+        total = sum(self.expected[p] for p in phases) or 1.0
+        index = phases.index(timer.phase)
+        done = sum(self.expected[p] for p in phases[:index])
+        current = self.expected[timer.phase]
+        elapsed = time.monotonic() - timer.phase_started
+        # Approaches the end of the phase without reaching it when the phase runs long
+        fraction = 1.0 - math.exp(-elapsed / current) if current > 0 else 1.0
+        return min(0.99, (done + current * fraction) / total)
+
+class MetricsRecorder:
+    """Writes per-job stage records as JSON lines and/or a Prometheus textfile.
+
+    The textfile is in the text exposition format read by node_exporter's
+    textfile collector; it is rewritten atomically at most every
+    ``export_interval`` seconds and once more on close().
+    """
+
+    def __init__(self, jsonl_path=None, textfile_path=None, export_interval=DEFAULT_EXPORT_INTERVAL):
+        self.jsonl_path = jsonl_path
+        self.textfile_path = textfile_path
+        self.export_interval = export_interval
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self._stage_seconds = {}
+        self._stage_bytes = {}
+        self._jobs = {}
+        self._buckets = [0] * (len(JOB_SECONDS_BUCKETS) + 1)
+        self._job_seconds_sum = 0.0
+        self._last_export = 0.0
+
+    def record(self, timer, ok=True, **fields):
+        """Records a finished job; ``fields`` (elapsed, cached, error, ...) go into its JSON line."""
+        record = timer.as_record(ok=ok, **fields)
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record) + "\n")
+                self._jsonl.flush()
+            outcome = "cached" if fields.get("cached") else ("ok" if ok else "failed")
+            self._jobs[outcome] = self._jobs.get(outcome, 0) + 1
+            for name, (seconds, nbytes) in timer.stages.items():
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + seconds
+                self._stage_bytes[name] = self._stage_bytes.get(name, 0) + nbytes
+            elapsed = fields.get("elapsed")
+            if elapsed is not None:
+                self._job_seconds_sum += elapsed
+                for i, bound in enumerate(JOB_SECONDS_BUCKETS):
+                    if elapsed <= bound:
+                        self._buckets[i] += 1
+                        break
+                else:
+                    self._buckets[-1] += 1
+            if self.textfile_path and time.monotonic() - self._last_export >= self.export_interval:
+                self._export()
+
+    def _export(self):
+        """Rewrites the Prometheus textfile. Caller holds the lock."""
+        self._last_export = time.monotonic()
+        lines = [
+            "# HELP gemini_recreation_jobs_total Finished recreation jobs by outcome.",
+            "# TYPE gemini_recreation_jobs_total counter",
+        ]
+        for outcome, count in sorted(self._jobs.items()):
+            lines.append(f'gemini_recreation_jobs_total{{outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP gemini_recreation_stage_seconds_total Wall time spent per pipeline stage.",
+            "# TYPE gemini_recreation_stage_seconds_total counter",
+        ]
+        for name, seconds in sorted(self._stage_seconds.items()):
+            lines.append(f'gemini_recreation_stage_seconds_total{{stage="{name}"}} {seconds:.6f}')
+        lines += [
+            "# HELP gemini_recreation_stage_bytes_total Bytes handled per pipeline stage.",
+            "# TYPE gemini_recreation_stage_bytes_total counter",
+        ]
+        for name, nbytes in sorted(self._stage_bytes.items()):
+            lines.append(f'gemini_recreation_stage_bytes_total{{stage="{name}"}} {nbytes}')
+        lines += [
+            "# HELP gemini_recreation_job_seconds End-to-end job duration.",
+            "# TYPE gemini_recreation_job_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(JOB_SECONDS_BUCKETS, self._buckets):
+            cumulative += count
+            lines.append(f'gemini_recreation_job_seconds_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self._buckets[-1]
+        lines.append(f'gemini_recreation_job_seconds_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"gemini_recreation_job_seconds_sum {self._job_seconds_sum:.6f}")
+        lines.append(f"gemini_recreation_job_seconds_count {cumulative}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.textfile_path)), exist_ok=True)
+        # The hidden temporary name keeps the textfile collector from reading a half-written file
+        tmp_path = partial_path(self.textfile_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.textfile_path)
+
+    def close(self):
+        with self._lock:
+            if self.textfile_path:
+                self._export()
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Preview Thumbnails)
+# ======================================================
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from result_cache import ResultCache
+
+DEFAULT_THUMBNAIL_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(str(Path.home()), ".cache")),
+    "gemini-recreation", "thumbnails")
+DEFAULT_THUMBNAIL_BYTES = 128 * 1024 * 1024  # 128 MiB on disk
+DEFAULT_MEMORY_ITEMS = 256
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_QUALITY = 85
+
+def thumbnail_key(path, size=THUMBNAIL_SIZE):
+    """Cache key of a thumbnail: the file's path, size and mtime plus the thumbnail size."""
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{size[0]}x{size[1]}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    """Decodes a thumbnail of path, using reduced-size JPEG decoding where possible."""
+    with Image.open(path) as img:
+        # For JPEGs this makes the decoder scale by 1/2..1/8 instead of decoding every pixel
+        img.draft("RGB", size)
+        thumb = ImageOps.exif_transpose(img)
+        thumb.thumbnail(size)
+        if thumb.mode not in ("RGB", "L"):
+            thumb = thumb.convert("RGB")
+        thumb.load()
+    return thumb
+
+class ThumbnailCache:
+    """Preview thumbnails with an in-memory LRU backed by an on-disk cache.
+
+    Thumbnails are keyed by path, size and mtime, so an edited file gets a
+    new one. ``get()`` decodes synchronously; ``request()`` does the work on
+    a small thread pool and hands the PIL image to a callback, which is how
+    the GUI keeps decoding off the Tk main thread. Concurrent requests for
+    the same file share one decode.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_THUMBNAIL_DIR, max_bytes=DEFAULT_THUMBNAIL_BYTES,
+                 memory_items=DEFAULT_MEMORY_ITEMS, size=THUMBNAIL_SIZE, workers=2):
+        self.size = size
+        self.memory_items = memory_items
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> PIL image, least recently used first
+        self._pending = {}  # key -> callbacks waiting for a decode in progress
+        try:
+            self._disk = ResultCache(cache_dir, max_bytes)
+        except OSError:
+            self._disk = None  # No writable cache directory; keep thumbnails in memory only
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def _remember(self, key, thumb):
+        with self._lock:
+            self._memory[key] = thumb
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def cached(self, path):
+        """Returns the thumbnail if it is already in memory, without touching the disk."""
+        try:
+            key = thumbnail_key(path, self.size)
+        except OSError:
+            return None
+        with self._lock:
+            thumb = self._memory.get(key)
+            if thumb is not None:
+                self._memory.move_to_end(key)
+            return thumb
+
+    def get(self, path):
+        """Returns the thumbnail of path from memory, disk or a fresh decode."""
+        key = thumbnail_key(path, self.size)
+        with self._lock:
+            thumb = self._memory.get(key)
+            if thumb is not None:
+                self._memory.move_to_end(key)
+                return thumb
+
+        thumb = self._load_from_disk(key)
+        if thumb is None:
+            thumb = make_thumbnail(path, self.size)
+            self._store_on_disk(key, thumb)
+        self._remember(key, thumb)
+        return thumb
+
+    def _load_from_disk(self, key):
+        if self._disk is None:
+            return None
+        cached_path = self._disk.locate(key)
+        if cached_path is None:
+            return None
+        try:
+            with Image.open(cached_path) as img:
+                img.load()
+                return img.copy()
+        except (OSError, ValueError):
+            return None  # Evicted meanwhile or unreadable; decode the source again
+
+    def _store_on_disk(self, key, thumb):
+        if self._disk is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        try:
+            thumb.save(tmp_path, "JPEG", quality=THUMBNAIL_QUALITY)
+            self._disk.put(key, tmp_path)
+        except OSError:
+            pass  # The thumbnail is still usable from memory
+        finally:
+            os.remove(tmp_path)
+
+    def request(self, path, callback):
+        """Calls ``callback(path, thumbnail, error)`` once the thumbnail is ready.
+
+        Memory hits call back immediately on the calling thread; everything
+        else calls back from a worker thread.
+        """
+        thumb = self.cached(path)
+        if thumb is not None:
+            callback(path, thumb, None)
+            return
+        try:
+            key = thumbnail_key(path, self.size)
+        except OSError as e:
+            callback(path, None, e)
+            return
+        with self._lock:
+            waiting = self._pending.get(key)
+            if waiting is not None:
+                waiting.append(callback)
+                return
+            self._pending[key] = [callback]
+        self._executor.submit(self._decode, key, path)
+
+    def _decode(self, key, path):
+        thumb, error = None, None
+        try:
+            thumb = self.get(path)
+        except Exception as e:
+            error = e
+        with self._lock:
+            callbacks = self._pending.pop(key, [])
+        for callback in callbacks:
+            callback(path, thumb, error)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
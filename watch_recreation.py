@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+# ======================================================
+# Gemini Image Recreation Tool (Watch-Folder Mode)
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import queue
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_recreation import BatchJob, Pipeline, _default_output, add_discovery_arguments, add_pipeline_arguments
+from image_discovery import PathFilter, iter_image_entries, probe_image
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 2.0
+STATE_NAME = ".recreation_watch_state.json"
+STATE_SAVE_INTERVAL = 5.0
+_TICK = 0.25  # Seconds between debounce checks
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by the name
+
+def _is_candidate(rel_path, path_filter):
+    """Image files accepted by the filter, minus our own outputs."""
+    return "_recreated_" not in os.path.basename(rel_path) and path_filter.accepts_file(rel_path)
+
+def scan(dirs, recursive=False, path_filter=None):
+    """Returns {path: (size, mtime_ns)} for every candidate file in dirs."""
+    path_filter = path_filter or PathFilter()
+    found = {}
+    for folder in dirs:
+        if not os.path.isdir(folder):
+            print(f"⚠️ Could not list {folder}")
+            continue
+        for entry, rel_path in iter_image_entries([folder], recursive, path_filter):
+            if "_recreated_" in entry.name:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            found[entry.path] = (st.st_size, st.st_mtime_ns)
+    return found
+
+class PollingWatcher:
+    """Finds new and changed files by listing the directories every ``interval`` seconds."""
+
+    def __init__(self, dirs, interval=DEFAULT_POLL_INTERVAL, recursive=False, path_filter=None):
+        self.dirs = list(dirs)
+        self.interval = interval
+        self.recursive = recursive
+        self.path_filter = path_filter or PathFilter()
+        self._seen = scan(self.dirs, recursive, self.path_filter)
+        self._next_scan = time.monotonic() + interval
+
+    def initial(self):
+        return dict(self._seen)
+
+    def poll(self, timeout):
+        """Waits up to timeout seconds and returns the paths that changed meanwhile."""
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, delay))
+        self._next_scan = time.monotonic() + self.interval
+        current = scan(self.dirs, self.recursive, self.path_filter)
+        changed = {path for path, sig in current.items() if self._seen.get(path) != sig}
+        self._seen = current
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Linux inotify watcher (through ctypes, no extra dependency).
+
+    With ``recursive``, every accepted subdirectory gets its own watch,
+    including directories created or moved in later. Raises OSError where
+    inotify is not available or the watch limit is reached, so the caller
+    can fall back to PollingWatcher.
+    """
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, dirs, recursive=False, path_filter=None):
+        self.dirs = list(dirs)
+        self.recursive = recursive
+        self.path_filter = path_filter or PathFilter()
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("This C library has no inotify support")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}  # watch descriptor -> (directory, path relative to its watched root)
+        try:
+            for folder in self.dirs:
+                self._add_tree(folder, "")
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, folder, rel_folder):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), ctypes.c_uint32(self.MASK))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"{os.strerror(err)}: {folder}")
+        self._watches[wd] = (folder, rel_folder)
+
+    def _add_tree(self, folder, rel_folder):
+        """Watches folder and, when recursive, every accepted directory below it."""
+        pending = [(folder, rel_folder)]
+        while pending:
+            folder, rel_folder = pending.pop()
+            self._add_watch(folder, rel_folder)
+            if not self.recursive:
+                continue
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        rel_path = f"{rel_folder}/{entry.name}" if rel_folder else entry.name
+                        if entry.is_dir(follow_symlinks=False) and self.path_filter.accepts_dir(rel_path):
+                            pending.append((entry.path, rel_path))
+            except OSError:
+                continue
+
+    def initial(self):
+        return scan(self.dirs, self.recursive, self.path_filter)
+
+    def poll(self, timeout):
+        """Waits up to timeout seconds for events and returns the paths they name."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            start = offset + _INOTIFY_EVENT.size
+            name = data[start:start + length].rstrip(b"\0")
+            offset = start + length
+            if mask & IN_Q_OVERFLOW:
+                # The kernel queue overflowed and events were lost: fall back to a full listing
+                changed.update(scan(self.dirs, self.recursive, self.path_filter))
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)  # Directory deleted or moved away
+                continue
+            watched = self._watches.get(wd)
+            if watched is None or not name:
+                continue
+            folder, rel_folder = watched
+            name = os.fsdecode(name)
+            path = os.path.join(folder, name)
+            rel_path = f"{rel_folder}/{name}" if rel_folder else name
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and self.path_filter.accepts_dir(rel_path):
+                    try:
+                        self._add_tree(path, rel_path)
+                    except OSError as e:
+                        print(f"⚠️ Could not watch {path}: {e}")
+                    # Files may have landed in it before the watch was in place
+                    for entry, entry_rel in iter_image_entries([path], True, self.path_filter, rel_path):
+                        if _is_candidate(entry_rel, self.path_filter):
+                            changed.add(entry.path)
+            elif _is_candidate(rel_path, self.path_filter):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+class Debouncer:
+    """Holds changed files back until their size and mtime stay the same for ``settle`` seconds.
+
+    Files still being copied or written keep changing and are not handed
+    out until the writer is done with them.
+    """
+
+    def __init__(self, settle=DEFAULT_SETTLE_SECONDS):
+        self.settle = settle
+        self._pending = {}  # path -> (last seen (size, mtime_ns), monotonic time it was first seen)
+
+    def touch(self, path):
+        self._pending[path] = (None, time.monotonic())
+
+    def ready(self):
+        """Returns [(path, (size, mtime_ns))] for the files that have settled."""
+        now = time.monotonic()
+        settled = []
+        for path, (sig, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]  # Deleted or renamed away before it settled
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != sig:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle and st.st_size > 0:
+                del self._pending[path]
+                settled.append((path, current))
+        return settled
+
+class WatchState:
+    """Which version (size, mtime) of each file has been handled, kept in a small JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._dirty = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._files = json.load(f).get("files", {})
+        except FileNotFoundError:
+            self._files = {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable watch state {path}: {e}")
+            self._files = {}
+
+    def handled(self, path, sig):
+        return self._files.get(os.path.abspath(path)) == list(sig)
+
+    def mark(self, path, sig):
+        self._files[os.path.abspath(path)] = list(sig)
+        self._dirty = True
+
+    def prune(self, existing):
+        """Forgets files that no longer exist, so the state stays small."""
+        keep = {os.path.abspath(p) for p in existing}
+        for path in [p for p in self._files if p not in keep]:
+            del self._files[path]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        target_dir = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"files": self._files}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+def watch(watcher, pipeline, state, prompt, ref_paths, output_dir, concurrency, settle, stop):
+    """Feeds settled new or changed files to the pipeline until ``stop`` (an Event) is set."""
+    debouncer = Debouncer(settle)
+    initial = watcher.initial()
+    state.prune(initial)
+    backlog = [path for path, sig in initial.items() if not state.handled(path, sig)]
+    for path in backlog:
+        debouncer.touch(path)
+    if backlog:
+        print(f"📥 {len(backlog)} unprocessed file(s) already waiting")
+
+    finished = queue.Queue()
+    in_flight = set()
+    counts = {"ok": 0, "failed": 0}
+    last_save = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    aborted = False
+    try:
+        while not stop.is_set() or in_flight:
+            try:
+                if not stop.is_set():
+                    for path in watcher.poll(_TICK):
+                        debouncer.touch(path)
+                    for path, sig in debouncer.ready():
+                        if state.handled(path, sig):
+                            continue  # Touched but not changed since it was processed
+                        if path in in_flight:
+                            debouncer.touch(path)  # Changed again mid-job: look at it once the job is done
+                            continue
+                        _, problem = probe_image(path, sig[0])
+                        if problem is not None:
+                            # Not retried until the file changes again, e.g. when a copy completes
+                            print(f"⚠️ Skipping {path}: {problem}")
+                            state.mark(path, sig)
+                            continue
+                        job = BatchJob(path, ref_paths, prompt, _default_output(path, ref_paths, prompt, output_dir))
+                        in_flight.add(path)
+                        future = executor.submit(pipeline.run_job, job)
+                        future.add_done_callback(lambda f, sig=sig: finished.put((f.result(), sig)))
+                try:
+                    job, sig = finished.get(timeout=_TICK if stop.is_set() else 0)
+                except queue.Empty:
+                    job = None
+                while job is not None:
+                    in_flight.discard(job.input_path)
+                    if job.ok:
+                        counts["ok"] += 1
+                        state.mark(job.input_path, sig)
+                        if job.duplicate_of:
+                            note = f" (near-duplicate of {job.duplicate_of})"
+                        else:
+                            note = " (cached)" if job.cached else f" ({job.elapsed:.2f}s)"
+                        print(f"✅ {job.input_path} -> {job.outputs[0]}{note}")
+                    else:
+                        counts["failed"] += 1
+                        print(f"❌ {job.input_path}: {job.error}")
+                    try:
+                        job, sig = finished.get_nowait()
+                    except queue.Empty:
+                        job = None
+                if time.monotonic() - last_save >= STATE_SAVE_INTERVAL:
+                    state.save()
+                    last_save = time.monotonic()
+            except KeyboardInterrupt:
+                # First Ctrl+C: finish the jobs in flight; a second one abandons them
+                if stop.is_set():
+                    aborted = True
+                    raise
+                print("\n🛑 Stopping after the jobs in flight (Ctrl+C again to abort)...")
+                stop.set()
+    finally:
+        executor.shutdown(wait=not aborted, cancel_futures=True)
+        state.save()
+    return counts
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Watch directories and recreate every new or changed image with Gemini.")
+    parser.add_argument("dirs", nargs="+",
+                        help="Directories to watch")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for outputs (default: next to each input)")
+    add_discovery_arguments(parser)
+    add_pipeline_arguments(parser)
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is processed "
+                             f"(default: {DEFAULT_SETTLE_SECONDS:g})")
+    parser.add_argument("--polling", action="store_true",
+                        help="Poll the directories instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"Seconds between directory listings when polling (default: {DEFAULT_POLL_INTERVAL:g})")
+    parser.add_argument("--state-file",
+                        help=f"Record of handled files (default: {STATE_NAME} in the output or first watched directory)")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if not args.api_key:
+        print("❌ No API key: pass --api-key or set GEMINI_API_KEY")
+        return 2
+    for folder in args.dirs:
+        if not os.path.isdir(folder):
+            print(f"❌ Not a directory: {folder}")
+            return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    path_filter = PathFilter(args.include, args.exclude)
+    watcher = None
+    if not args.polling:
+        try:
+            watcher = InotifyWatcher(args.dirs, args.recursive, path_filter)
+        except OSError as e:
+            print(f"⚠️ inotify unavailable ({e}), polling every {args.poll_interval:g}s instead")
+    if watcher is None:
+        watcher = PollingWatcher(args.dirs, args.poll_interval, args.recursive, path_filter)
+
+    try:
+        pipeline = Pipeline.from_args(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        watcher.close()
+        return 2
+    state = WatchState(args.state_file or os.path.join(args.output_dir or args.dirs[0], STATE_NAME))
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    mode = "inotify" if isinstance(watcher, InotifyWatcher) else "polling"
+    print(f"👀 Watching {', '.join(args.dirs)} ({mode}, {args.settle:g}s settle). Press Ctrl+C to stop.")
+    try:
+        counts = watch(watcher, pipeline, state, args.prompt, args.refs, args.output_dir,
+                       args.concurrency, args.settle, stop)
+    except KeyboardInterrupt:
+        print("\n👋 Aborted")
+        return 130
+    finally:
+        watcher.close()
+        pipeline.close()
+    print(f"👋 Stopped: {counts['ok']} recreated, {counts['failed']} failed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())